@@ -0,0 +1,454 @@
+"""
+Load generator for the two-step voice payment flow
+
+Replays prototype recordings against a running server: each session posts a
+payment command to /process_voice, waits a think time, then posts the spoken PIN
+with the session_id it was given. Sessions arrive open-loop (Poisson by default)
+at each target rate in turn, so queueing shows up as latency instead of being
+hidden by a slower client.
+
+    # Server, with the in-process fakes so only our own code is measured
+    python benchmarks/load_test.py --write-transcripts /tmp/vpay_transcripts.json
+    VPAY_OFFLINE=1 OFFLINE_TRANSCRIPTS_FILE=/tmp/vpay_transcripts.json \\
+        uvicorn main:app --workers 1          # one worker; --workers $(nproc) for the node
+
+    # Client: saturation curve from 0.5 to 8 sessions/s, 60 s per step
+    python benchmarks/load_test.py --rates 0.5 1 2 4 8 --duration 60 --label 1-worker \\
+        --output load_1_worker.json --csv load_1_worker.csv
+
+A rate is "sustained" when the step error rate stays under --max-error-rate, each
+step's p95 stays under --slo-ms and completions keep up with arrivals; the report
+gives the highest sustained rate and the concurrency it implies (Little's law).
+A payment that comes back with status error/failed counts as a step error.
+
+The server keeps the pending payment in one process-wide payment_context, so two
+sessions overlapping on the same worker overwrite each other: the earlier one's
+auth step is rejected as "session_mismatch" (counted as an error), or charges the
+later session's payment. Overlap is what a load test produces, so the error rate
+above one session in flight per worker measures that limitation, not capacity.
+Pass --exclusive-sessions to hold each payment -> auth pair exclusively (one
+session at a time against the server; queueing then shows up in the session
+time) when measuring the pipeline itself.
+"""
+import sys
+import os
+import csv
+import json
+import time
+import math
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import platform
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.offline_services import LatencyDistribution
+
+STEPS = ("payment", "auth")
+DEFAULT_PAYMENT_CLIPS = ["K1.mp3"]
+DEFAULT_AUTH_CLIPS = ["K2.mp3", "K3.mp3"]
+# Transcripts the offline fakes should hear in the default clips (--write-transcripts)
+DEFAULT_PAYMENT_TRANSCRIPT = "Pay 20 dollars to Starbucks"
+DEFAULT_PIN_TRANSCRIPT = "one two three four five"
+
+# AudioResponse messages that mean the server failed, as opposed to a normal
+# outcome such as a rejected PIN
+ERROR_MESSAGES = (
+    "Error processing audio",
+    "Invalid step specified",
+    "Step 1 failed",
+    "Authentication error",
+    "Voice authentication system not available"
+)
+# payment_processing statuses that mean the charge didn't happen
+PAYMENT_ERROR_STATUSES = ("error", "failed")
+# Reason given when another session replaced the pending payment on the worker
+SESSION_MISMATCH_REASON = "Session does not match the pending payment"
+
+
+def percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return round(ordered[index], 1)
+
+
+def load_clip(path: Path) -> Dict[str, Any]:
+    data = path.read_bytes()
+    return {
+        "name": path.name,
+        "audio_data": base64.b64encode(data).decode("ascii"),
+        "audio_format": path.suffix.lstrip(".") or "webm",
+        "sha256": hashlib.sha256(data).hexdigest()
+    }
+
+
+def write_transcripts(path: str, payment_clips: List[Path], auth_clips: List[Path]):
+    """Offline transcript map ({sha256: text}) for OFFLINE_TRANSCRIPTS_FILE"""
+    transcripts = {}
+    for clip in payment_clips:
+        transcripts[load_clip(clip)["sha256"]] = DEFAULT_PAYMENT_TRANSCRIPT
+    for clip in auth_clips:
+        transcripts[load_clip(clip)["sha256"]] = DEFAULT_PIN_TRANSCRIPT
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(transcripts, f, indent=2)
+    print(f"Wrote {len(transcripts)} transcripts to {path}", file=sys.stderr)
+
+
+class StageStats:
+    """Per-step latencies and outcomes for the sessions started in one rate stage"""
+
+    def __init__(self, rate: float, duration: float):
+        self.rate = rate
+        self.duration = duration
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.outcomes = {step: {} for step in STEPS}
+        self.started = 0
+        self.completed = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.elapsed = 0.0
+        self.session_seconds = []
+        self.server_seconds = []
+
+    def record(self, step: str, latency_ms: float, outcome: str, error: bool):
+        self.latencies[step].append(latency_ms)
+        self.outcomes[step][outcome] = self.outcomes[step].get(outcome, 0) + 1
+        if error:
+            self.errors[step] += 1
+
+    def summary(self, slo_ms: float, max_error_rate: float) -> Dict[str, Any]:
+        steps = {}
+        sustained = self.completed >= 0.9 * self.started and self.dropped == 0
+        for step in STEPS:
+            ordered = sorted(self.latencies[step])
+            requests = len(ordered)
+            error_rate = self.errors[step] / requests if requests else 0.0
+            p95 = percentile(ordered, 0.95)
+            steps[step] = {
+                "requests": requests,
+                "errors": self.errors[step],
+                "error_rate": round(error_rate, 4),
+                "p50_ms": percentile(ordered, 0.50),
+                "p95_ms": p95,
+                "p99_ms": percentile(ordered, 0.99),
+                "max_ms": round(ordered[-1], 1) if ordered else None,
+                "outcomes": self.outcomes[step]
+            }
+            if error_rate > max_error_rate or (p95 is not None and p95 > slo_ms):
+                sustained = False
+
+        mean_server_seconds = sum(self.server_seconds) / len(self.server_seconds) if self.server_seconds else 0.0
+        achieved = self.completed / self.duration if self.duration > 0 else 0.0
+        return {
+            "offered_rate": self.rate,
+            "achieved_rate": round(achieved, 3),
+            "sessions_started": self.started,
+            "sessions_completed": self.completed,
+            "sessions_dropped": self.dropped,
+            # Time after the last arrival until the backlog cleared; grows past saturation
+            "drain_seconds": round(max(0.0, self.elapsed - self.duration), 2),
+            "max_sessions_in_flight": self.max_in_flight,
+            # Little's law: requests the server holds at once at this rate
+            "server_concurrency": round(achieved * mean_server_seconds, 2),
+            "mean_session_seconds": round(sum(self.session_seconds) / len(self.session_seconds), 2)
+            if self.session_seconds else None,
+            "sustained": sustained,
+            "steps": steps
+        }
+
+
+class LoadGenerator:
+    """Open-loop driver of payment -> think time -> auth sessions"""
+
+    def __init__(self, url: str, payment_clips: List[Dict[str, Any]], auth_clips: List[Dict[str, Any]],
+                 think_time: str = "lognormal:3000,8000", sample_rate: int = 16000,
+                 timeout: float = 60.0, max_sessions: int = 500, arrival: str = "poisson", seed: int = 0,
+                 exclusive_sessions: bool = False):
+        self.url = url.rstrip("/")
+        self.payment_clips = payment_clips
+        self.auth_clips = auth_clips
+        self.think_time = LatencyDistribution(think_time)
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.arrival = arrival
+        self.rng = random.Random(seed)
+        # The server has one pending payment per process; this keeps sessions from overlapping
+        self.exclusive = asyncio.Lock() if exclusive_sessions else None
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def post_step(self, step: str, clip: Dict[str, Any], session_id: Optional[str], stats: StageStats):
+        payload = {
+            "audio_data": clip["audio_data"],
+            "audio_format": clip["audio_format"],
+            "sample_rate": self.sample_rate,
+            "step": step,
+            "session_id": session_id
+        }
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(f"{self.url}/process_voice", json=payload)
+            latency_ms = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                stats.record(step, latency_ms, f"http_{response.status_code}", True)
+                return None
+            body = response.json()
+        except httpx.TimeoutException:
+            stats.record(step, (time.perf_counter() - started) * 1000, "timeout", True)
+            return None
+        except Exception as e:
+            stats.record(step, (time.perf_counter() - started) * 1000, type(e).__name__, True)
+            return None
+
+        message = body.get("message") or ""
+        if message.startswith(ERROR_MESSAGES):
+            stats.record(step, latency_ms, "error", True)
+            return None
+        error = False
+        if step == "payment":
+            outcome = "next_step_auth" if body.get("next_step") == "auth" else "no_payment"
+        else:
+            auth = body.get("voice_authentication") or {}
+            payment = body.get("payment_processing") or {}
+            outcome = payment.get("status") or ("authenticated" if auth.get("authenticated") else "rejected")
+            if (payment.get("reason") or "").startswith(SESSION_MISMATCH_REASON):
+                outcome, error = "session_mismatch", True
+            elif payment.get("status") in PAYMENT_ERROR_STATUSES:
+                outcome, error = f"payment_{payment['status']}", True
+        stats.record(step, latency_ms, outcome, error)
+        return None if error else body
+
+    async def session(self, index: int, stats: StageStats):
+        """One payment conversation; counts as completed when no step failed"""
+        started = time.perf_counter()
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            if self.exclusive is not None:
+                async with self.exclusive:
+                    await self.conversation(index, started, stats)
+            else:
+                await self.conversation(index, started, stats)
+        finally:
+            stats.in_flight -= 1
+
+    async def conversation(self, index: int, started: float, stats: StageStats):
+        """Payment step, think time, then the auth step with the returned session_id"""
+        server_seconds = 0.0
+        payment_started = time.perf_counter()
+        payment_clip = self.payment_clips[index % len(self.payment_clips)]
+        body = await self.post_step("payment", payment_clip, None, stats)
+        server_seconds += time.perf_counter() - payment_started
+        if body is None:
+            return
+        if body.get("next_step") == "auth":
+            await asyncio.sleep(self.think_time.sample())
+            auth_clip = self.auth_clips[index % len(self.auth_clips)]
+            auth_started = time.perf_counter()
+            body = await self.post_step("auth", auth_clip, body.get("session_id"), stats)
+            server_seconds += time.perf_counter() - auth_started
+            if body is None:
+                return
+        stats.completed += 1
+        stats.session_seconds.append(time.perf_counter() - started)
+        stats.server_seconds.append(server_seconds)
+
+    def next_gap(self, rate: float) -> float:
+        if self.arrival == "constant":
+            return 1.0 / rate
+        return self.rng.expovariate(rate)
+
+    async def run_stage(self, rate: float, duration: float, drain_timeout: float) -> StageStats:
+        """Start sessions at `rate`/s for `duration` seconds, then wait for them to finish"""
+        stats = StageStats(rate, duration)
+        tasks = set()
+        stage_started = time.perf_counter()
+        next_start = stage_started
+        index = 0
+        while next_start - stage_started < duration:
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            if stats.in_flight >= self.max_sessions:
+                # Client-side cap reached: the server is not keeping up
+                stats.dropped += 1
+            else:
+                stats.started += 1
+                task = asyncio.create_task(self.session(index, stats))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            index += 1
+            next_start += self.next_gap(rate)
+
+        if tasks:
+            done, pending = await asyncio.wait(set(tasks), timeout=drain_timeout)
+            for task in pending:
+                task.cancel()
+        stats.elapsed = time.perf_counter() - stage_started
+        return stats
+
+    async def server_snapshot(self) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self.client.get(f"{self.url}/pipeline_status", timeout=10)
+            return response.json() if response.status_code == 200 else None
+        except Exception:
+            return None
+
+    async def run(self, rates: List[float], duration: float, cooldown: float, slo_ms: float,
+                  max_error_rate: float) -> Dict[str, Any]:
+        """
+        Run one stage per rate and summarize the saturation curve
+
+        Args:
+            rates: Session arrival rates (sessions/second), usually increasing
+            duration: Seconds of arrivals per stage
+            cooldown: Seconds of idle between stages
+            slo_ms: p95 latency target for each step
+            max_error_rate: Highest step error rate that still counts as sustained
+
+        Returns:
+            Per-stage summaries plus the highest sustained rate
+        """
+        limits = httpx.Limits(max_connections=self.max_sessions, max_keepalive_connections=self.max_sessions)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as self.client:
+            health = await self.client.get(f"{self.url}/health", timeout=10)
+            health.raise_for_status()
+
+            stages = []
+            for rate in rates:
+                print(f"Stage: {rate} sessions/s for {duration:.0f}s...", file=sys.stderr)
+                stats = await self.run_stage(rate, duration, drain_timeout=self.timeout * 2 + 60)
+                summary = stats.summary(slo_ms, max_error_rate)
+                summary["server"] = await self.server_snapshot()
+                stages.append(summary)
+                print(f"  achieved {summary['achieved_rate']}/s, "
+                      f"payment p95 {summary['steps']['payment']['p95_ms']} ms, "
+                      f"auth p95 {summary['steps']['auth']['p95_ms']} ms, "
+                      f"sustained={summary['sustained']}", file=sys.stderr)
+                if cooldown > 0 and rate != rates[-1]:
+                    await asyncio.sleep(cooldown)
+
+        sustained = [stage for stage in stages if stage["sustained"]]
+        best = max(sustained, key=lambda stage: stage["offered_rate"]) if sustained else None
+        return {
+            "url": self.url,
+            "think_time": self.think_time.spec,
+            "arrival": self.arrival,
+            "slo_ms": slo_ms,
+            "max_error_rate": max_error_rate,
+            "exclusive_sessions": self.exclusive is not None,
+            "stages": stages,
+            "max_sustained_rate": best["offered_rate"] if best else None,
+            "max_sustained_server_concurrency": best["server_concurrency"] if best else None,
+            "max_sustained_sessions_in_flight": best["max_sessions_in_flight"] if best else None
+        }
+
+
+def write_curve_csv(path: str, report: Dict[str, Any]):
+    """One row per stage: offered vs achieved rate and per-step latency percentiles"""
+    stage_fields = ["offered_rate", "achieved_rate", "server_concurrency", "max_sessions_in_flight",
+                    "drain_seconds", "sustained"]
+    fields = list(stage_fields)
+    for step in STEPS:
+        fields += [f"{step}_{key}" for key in ("p50_ms", "p95_ms", "p99_ms", "error_rate")]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for stage in report["stages"]:
+            row = {field: stage.get(field) for field in stage_fields}
+            for step in STEPS:
+                for key in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+                    row[f"{step}_{key}"] = stage["steps"][step][key]
+            writer.writerow(row)
+
+
+def resolve_clips(names: List[str]) -> List[Path]:
+    paths = []
+    for name in names:
+        path = Path(name)
+        if not path.exists():
+            path = backend_dir / "prototype" / name
+        if not path.exists():
+            raise FileNotFoundError(f"Recording not found: {name}")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay voice payments against /process_voice at target rates")
+    parser.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    parser.add_argument("--rates", nargs="+", type=float, default=[0.5, 1, 2, 4], help="Session arrival rates (per second)")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of arrivals per rate")
+    parser.add_argument("--cooldown", type=float, default=5, help="Idle seconds between rates")
+    parser.add_argument("--think-time", default="lognormal:3000,8000",
+                        help="Pause between payment and auth, e.g. lognormal:<median ms>,<p95 ms>")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson", help="Arrival process")
+    parser.add_argument("--payment-clips", nargs="+", default=DEFAULT_PAYMENT_CLIPS, help="Recordings for the payment step")
+    parser.add_argument("--auth-clips", nargs="+", default=DEFAULT_AUTH_CLIPS, help="Recordings for the auth step")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="sample_rate sent with each request")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--max-sessions", type=int, default=500, help="Client-side cap on sessions in flight")
+    parser.add_argument("--slo-ms", type=float, default=10000, help="p95 target per step for a rate to count as sustained")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Step error rate allowed at a sustained rate")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for arrivals")
+    parser.add_argument("--exclusive-sessions", action="store_true",
+                        help="Run one payment -> auth session at a time (the server keeps one pending payment per process)")
+    parser.add_argument("--label", default=None, help="Free-form label stored in the report (e.g. 1-worker)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--csv", default=None, help="Write the saturation curve as CSV here")
+    parser.add_argument("--write-transcripts", default=None,
+                        help="Only write an OFFLINE_TRANSCRIPTS_FILE for the clips and exit")
+    args = parser.parse_args()
+
+    payment_paths = resolve_clips(args.payment_clips)
+    auth_paths = resolve_clips(args.auth_clips)
+    if args.write_transcripts:
+        write_transcripts(args.write_transcripts, payment_paths, auth_paths)
+        return
+
+    generator = LoadGenerator(
+        args.url,
+        [load_clip(path) for path in payment_paths],
+        [load_clip(path) for path in auth_paths],
+        think_time=args.think_time,
+        sample_rate=args.sample_rate,
+        timeout=args.timeout,
+        max_sessions=args.max_sessions,
+        arrival=args.arrival,
+        seed=args.seed,
+        exclusive_sessions=args.exclusive_sessions
+    )
+    try:
+        report = asyncio.run(generator.run(args.rates, args.duration, args.cooldown, args.slo_ms, args.max_error_rate))
+    except httpx.HTTPError as e:
+        print(f"Server not reachable at {args.url}: {e}", file=sys.stderr)
+        sys.exit(1)
+    report.update({
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "client": {"python": platform.python_version(), "cpu_count": os.cpu_count()}
+    })
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.csv:
+        write_curve_csv(args.csv, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Micro-benchmarks for the pipeline's hot functions, with regression thresholds
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json   # exit 1 on regression
+
+Each benchmark reports min/median/p95/mean milliseconds over its repeats. With a
+baseline, a benchmark regresses when its median exceeds the baseline median by more
+than its max_ratio in thresholds.json. max_median_ms is an absolute ceiling, set only
+for the steps a voice payment waits on (embedding, audio conversion, authentication)
+as their latency budget; everything else relies on the baseline ratio alone.
+Benchmarks that raise, or that the baseline/thresholds list but the run didn't
+produce, also fail the check.
+"""
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Dict, Any, List, Callable, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# Keep per-call info logs out of the timings (set VPAY_LOG_LEVEL to override)
+os.environ.setdefault("VPAY_LOG_LEVEL", "WARNING")
+
+PROTOTYPE_CLIPS = ["K1.mp3", "K2.mp3", "K3.mp3"]
+USER_COUNTS = [1000, 10000, 100000]
+THRESHOLDS_PATH = Path(__file__).parent / "thresholds.json"
+BENCH_DATA_DIR = Path(os.getenv("VPAY_BENCH_DATA_DIR", Path(tempfile.gettempdir()) / "vpay_bench"))
+
+PAYMENT_TRANSCRIPTS = [
+    "Pay 20 dollars to Starbucks.",
+    "Send $15.50 to John for lunch, thanks",
+    "I want to transfer 12 euros towards Alice",
+    "Give 5 bucks at the coffee shop",
+    "Wire 100.25 dollars to Mom",
+    "Hello, what's the weather like today"
+]
+
+
+class Benchmark:
+    """One measured callable; `setup` runs once before the warm-up"""
+
+    def __init__(self, name: str, run: Callable[[], Any], repeats: int = 5, warmup: int = 1,
+                 inner_loops: int = 1, setup: Optional[Callable[[], Optional[str]]] = None):
+        self.name = name
+        self.run = run
+        self.repeats = repeats
+        self.warmup = warmup
+        self.inner_loops = inner_loops
+        self.setup = setup
+
+    def measure(self) -> Dict[str, Any]:
+        if self.setup is not None:
+            skipped = self.setup()
+            if skipped:
+                return {"name": self.name, "skipped": skipped}
+
+        with redirect_stdout(io.StringIO()):
+            for _ in range(self.warmup):
+                self.run()
+            samples = []
+            for _ in range(self.repeats):
+                started = time.perf_counter()
+                for _ in range(self.inner_loops):
+                    self.run()
+                samples.append((time.perf_counter() - started) * 1000 / self.inner_loops)
+
+        ordered = sorted(samples)
+        return {
+            "name": self.name,
+            "repeats": self.repeats,
+            "inner_loops": self.inner_loops,
+            "min_ms": round(ordered[0], 4),
+            "median_ms": round(statistics.median(ordered), 4),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 4),
+            "mean_ms": round(statistics.fmean(ordered), 4)
+        }
+
+
+def clip_path(clip: str) -> Path:
+    return backend_dir / "prototype" / clip
+
+
+def synthetic_auth_db(users: int) -> str:
+    """SQLite file with `users` random 100-D embeddings and PINs (built once, then reused)"""
+    from tools.voice_auth_database import VoiceAuthDatabase
+
+    BENCH_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    db_path = BENCH_DATA_DIR / f"auth_{users}.db"
+    if db_path.exists():
+        return str(db_path)
+
+    rng = random.Random(users)
+    tmp_path = db_path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    with redirect_stdout(io.StringIO()):
+        db = VoiceAuthDatabase(str(tmp_path))
+        for start in range(0, users, 5000):
+            db.store_voice_data_batch([
+                {
+                    "user_id": f"bench_user_{i:06d}",
+                    "voice_embedding": [round(rng.uniform(-1, 1), 6) for _ in range(100)],
+                    "secret_numbers": [rng.randrange(10) for _ in range(5)]
+                }
+                for i in range(start, min(start + 5000, users))
+            ])
+    os.replace(tmp_path, db_path)
+    return str(db_path)
+
+
+def embedding_benchmarks(repeats: int) -> List[Benchmark]:
+    from tools.voice_to_embedded import generate_100d_voice_embedding
+
+    def missing(clip):
+        return lambda: None if clip_path(clip).exists() else f"{clip_path(clip)} not found"
+
+    return [
+        Benchmark(f"generate_100d_voice_embedding[{clip.split('.')[0]}]",
+                  lambda clip=clip: generate_100d_voice_embedding(str(clip_path(clip))),
+                  repeats=repeats, setup=missing(clip))
+        for clip in PROTOTYPE_CLIPS
+    ]
+
+
+def authentication_benchmarks(repeats: int) -> List[Benchmark]:
+    from tools.voice_auth_database import VoiceAuthDatabase
+    from tools.embedding_snapshot import EmbeddingSnapshot, export_if_stale
+
+    benchmarks = []
+    for users in USER_COUNTS:
+        state = {}
+
+        def setup(users=users, state=state):
+            with redirect_stdout(io.StringIO()):
+                state["db"] = VoiceAuthDatabase(synthetic_auth_db(users))
+            rng = random.Random(0)
+            state["probe"] = [rng.uniform(-1, 1) for _ in range(100)]
+
+        def setup_snapshot(users=users, state=state):
+            db_path = synthetic_auth_db(users)
+            snapshot_dir = str(BENCH_DATA_DIR / f"snapshot_{users}")
+            snapshot = EmbeddingSnapshot(db_path, snapshot_dir)
+            export_if_stale(db_path, snapshot_dir)
+            snapshot.load()
+            # The database doesn't change during the run; keep the refresher thread idle
+            snapshot.refresher.interval = 3600
+            state["snapshot"] = snapshot
+            rng = random.Random(0)
+            state["probe"] = [rng.uniform(-1, 1) for _ in range(100)]
+
+        benchmarks.append(Benchmark(
+            f"authenticate_user[{users // 1000}k]",
+            lambda state=state: state["db"].authenticate_user(state["probe"], [1, 2, 3, 4, 5]),
+            repeats=repeats, setup=setup
+        ))
+        benchmarks.append(Benchmark(
+            f"snapshot_authenticate_user[{users // 1000}k]",
+            lambda state=state: state["snapshot"].authenticate_user(state["probe"], [1, 2, 3, 4, 5]),
+            repeats=repeats, setup=setup_snapshot
+        ))
+    return benchmarks
+
+
+def parsing_benchmarks(repeats: int) -> List[Benchmark]:
+    from utils.parsing_helpers import parse_payment_transcript
+
+    def parse_all():
+        for transcript in PAYMENT_TRANSCRIPTS:
+            parse_payment_transcript(transcript)
+
+    return [Benchmark("parse_payment_transcript[6 transcripts]", parse_all, repeats=repeats, inner_loops=200)]
+
+
+def conversion_benchmarks(repeats: int) -> List[Benchmark]:
+    state = {}
+
+    def setup():
+        if shutil.which("ffmpeg") is None:
+            return "ffmpeg not installed"
+        if not clip_path("K1.mp3").exists():
+            return "K1.mp3 not found"
+        state["dir"] = Path(tempfile.mkdtemp(prefix="vpay_bench_"))
+        # Uploads arrive as .webm; ffmpeg detects the real container from the content
+        state["input"] = state["dir"] / "clip.webm"
+        shutil.copyfile(clip_path("K1.mp3"), state["input"])
+
+    def convert():
+        from main import convert_audio_for_voice_processing
+        output = convert_audio_for_voice_processing(str(state["input"]))
+        if output != str(state["input"]):
+            os.unlink(output)
+
+    return [Benchmark("convert_audio_for_voice_processing[K1]", convert, repeats=repeats, setup=setup)]
+
+
+def hashing_benchmarks(repeats: int) -> List[Benchmark]:
+    from tools.voice_to_embedded import get_audio_hash
+
+    def hash_all():
+        for clip in PROTOTYPE_CLIPS:
+            get_audio_hash(str(clip_path(clip)))
+
+    return [Benchmark("get_audio_hash[K1-K3]", hash_all, repeats=repeats, inner_loops=20)]
+
+
+def instrumentation_benchmarks(repeats: int) -> List[Benchmark]:
+    from utils.metrics import stage_timer
+
+    def timed_stages():
+        # About as many stages as one auth request records
+        for _ in range(10):
+            with stage_timer("benchmark", "noop"):
+                pass
+
+    return [Benchmark("stage_timer[10 stages]", timed_stages, repeats=repeats, inner_loops=1000)]
+
+
+SUITES = {
+    "embedding": embedding_benchmarks,
+    "authentication": authentication_benchmarks,
+    "parsing": parsing_benchmarks,
+    "conversion": conversion_benchmarks,
+    "hashing": hashing_benchmarks,
+    "instrumentation": instrumentation_benchmarks
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=backend_dir, timeout=10)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suites(suites: Optional[List[str]] = None, repeats: int = 5, pattern: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the selected benchmark suites
+
+    Args:
+        suites: Names from SUITES (default: all)
+        repeats: Timed repeats per benchmark
+        pattern: Only run benchmarks whose name contains this substring
+
+    Returns:
+        Machine-readable results: environment plus one entry per benchmark
+    """
+    results = []
+    for suite in suites or list(SUITES):
+        for benchmark in SUITES[suite](repeats):
+            if pattern and pattern not in benchmark.name:
+                continue
+            print(f"Running {benchmark.name}...", file=sys.stderr)
+            try:
+                result = benchmark.measure()
+            except Exception as e:
+                result = {"name": benchmark.name, "error": str(e)}
+            result["suite"] = suite
+            results.append(result)
+            print(f"  {json.dumps(result)}", file=sys.stderr)
+
+    return {
+        "commit": git_commit(),
+        "suites": suites or list(SUITES),
+        "filter": pattern,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": results
+    }
+
+
+def load_thresholds(path: Path = THRESHOLDS_PATH) -> Dict[str, Any]:
+    if not path.exists():
+        return {"default_max_ratio": 1.25, "benchmarks": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def expected_benchmarks(results: Dict[str, Any], baseline: Optional[Dict[str, Any]],
+                        thresholds: Dict[str, Any]) -> List[str]:
+    """Benchmarks this run should have produced: the baseline's (for the suites run) and the thresholds'"""
+    suites = results.get("suites") or list(SUITES)
+    pattern = results.get("filter")
+    names = [
+        entry["name"] for entry in (baseline or {}).get("benchmarks", [])
+        if entry.get("suite") in suites
+    ]
+    if set(suites) == set(SUITES):
+        # Threshold entries don't name their suite, so they only apply to full runs
+        names += list(thresholds.get("benchmarks", {}))
+    return [name for name in dict.fromkeys(names) if not pattern or pattern in name]
+
+
+def check_regressions(results: Dict[str, Any], baseline: Optional[Dict[str, Any]],
+                      thresholds: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Benchmarks slower than the baseline by more than their ratio, over their ceiling,
+    failed with an error, or missing from the run
+
+    Returns:
+        One entry per regression (empty when everything is within thresholds)
+    """
+    baseline_medians = {
+        entry["name"]: entry["median_ms"]
+        for entry in (baseline or {}).get("benchmarks", []) if "median_ms" in entry
+    }
+    regressions = []
+    for entry in results["benchmarks"]:
+        if "error" in entry:
+            regressions.append({"name": entry["name"], "error": entry["error"]})
+            continue
+        if "median_ms" not in entry:
+            continue
+        limits = thresholds.get("benchmarks", {}).get(entry["name"], {})
+        max_ratio = limits.get("max_ratio", thresholds.get("default_max_ratio", 1.25))
+        ceiling = limits.get("max_median_ms")
+
+        previous = baseline_medians.get(entry["name"])
+        if previous and entry["median_ms"] > previous * max_ratio:
+            regressions.append({
+                "name": entry["name"],
+                "median_ms": entry["median_ms"],
+                "baseline_median_ms": previous,
+                "ratio": round(entry["median_ms"] / previous, 3),
+                "max_ratio": max_ratio
+            })
+        elif ceiling is not None and entry["median_ms"] > ceiling:
+            regressions.append({
+                "name": entry["name"],
+                "median_ms": entry["median_ms"],
+                "max_median_ms": ceiling
+            })
+
+    # A renamed or dropped benchmark would otherwise pass silently (skipped ones are reported)
+    ran = {entry["name"] for entry in results["benchmarks"]}
+    for name in expected_benchmarks(results, baseline, thresholds):
+        if name not in ran:
+            regressions.append({"name": name, "error": "Benchmark missing from this run"})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the voice payment pipeline's hot functions")
+    parser.add_argument("--suites", nargs="*", choices=list(SUITES), default=None, help="Suites to run (default: all)")
+    parser.add_argument("--filter", default=None, help="Only benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed repeats per benchmark")
+    parser.add_argument("--output", default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Results JSON of a previous run to compare against")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS_PATH), help="Regression thresholds JSON")
+    args = parser.parse_args()
+
+    results = run_suites(args.suites, args.repeats, args.filter)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    results["regressions"] = check_regressions(results, baseline, load_thresholds(Path(args.thresholds)))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in results["regressions"]:
+        print(f"REGRESSION: {json.dumps(regression)}", file=sys.stderr)
+    sys.exit(1 if results["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,8 @@ from tools.payment_tool import Payment_Tool
 payment_tool = Payment_Tool()
 
 # MIght not be an agent
-async def process_payment_tool(amount: int, currency: str = "usd", recipient: str = "", payer: str = ""):
+async def process_payment_tool(amount: int, currency: str = "usd", recipient: str = "", payer: str = "",
+                               idempotency_key: str = ""):
     """
     Tool function to process payments via Stripe
     
@@ -21,6 +22,7 @@ async def process_payment_tool(amount: int, currency: str = "usd", recipient: st
         currency (str): Currency code (default: "usd")
         recipient (str): Name of payment recipient
         payer (str): Name of person making payment
+        idempotency_key (str): Optional key so a repeated request can't charge twice
     
     Returns:
         dict: Payment result with status and details
@@ -30,7 +32,8 @@ async def process_payment_tool(amount: int, currency: str = "usd", recipient: st
         "amount": amount,
         "currency": currency,
         "recipient": recipient,
-        "payer": payer
+        "payer": payer,
+        "idempotency_key": idempotency_key
     }
     
     result = await payment_tool.on_message_received(message)
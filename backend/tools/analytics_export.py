@@ -0,0 +1,351 @@
+import sys
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from utils.payment_idempotency import PAYMENTS_DB_PATH
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+ANALYTICS_DIR = os.getenv("VPAY_ANALYTICS_DIR", "analytics")
+EXPORT_BATCH_ROWS = int(os.getenv("ANALYTICS_EXPORT_BATCH_ROWS", "50000"))
+PARQUET_COMPRESSION = os.getenv("ANALYTICS_PARQUET_COMPRESSION", "zstd")
+# A date partition with more part files than this is merged into one file
+COMPACT_MIN_FILES = int(os.getenv("ANALYTICS_COMPACT_MIN_FILES", "8"))
+WATERMARK_FILE = "_watermarks.json"
+EXPORT_LOCK_NAME = ".export.lock"
+
+_export_thread_lock = threading.Lock()
+
+# Exported tables: column name -> Arrow type name. Both tables are append-only with
+# AUTOINCREMENT ids, and SQLite commits writers one at a time, so "id > watermark"
+# picks up exactly the rows added since the last export.
+EXPORT_TABLES = {
+    "transaction_ledger": {
+        "id": "int64",
+        "created_at": "timestamp",
+        "payer": "string",
+        "recipient": "string",
+        "amount": "int64",
+        "currency": "string",
+        "status": "string",
+        "payment_intent_id": "string",
+        "session_id": "string"
+    },
+    "auth_events": {
+        "id": "int64",
+        "created_at": "timestamp",
+        "session_id": "string",
+        "user_id": "string",
+        "authenticated": "bool",
+        "auth_method": "string",
+        "pin_source": "string",
+        "digits_recognized": "int32",
+        "similarity_score": "float64",
+        "failure_reason": "string",
+        "payment_status": "string",
+        "latency_ms": "float64"
+    }
+}
+
+
+def pyarrow_available() -> bool:
+    return PYARROW_AVAILABLE
+
+
+def arrow_schema(table: str):
+    types = {
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("ms")
+    }
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_TABLES[table].items()])
+
+
+class ExportInProgress(RuntimeError):
+    """Another export (endpoint or CLI) holds the export directory"""
+
+
+@contextmanager
+def export_lock(out_dir: str):
+    """
+    Hold the export directory's lock without waiting
+
+    The flock serializes the /admin/export_analytics endpoint with CLI runs (where
+    fcntl exists); the thread lock covers threads of one process. A run that finds
+    the lock taken raises ExportInProgress instead of racing on the watermarks.
+    """
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    if not _export_thread_lock.acquire(blocking=False):
+        raise ExportInProgress("Another analytics export is already running")
+    try:
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        with open(out_path / EXPORT_LOCK_NAME, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ExportInProgress("Another analytics export is already running")
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        _export_thread_lock.release()
+
+
+def load_watermarks(out_dir: str) -> Dict[str, Any]:
+    path = Path(out_dir) / WATERMARK_FILE
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_watermarks(out_dir: str, watermarks: Dict[str, Any]):
+    """Write the watermark file atomically (a crash leaves the previous one intact)"""
+    path = Path(out_dir) / WATERMARK_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def part_range(part: Path) -> tuple:
+    """(first id, last id) from a part-<first>-<last>.parquet name"""
+    _, first_id, last_id = part.name.split(".")[0].split("-")
+    return int(first_id), int(last_id)
+
+
+def remove_orphan_parts(table_dir: Path, last_id: int) -> int:
+    """
+    Delete files a crashed run wrote past the watermark
+
+    Part files are named by the id range they hold; anything starting after the
+    watermark would be exported again, so it is removed first.
+    """
+    removed = 0
+    for part in table_dir.glob("date=*/part-*"):
+        if part.suffix != ".parquet" or part_range(part)[0] > last_id:
+            part.unlink()
+            removed += 1
+    return removed
+
+
+def rows_to_arrow(table: str, rows: List[tuple]):
+    schema = arrow_schema(table)
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_timestamp(field.type):
+            values = [datetime.fromisoformat(value) if value else None for value in values]
+        elif pa.types.is_boolean(field.type):
+            values = [None if value is None else bool(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def write_part(table: str, rows: List[tuple], table_dir: Path, date: str, compression: str) -> Path:
+    """Write one date partition of a batch as part-<first id>-<last id>.parquet"""
+    partition_dir = table_dir / f"date={date}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    path = partition_dir / f"part-{rows[0][0]:012d}-{rows[-1][0]:012d}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(rows_to_arrow(table, rows), tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+    return path
+
+
+def compact_partition(table: str, partition_dir: Path, compression: str) -> int:
+    """
+    Merge a date partition's part files into one part-<first id>-<last id>.parquet
+
+    The merged file is renamed into place before the inputs are deleted. If a crash
+    comes in between, the inputs are covered by the merged range and get dropped
+    on the next run, so no row is read twice.
+
+    Returns:
+        Number of files removed from the partition
+    """
+    parts = sorted(partition_dir.glob("part-*.parquet"), key=part_range)
+    ranges = [part_range(part) for part in parts]
+    # Leftovers of an interrupted compaction: files inside another file's id range
+    covered = [part for part, (first, last) in zip(parts, ranges)
+               if any(other != (first, last) and other[0] <= first and last <= other[1] for other in ranges)]
+    for part in covered:
+        part.unlink()
+    parts = [part for part in parts if part not in covered]
+    if len(parts) <= COMPACT_MIN_FILES:
+        return len(covered)
+
+    merged = pa.concat_tables([pq.read_table(part, schema=arrow_schema(table)) for part in parts])
+    first_id, last_id = part_range(parts[0])[0], part_range(parts[-1])[1]
+    path = partition_dir / f"part-{first_id:012d}-{last_id:012d}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(merged, tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+    for part in parts:
+        if part != path:
+            part.unlink()
+    return len(covered) + len(parts) - 1
+
+
+def export_table(db_path: str, table: str, out_dir: str, watermarks: Dict[str, Any],
+                 batch_rows: int = EXPORT_BATCH_ROWS, compression: str = PARQUET_COMPRESSION) -> Dict[str, Any]:
+    """
+    Export the rows of one table added since its watermark
+
+    Each batch is a short primary-key range read on a read-only connection (no
+    long-lived read transaction holding off writers), written as Parquet files
+    partitioned by day, after which the watermark advances.
+
+    Date partitions are compacted once they hold more than COMPACT_MIN_FILES
+    parts, so repeated small runs don't pile up tiny files.
+
+    Returns:
+        {"rows", "files", "compacted", "last_id"} for this run
+    """
+    table_dir = Path(out_dir) / table
+    table_dir.mkdir(parents=True, exist_ok=True)
+    state = watermarks.setdefault(table, {"last_id": 0, "rows": 0})
+    removed = remove_orphan_parts(table_dir, state["last_id"])
+    if removed:
+        logger.warning(f"{table}: removed {removed} partial files from an interrupted export")
+
+    columns = ", ".join(EXPORT_TABLES[table])
+    exported_rows, files = 0, 0
+    conn = sqlite3.connect(f"file:{Path(db_path).resolve()}?mode=ro", uri=True)
+    try:
+        while True:
+            rows = conn.execute(
+                f"SELECT {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                (state["last_id"], batch_rows)
+            ).fetchall()
+            if not rows:
+                break
+
+            for date, day_rows in groupby(rows, key=lambda row: row[1][:10]):
+                write_part(table, list(day_rows), table_dir, date, compression)
+                files += 1
+
+            state["last_id"] = rows[-1][0]
+            state["rows"] += len(rows)
+            state["exported_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            save_watermarks(out_dir, watermarks)
+            exported_rows += len(rows)
+    finally:
+        conn.close()
+
+    compacted = sum(compact_partition(table, partition_dir, compression)
+                    for partition_dir in sorted(table_dir.glob("date=*")))
+    return {"rows": exported_rows, "files": files, "compacted": compacted, "last_id": state["last_id"]}
+
+
+def export_analytics(db_path: str = PAYMENTS_DB_PATH, out_dir: str = ANALYTICS_DIR,
+                     tables: Optional[List[str]] = None, batch_rows: int = EXPORT_BATCH_ROWS) -> Dict[str, Any]:
+    """
+    Incrementally export the ledger and auth events to partitioned Parquet
+
+    Output layout: <out_dir>/<table>/date=YYYY-MM-DD/part-*.parquet plus
+    <out_dir>/_watermarks.json. Readable as a hive-partitioned dataset, e.g.
+    pyarrow.dataset.dataset(path, partitioning="hive") or DuckDB read_parquet.
+
+    Args:
+        db_path: SQLite file holding transaction_ledger and auth_events
+        out_dir: Export root
+        tables: Subset of EXPORT_TABLES (default: all)
+        batch_rows: Rows read per batch
+
+    Returns:
+        Per-table summary, or {"success": False, "error"} if pyarrow is missing or
+        another export is running on the same out_dir
+    """
+    if not PYARROW_AVAILABLE:
+        return {"success": False, "error": "pyarrow is not installed (pip install pyarrow)"}
+    if not os.path.exists(db_path):
+        return {"success": False, "error": f"Database not found: {db_path}"}
+
+    started = time.perf_counter()
+    try:
+        with export_lock(out_dir):
+            watermarks = load_watermarks(out_dir)
+
+            with sqlite3.connect(f"file:{Path(db_path).resolve()}?mode=ro", uri=True) as conn:
+                existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+            results = {}
+            for table in tables or list(EXPORT_TABLES):
+                if table not in EXPORT_TABLES:
+                    results[table] = {"error": "Unknown table"}
+                elif table not in existing:
+                    results[table] = {"rows": 0, "files": 0, "skipped": "table not created yet"}
+                else:
+                    results[table] = export_table(db_path, table, out_dir, watermarks, batch_rows)
+    except ExportInProgress as e:
+        return {"success": False, "error": str(e)}
+
+    return {
+        "success": True,
+        "out_dir": os.path.abspath(out_dir),
+        "tables": results,
+        "elapsed_seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+def load_export(out_dir: str, table: str):
+    """The exported table as one pyarrow Table (with the date partition column)"""
+    import pyarrow.dataset as ds
+    return ds.dataset(Path(out_dir) / table, format="parquet", partitioning="hive").to_table()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the transaction ledger and auth events to partitioned Parquet")
+    parser.add_argument("--db", default=PAYMENTS_DB_PATH, help="SQLite file with the ledger and auth events")
+    parser.add_argument("--out", default=ANALYTICS_DIR, help="Export directory")
+    parser.add_argument("--tables", nargs="*", default=None, choices=list(EXPORT_TABLES), help="Tables to export")
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS, help="Rows read per batch")
+    parser.add_argument("--interval", type=float, default=0, help="Keep exporting every N seconds")
+    args = parser.parse_args()
+
+    while True:
+        print(json.dumps(export_analytics(args.db, args.out, args.tables, args.batch_rows), indent=2))
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+import sys
+import os
+import csv
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Callable
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_auth_database import VoiceAuthDatabase
+from tools.enrollment_archive import archive_enrollment_audio
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".webm", ".m4a", ".ogg", ".flac"}
+
+# Gemini calls per second allowed during bulk enrollment
+DEFAULT_GEMINI_RATE = float(os.getenv("BULK_ENROLL_GEMINI_RATE", "5"))
+DEFAULT_BATCH_SIZE = int(os.getenv("BULK_ENROLL_BATCH_SIZE", "50"))
+# Recordings submitted per embedding process at a time; the rest of the manifest waits
+IN_FLIGHT_PER_WORKER = int(os.getenv("BULK_ENROLL_IN_FLIGHT_PER_WORKER", "2"))
+# Directory that /enroll/bulk sources (and the audio their manifests list) must live under
+ENROLLMENT_ROOT = os.getenv("BULK_ENROLL_ROOT", "enrollment_uploads")
+
+
+class RateLimiter:
+    """Thread-safe token bucket that spaces out calls to an external API"""
+
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        if not rate_per_second > 0:
+            raise ValueError(f"rate_per_second must be positive, got {rate_per_second}")
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _within(path: Path, root: Path) -> bool:
+    return path == root or root in path.parents
+
+
+def resolve_enrollment_source(source: str, root: str = ENROLLMENT_ROOT) -> str:
+    """
+    Resolve a source given over HTTP against the enrollment root
+
+    Args:
+        source: Directory or manifest path, relative to the root or absolute inside it
+        root: Directory every source must live under
+
+    Returns:
+        Absolute path of the source
+
+    Raises:
+        ValueError: If the source resolves outside the root (e.g. via "..")
+    """
+    root_path = Path(root).resolve()
+    source_path = (root_path / source).resolve()
+    if not _within(source_path, root_path):
+        raise ValueError(f"Source must be inside the enrollment root {root_path}")
+    return str(source_path)
+
+
+def load_enrollment_items(source: str, root: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Build the list of users to enroll from a directory or a manifest file
+
+    Args:
+        source: A directory of audio files (user_id = file name without extension),
+                a CSV manifest with user_id,audio_path columns, or a JSON manifest
+                holding a list of {"user_id", "audio_path"} objects
+        root: If given, every audio path must resolve inside this directory
+
+    Returns:
+        List of {"user_id", "audio_path"} dictionaries
+
+    Raises:
+        ValueError: If a manifest lists audio outside the root
+    """
+    source_path = Path(source)
+    root_path = Path(root).resolve() if root is not None else None
+
+    if source_path.is_dir():
+        return [
+            {"user_id": file.stem, "audio_path": str(file.resolve())}
+            for file in sorted(source_path.iterdir())
+            if file.suffix.lower() in AUDIO_EXTENSIONS
+        ]
+
+    if source_path.suffix.lower() == ".json":
+        with open(source_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open(source_path, 'r', encoding='utf-8', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    items = []
+    for entry in entries:
+        audio_path = Path(entry["audio_path"])
+        # Manifest paths are relative to the manifest itself
+        if not audio_path.is_absolute():
+            audio_path = source_path.parent / audio_path
+        if root_path is not None and not _within(audio_path.resolve(), root_path):
+            raise ValueError(f"Manifest entry for {entry['user_id']} points outside the enrollment root")
+        items.append({"user_id": str(entry["user_id"]).strip(), "audio_path": str(audio_path.resolve())})
+    return items
+
+
+class BulkEnrollmentJobStore:
+    """Persists job progress next to voice_auth so interrupted jobs can resume"""
+
+    def __init__(self, db_path: str = "voice_auth.db"):
+        self.db_path = db_path
+        self.init_tables()
+
+    def init_tables(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bulk_enrollment_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, completed, failed
+                    total INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bulk_enrollment_items (
+                    job_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    audio_path TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',  -- pending, done, failed
+                    error TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (job_id, user_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_bulk_items_status
+                ON bulk_enrollment_items(job_id, status)
+            ''')
+            conn.commit()
+
+    def create_job(self, source: str, items: List[Dict[str, str]], job_id: Optional[str] = None) -> str:
+        """Register a job and its items; existing items keep their status"""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO bulk_enrollment_jobs (job_id, source, total)
+                VALUES (?, ?, ?)
+            ''', (job_id, source, len(items)))
+            conn.executemany('''
+                INSERT OR IGNORE INTO bulk_enrollment_items (job_id, user_id, audio_path)
+                VALUES (?, ?, ?)
+            ''', [(job_id, item["user_id"], item["audio_path"]) for item in items])
+            conn.execute('''
+                UPDATE bulk_enrollment_jobs
+                SET total = (SELECT COUNT(*) FROM bulk_enrollment_items WHERE job_id = ?)
+                WHERE job_id = ?
+            ''', (job_id, job_id))
+            conn.commit()
+        return job_id
+
+    def get_pending_items(self, job_id: str, retry_failed: bool = False) -> List[Dict[str, str]]:
+        statuses = ('pending', 'failed') if retry_failed else ('pending',)
+        placeholders = ",".join("?" for _ in statuses)
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(f'''
+                SELECT user_id, audio_path FROM bulk_enrollment_items
+                WHERE job_id = ? AND status IN ({placeholders})
+                ORDER BY user_id
+            ''', (job_id, *statuses)).fetchall()
+        return [{"user_id": row[0], "audio_path": row[1]} for row in rows]
+
+    def mark_items(self, job_id: str, results: List[Dict[str, Any]]):
+        """Record the outcome of a batch of items in one transaction"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''
+                UPDATE bulk_enrollment_items
+                SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND user_id = ?
+            ''', [(r["status"], r.get("error"), job_id, r["user_id"]) for r in results])
+            conn.commit()
+
+    def set_job_status(self, job_id: str, status: str, error: Optional[str] = None):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE bulk_enrollment_jobs
+                SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            ''', (status, error, job_id))
+            conn.commit()
+
+    def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Summarize a job's progress, or None if the job doesn't exist"""
+        with sqlite3.connect(self.db_path) as conn:
+            job = conn.execute('''
+                SELECT job_id, source, status, total, error, created_at, updated_at
+                FROM bulk_enrollment_jobs WHERE job_id = ?
+            ''', (job_id,)).fetchone()
+            if not job:
+                return None
+            counts = dict(conn.execute('''
+                SELECT status, COUNT(*) FROM bulk_enrollment_items
+                WHERE job_id = ? GROUP BY status
+            ''', (job_id,)).fetchall())
+            failures = conn.execute('''
+                SELECT user_id, error FROM bulk_enrollment_items
+                WHERE job_id = ? AND status = 'failed'
+                ORDER BY user_id LIMIT 20
+            ''', (job_id,)).fetchall()
+
+        return {
+            "job_id": job[0],
+            "source": job[1],
+            "status": job[2],
+            "total": job[3],
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0),
+            "error": job[4],
+            "created_at": job[5],
+            "updated_at": job[6],
+            "sample_failures": [{"user_id": u, "error": e} for u, e in failures]
+        }
+
+
+def _extract_embedding(audio_path: str) -> Dict[str, Any]:
+    """Worker-process entry point; imports the embedding backend once per worker"""
+    from tools.voice_to_embedded import generate_voice_embedding
+    return generate_voice_embedding(audio_path)
+
+
+def run_bulk_enrollment(source: str, db_path: str = "voice_auth.db", job_id: Optional[str] = None,
+                        batch_size: int = DEFAULT_BATCH_SIZE, workers: Optional[int] = None,
+                        gemini_rate: float = DEFAULT_GEMINI_RATE, retry_failed: bool = False,
+                        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Enroll every user listed by a directory or manifest
+
+    Embeddings are extracted in a process pool (one process per core by default,
+    spawned rather than forked, since the server process runs threads holding locks),
+    secret numbers are extracted through Gemini under a rate limit, and finished
+    users are committed in batched executemany transactions. Item state is kept in
+    bulk_enrollment_items, so re-running with the same job_id resumes where it stopped.
+
+    Args:
+        source: Directory of audio files or CSV/JSON manifest
+        db_path: Path to the voice_auth database
+        job_id: Existing job to resume, or None to start a new one
+        batch_size: Number of enrolled users per database transaction
+        workers: Embedding worker processes (defaults to CPU count)
+        gemini_rate: Maximum Gemini calls per second
+        retry_failed: Also retry items that failed in a previous run
+        progress_callback: Called with the job progress after every committed batch
+
+    Returns:
+        Final job progress dictionary
+    """
+    store = BulkEnrollmentJobStore(db_path)
+    db = VoiceAuthDatabase(db_path)
+
+    if job_id is None or store.get_progress(job_id) is None:
+        job_id = store.create_job(source, load_enrollment_items(source), job_id)
+
+    items = store.get_pending_items(job_id, retry_failed=retry_failed)
+    store.set_job_status(job_id, "running")
+    logger.info(f"Bulk enrollment job {job_id}: {len(items)} users to process")
+
+    if not items:
+        store.set_job_status(job_id, "completed")
+        return store.get_progress(job_id)
+
+    from tools.voice_to_number import AudioProcessor
+    audio_processor = AudioProcessor()
+    limiter = RateLimiter(gemini_rate, burst=max(1, int(gemini_rate)))
+
+    def extract_numbers(audio_path: str) -> Dict[str, Any]:
+        limiter.acquire()
+        return audio_processor.process_json_output(audio_path)
+
+    pending_records: List[Dict[str, Any]] = []
+    pending_results: List[Dict[str, Any]] = []
+
+    def flush():
+        if pending_records:
+            written = db.store_voice_data_batch(pending_records)
+            if written != len(pending_records):
+                # Batch rejected: record it so a later run can retry these users
+                for result in pending_results:
+                    if result["status"] == "done":
+                        result["status"] = "failed"
+                        result["error"] = "Database batch write failed"
+        store.mark_items(job_id, pending_results)
+        pending_records.clear()
+        pending_results.clear()
+        if progress_callback:
+            progress_callback(store.get_progress(job_id))
+
+    embed_workers = workers or os.cpu_count()
+    max_in_flight = max(1, embed_workers * IN_FLIGHT_PER_WORKER)
+
+    try:
+        with ProcessPoolExecutor(max_workers=embed_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as embed_pool, \
+                ThreadPoolExecutor(max_workers=max(1, int(gemini_rate) * 2)) as gemini_pool:
+
+            # Sliding window: only max_in_flight items are submitted at once, so a large
+            # manifest doesn't hold a future (and queued work) per user
+            remaining = iter(items)
+            in_flight = {}
+
+            def submit_more():
+                while len(in_flight) < max_in_flight:
+                    item = next(remaining, None)
+                    if item is None:
+                        return
+                    if not os.path.exists(item["audio_path"]):
+                        pending_results.append({"user_id": item["user_id"], "status": "failed",
+                                                "error": f"Audio file not found: {item['audio_path']}"})
+                        continue
+                    embedding_future = embed_pool.submit(_extract_embedding, item["audio_path"])
+                    in_flight[embedding_future] = (item, gemini_pool.submit(extract_numbers, item["audio_path"]))
+
+            submit_more()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, numbers_future = in_flight.pop(future)
+                    user_id = item["user_id"]
+                    try:
+                        embedding_result = future.result()
+                        numbers_result = numbers_future.result()
+                        numbers = numbers_result.get("numbers") or []
+
+                        if not embedding_result.get("voice_embedding"):
+                            raise ValueError("Failed to generate voice embedding")
+                        if len(numbers) != 5:
+                            raise ValueError(f"Failed to extract 5 secret numbers. Got: {numbers}")
+
+                        archive_enrollment_audio(item["audio_path"], embedding_result.get("file_hash"))
+                        pending_records.append({
+                            "user_id": user_id,
+                            "voice_embedding": embedding_result["voice_embedding"],
+                            "secret_numbers": numbers,
+                            "embedding_method": embedding_result.get("method", "audio_features"),
+                            "file_hash": embedding_result.get("file_hash")
+                        })
+                        pending_results.append({"user_id": user_id, "status": "done"})
+                    except Exception as e:
+                        pending_results.append({"user_id": user_id, "status": "failed", "error": str(e)})
+
+                submit_more()
+                if len(pending_results) >= batch_size:
+                    flush()
+
+            flush()
+
+        store.set_job_status(job_id, "completed")
+    except Exception as e:
+        # Whatever was committed stays committed; the rest remains pending for resume
+        flush()
+        store.set_job_status(job_id, "failed", str(e))
+        logger.error(f"Bulk enrollment job {job_id} stopped: {e}")
+
+    return store.get_progress(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll voice users from a directory or manifest")
+    parser.add_argument("source", help="Directory of audio files or CSV/JSON manifest (user_id,audio_path)")
+    parser.add_argument("--db", default="voice_auth.db", help="Path to the voice_auth database")
+    parser.add_argument("--job-id", help="Resume an existing job")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Embedding processes (default: CPU count)")
+    parser.add_argument("--gemini-rate", type=float, default=DEFAULT_GEMINI_RATE, help="Gemini calls per second")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry items that failed previously")
+    args = parser.parse_args()
+
+    def print_progress(progress):
+        print(f"[{progress['job_id']}] {progress['done']} done, {progress['failed']} failed, "
+              f"{progress['pending']} pending of {progress['total']}")
+
+    result = run_bulk_enrollment(
+        args.source, db_path=args.db, job_id=args.job_id, batch_size=args.batch_size,
+        workers=args.workers, gemini_rate=args.gemini_rate, retry_failed=args.retry_failed,
+        progress_callback=print_progress
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Offline spoken-digit recognizer for PIN extraction
+
+A constrained-vocabulary recognizer (digits 0-9, "oh" counts as 0) that runs
+locally on CPU:
+
+1. MFCC + delta features (16 kHz, 25 ms / 10 ms frames), mean/variance normalized
+2. Energy-based segmentation into word segments, constrained by the grammar
+   "exactly N digits": extra segments are merged across the shortest pauses,
+   missing ones are split at the quietest point of the longest segment
+3. DTW distance of each segment to stored word templates; per-digit confidence is
+   a softmax over the best distance of each digit
+
+Templates are speaker-dependent recordings of the digits. Enroll them from one
+recording of "0 1 2 3 4 5 6 7 8 9" (several speakers/recordings improve
+speaker independence):
+
+    python tools/digit_recognizer.py enroll digits_alice.wav digits_bob.wav
+    python tools/digit_recognizer.py recognize pin.wav
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded_lite import load_audio, mel_filterbank, dct_matrix
+
+DEFAULT_TEMPLATES_PATH = os.getenv("VPAY_DIGIT_TEMPLATES", str(backend_dir / "digit_templates.npz"))
+PIN_LENGTH = 5
+
+SAMPLE_RATE = 16000
+WIN_LENGTH = 400
+HOP_LENGTH = 160
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+
+# Segmentation (in 10 ms frames)
+MIN_WORD_FRAMES = 8
+MIN_PAUSE_FRAMES = 12
+SPEECH_RANGE_DB = 35.0
+
+# Softmax temperature over normalized DTW distances
+CONFIDENCE_TEMPERATURE = 0.15
+
+
+@lru_cache(maxsize=None)
+def _window() -> np.ndarray:
+    return np.hanning(WIN_LENGTH + 1)[:-1]
+
+
+def _deltas(features: np.ndarray, width: int = 2) -> np.ndarray:
+    """Regression deltas over +-width frames"""
+    padded = np.pad(features, ((width, width), (0, 0)), mode="edge")
+    weights = np.arange(1, width + 1)
+    n = len(features)
+    numerator = sum(w * (padded[width + w:width + w + n] - padded[width - w:width - w + n]) for w in weights)
+    return numerator / (2 * np.sum(weights ** 2))
+
+
+def compute_features(y: np.ndarray):
+    """
+    Per-frame MFCC + delta features and log energy
+
+    Returns:
+        (features of shape (frames, 2 * N_MFCC), log energy in dB per frame)
+    """
+    if len(y) < WIN_LENGTH:
+        y = np.pad(y, (0, WIN_LENGTH - len(y)))
+    frames = np.lib.stride_tricks.sliding_window_view(y.astype(np.float64), WIN_LENGTH)[::HOP_LENGTH]
+    power = np.abs(np.fft.rfft(frames * _window(), n=N_FFT, axis=1)) ** 2
+
+    energy_db = 10.0 * np.log10(np.maximum(power.sum(axis=1), 1e-10))
+    log_mel = np.log(np.maximum(power @ mel_filterbank(SAMPLE_RATE, N_FFT, N_MELS).T, 1e-10))
+    mfcc = log_mel @ dct_matrix(N_MFCC, N_MELS).T
+    return np.hstack((mfcc, _deltas(mfcc))), energy_db
+
+
+def _normalize(features: np.ndarray) -> np.ndarray:
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std < 1e-8, 1.0, std)
+
+
+def segment_words(energy_db: np.ndarray, n_words: Optional[int] = None) -> List[tuple]:
+    """
+    Word segments as (start, stop) frame ranges
+
+    Args:
+        energy_db: Per-frame log energy
+        n_words: If given, merge or split segments until there are exactly this many
+    """
+    floor = np.percentile(energy_db, 10)
+    threshold = max(floor + 10.0, energy_db.max() - SPEECH_RANGE_DB)
+    speech = energy_db > threshold
+
+    edges = np.flatnonzero(np.diff(np.r_[0, speech.astype(int), 0]))
+    segments = [[int(start), int(stop)] for start, stop in zip(edges[::2], edges[1::2])]
+
+    # Close pauses too short to separate words, then drop clicks
+    merged = []
+    for segment in segments:
+        if merged and segment[0] - merged[-1][1] < MIN_PAUSE_FRAMES:
+            merged[-1][1] = segment[1]
+        else:
+            merged.append(segment)
+    segments = [s for s in merged if s[1] - s[0] >= MIN_WORD_FRAMES]
+
+    if n_words is None or not segments:
+        return [tuple(s) for s in segments]
+
+    while len(segments) > n_words:
+        gaps = [segments[i + 1][0] - segments[i][1] for i in range(len(segments) - 1)]
+        i = int(np.argmin(gaps))
+        segments[i:i + 2] = [[segments[i][0], segments[i + 1][1]]]
+
+    while len(segments) < n_words:
+        i = int(np.argmax([stop - start for start, stop in segments]))
+        start, stop = segments[i]
+        if stop - start < 2 * MIN_WORD_FRAMES:
+            break
+        # Split at the quietest frame of the middle 60%
+        low, high = start + int(0.2 * (stop - start)), stop - int(0.2 * (stop - start))
+        cut = low + int(np.argmin(energy_db[low:high]))
+        segments[i:i + 1] = [[start, cut], [cut, stop]]
+
+    return [tuple(s) for s in segments]
+
+
+def dtw_distances(query: np.ndarray, templates: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Length-normalized DTW distance of one segment to many templates at once
+
+    Args:
+        query: Segment features, shape (n, dims)
+        templates: Zero-padded templates, shape (k, max_len, dims)
+        lengths: True template lengths, shape (k,)
+
+    Returns:
+        Distances, shape (k,)
+
+    With steps (i-1, j), (i-1, j-1) and (i, j-1), each row of the cumulative cost
+    is a min-plus scan: D[i, j] = C[j] + min over m <= j of (A[m] - C[m-1]), where
+    C is the running sum of row i's local costs and A the best predecessor from
+    row i-1. np.minimum.accumulate does that scan for all templates in parallel.
+    """
+    k, max_len, _ = templates.shape
+    # Local costs (k, n, max_len); padded columns cost a lot but only sit after each template's end
+    cost = np.sqrt(np.maximum(
+        np.sum(query ** 2, axis=1)[None, :, None]
+        + np.sum(templates ** 2, axis=2)[:, None, :]
+        - 2.0 * np.einsum('nd,kmd->knm', query, templates),
+        0.0
+    ))
+    cost = np.where(np.arange(max_len)[None, None, :] >= lengths[:, None, None], 1e6, cost)
+
+    previous = np.cumsum(cost[:, 0, :], axis=1)
+    for i in range(1, len(query)):
+        row = cost[:, i, :]
+        best_above = np.minimum(previous, np.concatenate((np.full((k, 1), np.inf), previous[:, :-1]), axis=1))
+        running = np.cumsum(row, axis=1)
+        previous = running + np.minimum.accumulate(best_above - (running - row), axis=1)
+
+    return previous[np.arange(k), lengths - 1] / (len(query) + lengths)
+
+
+class DigitTemplates:
+    """Stored digit word templates (normalized features) with their labels"""
+
+    def __init__(self, features: List[np.ndarray], labels: List[int]):
+        self.labels = np.asarray(labels, dtype=int)
+        self.lengths = np.array([len(f) for f in features], dtype=int)
+        dims = features[0].shape[1] if features else 2 * N_MFCC
+        self.padded = np.zeros((len(features), int(self.lengths.max(initial=1)), dims))
+        for i, f in enumerate(features):
+            self.padded[i, :len(f)] = f
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TEMPLATES_PATH) -> "DigitTemplates":
+        data = np.load(path, allow_pickle=False)
+        splits = np.cumsum(data["lengths"])[:-1]
+        return cls(np.split(data["features"], splits), data["labels"].tolist())
+
+    def save(self, path: str = DEFAULT_TEMPLATES_PATH):
+        features = np.concatenate([self.padded[i, :n] for i, n in enumerate(self.lengths)])
+        np.savez(path, features=features, lengths=self.lengths, labels=self.labels)
+
+    def digits(self) -> List[int]:
+        return sorted(set(self.labels.tolist()))
+
+
+def enroll_digit_templates(file_paths: List[str], path: str = DEFAULT_TEMPLATES_PATH,
+                           sequence: str = "0123456789") -> Dict[str, Any]:
+    """
+    Build templates from recordings of the digits spoken in `sequence` order
+
+    Args:
+        file_paths: Recordings, each saying the digits of `sequence` with short pauses
+        path: Where to store the templates (.npz)
+        sequence: The digits said in each recording
+
+    Returns:
+        Summary with the number of templates per digit and recordings skipped
+    """
+    features, labels, skipped = [], [], []
+    for file_path in file_paths:
+        frame_features, energy_db = compute_features(load_audio(file_path, sr=SAMPLE_RATE))
+        segments = segment_words(energy_db, len(sequence))
+        if len(segments) != len(sequence):
+            skipped.append(file_path)
+            continue
+        for (start, stop), digit in zip(segments, sequence):
+            features.append(_normalize(frame_features[start:stop]))
+            labels.append(int(digit))
+
+    if not features:
+        return {"success": False, "error": "No recording could be segmented into the digit sequence", "skipped": skipped}
+
+    DigitTemplates(features, labels).save(path)
+    counts = {str(d): labels.count(d) for d in sorted(set(labels))}
+    return {"success": True, "templates_path": path, "templates_per_digit": counts, "skipped": skipped}
+
+
+class DigitRecognizer:
+    """Template-matching recognizer for a fixed number of spoken digits"""
+
+    def __init__(self, templates: DigitTemplates):
+        self.templates = templates
+        self.vocabulary = np.array(templates.digits())
+
+    def recognize_signal(self, y: np.ndarray, n_digits: int = PIN_LENGTH) -> Dict[str, Any]:
+        started = time.perf_counter()
+        features, energy_db = compute_features(y)
+        segments = segment_words(energy_db, n_digits)
+
+        digits, confidences = [], []
+        for start, stop in segments:
+            distances = dtw_distances(_normalize(features[start:stop]), self.templates.padded, self.templates.lengths)
+            best = np.array([distances[self.templates.labels == d].min() for d in self.vocabulary])
+            scores = np.exp(-(best - best.min()) / CONFIDENCE_TEMPERATURE)
+            probabilities = scores / scores.sum()
+            choice = int(np.argmax(probabilities))
+            digits.append(int(self.vocabulary[choice]))
+            confidences.append(round(float(probabilities[choice]), 4))
+
+        return {
+            "success": len(digits) == n_digits,
+            "numbers": digits,
+            "confidences": confidences,
+            "min_confidence": min(confidences) if confidences else 0.0,
+            "segments": [(round(start * HOP_LENGTH / SAMPLE_RATE, 2), round(stop * HOP_LENGTH / SAMPLE_RATE, 2))
+                         for start, stop in segments],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "method": "local_dtw"
+        }
+
+    def recognize(self, file_path: str, n_digits: int = PIN_LENGTH) -> Dict[str, Any]:
+        """
+        Recognize the spoken PIN in a recording
+
+        Returns:
+            Dictionary with success, numbers, per-digit confidences, min_confidence,
+            segment times in seconds and elapsed_ms (excluding decoding)
+        """
+        try:
+            return self.recognize_signal(load_audio(file_path, sr=SAMPLE_RATE), n_digits)
+        except Exception as e:
+            return {"success": False, "numbers": [], "error": str(e), "method": "local_dtw"}
+
+
+_recognizer: Optional[DigitRecognizer] = None
+_recognizer_lock = threading.Lock()
+
+
+def get_digit_recognizer() -> Optional[DigitRecognizer]:
+    """Shared recognizer, or None if no templates have been enrolled"""
+    global _recognizer
+    with _recognizer_lock:
+        if _recognizer is None and os.path.exists(DEFAULT_TEMPLATES_PATH):
+            _recognizer = DigitRecognizer(DigitTemplates.load(DEFAULT_TEMPLATES_PATH))
+        return _recognizer
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("enroll", "recognize"):
+        print("Usage: python tools/digit_recognizer.py enroll <digits_0_to_9.wav> [...]")
+        print("       python tools/digit_recognizer.py recognize <pin.wav> [...]")
+        sys.exit(1)
+
+    if sys.argv[1] == "enroll":
+        print(json.dumps(enroll_digit_templates(sys.argv[2:]), indent=2))
+        return
+
+    recognizer = get_digit_recognizer()
+    if recognizer is None:
+        print(f"No digit templates at {DEFAULT_TEMPLATES_PATH}; run enroll first")
+        sys.exit(1)
+    for file_path in sys.argv[2:]:
+        print(json.dumps({"file": file_path, **recognizer.recognize(file_path)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import sys
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import get_audio_hash, generate_hash_based_embedding
+from tools.voice_to_embedded_lite import (
+    CURRENT_LITE_EMBEDDING_METHOD,
+    SAMPLE_RATE,
+    load_audio,
+    spectral_frontend_batch,
+    compute_voice_features_lite
+)
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# How long the first request of a batch waits for others to join, and the batch cap
+DEFAULT_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+# Processes extracting batches in parallel (1 = one in-process thread)
+DEFAULT_WORKERS = int(os.getenv("EMBEDDING_BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+
+def extract_batch(signals: List[np.ndarray]) -> List[tuple]:
+    """
+    Features of a batch of signals, as ("ok", features) or ("error", message) per signal
+
+    Runs in a worker process, so per-clip failures come back as values rather
+    than exceptions that would fail the whole batch.
+    """
+    try:
+        frontends = spectral_frontend_batch(signals)
+    except Exception as e:
+        return [("error", f"Batch front end failed: {e}")] * len(signals)
+
+    results = []
+    for y, frontend in zip(signals, frontends):
+        try:
+            results.append(("ok", compute_voice_features_lite(y, SAMPLE_RATE, frontend)))
+        except Exception as e:
+            results.append(("error", str(e)))
+    return results
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batches lite embedding requests from concurrent callers.
+
+    A collector thread takes the first queued signal, waits up to max_wait_ms
+    for more (or until max_batch_size), and hands the batch to a pool of
+    `workers` spawned processes. Each worker runs the frame-level front end
+    (framing, STFT, mel/MFCC projections, YIN autocorrelation) for the whole batch
+    as stacked numpy arrays and finishes each clip's features, so batches run on
+    every core. At most two batches per worker are in flight; under load the
+    rest wait in the queue and form larger batches.
+    Callers get a Future per signal, so sync code blocks on .result() and async
+    code awaits it via embed_file_async().
+    """
+
+    def __init__(self, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 workers: int = DEFAULT_WORKERS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.pool = None
+        self.in_flight = threading.BoundedSemaphore(self.workers * 2)
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.stats = {"requests": 0, "batches": 0, "largest_batch": 0, "errors": 0}
+
+    def start(self):
+        with self.lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self.stopped:
+            raise RuntimeError("Embedding batcher has been stopped")
+        if self.thread is None or not self.thread.is_alive():
+            if self.workers > 1:
+                # Spawned, not forked: the server process runs threads holding locks
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-batch")
+            # The collector keeps its own reference, so stop() can't pull the pool from under it
+            self.thread = threading.Thread(target=self._run, args=(self.pool,), name="embedding-batcher",
+                                           daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Finish the queued requests, then stop the collector and the worker pool (no restart)"""
+        with self.lock:
+            self.stopped = True
+            thread, pool = self.thread, self.pool
+            if thread is not None and thread.is_alive():
+                # Under the lock: nothing can be queued behind the sentinel
+                self.queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+        if pool is not None:
+            pool.shutdown(wait=True)
+        with self.lock:
+            self.thread = self.pool = None
+
+    def submit(self, y: np.ndarray) -> Future:
+        """Queue a mono signal at SAMPLE_RATE; the Future resolves to its normalized 100-D features"""
+        future: Future = Future()
+        with self.lock:
+            self._start_locked()
+            self.queue.put((y, future))
+        return future
+
+    def embed_signal(self, y: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(y).result(timeout)
+
+    def embed_file(self, file_path: str) -> Dict[str, Any]:
+        """Drop-in for generate_100d_voice_embedding_lite that goes through the batch"""
+        try:
+            features = self.embed_signal(load_audio(file_path))
+            return self._result(file_path, features)
+        except Exception as e:
+            logger.warning(f"Batched audio feature extraction failed: {e}")
+            return generate_hash_based_embedding(file_path, str(e))
+
+    async def embed_file_async(self, file_path: str) -> Dict[str, Any]:
+        """embed_file for async callers; decoding runs in a thread, the event loop is never blocked"""
+        try:
+            y = await asyncio.to_thread(load_audio, file_path)
+            features = await asyncio.wrap_future(self.submit(y))
+            return self._result(file_path, features)
+        except Exception as e:
+            logger.warning(f"Batched audio feature extraction failed: {e}")
+            return await asyncio.to_thread(generate_hash_based_embedding, file_path, str(e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["average_batch"] = round(stats["requests"] / stats["batches"], 2) if stats["batches"] else 0
+        stats["queued"] = self.queue.qsize()
+        stats["running"] = self.thread is not None and self.thread.is_alive()
+        stats["workers"] = self.workers
+        return stats
+
+    def _result(self, file_path: str, features: np.ndarray) -> Dict[str, Any]:
+        return {
+            "voice_embedding": features.round(6).tolist(),
+            "method": CURRENT_LITE_EMBEDDING_METHOD,
+            "dimensions": len(features),
+            "file_hash": get_audio_hash(file_path)
+        }
+
+    def _run(self, pool):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            # Wait for a free slot before collecting, so a backlog forms bigger batches
+            self.in_flight.acquire()
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._process(batch, pool)
+
+    def _process(self, batch: List[tuple], pool):
+        # Drop requests whose caller already gave up
+        batch = [(y, future) for y, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            self.in_flight.release()
+            return
+
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+        futures = [future for _, future in batch]
+        try:
+            pending = pool.submit(extract_batch, [y for y, _ in batch])
+        except Exception as e:
+            self.in_flight.release()
+            self._fail(futures, e)
+            return
+        pending.add_done_callback(lambda done: self._complete(futures, done))
+
+    def _complete(self, futures: List[Future], done: Future):
+        self.in_flight.release()
+        try:
+            results = done.result()
+        except Exception as e:
+            # The worker process died or the batch couldn't be sent
+            self._fail(futures, e)
+            return
+        for future, (status, value) in zip(futures, results):
+            if status == "ok":
+                future.set_result(value)
+            else:
+                self.stats["errors"] += 1
+                future.set_exception(RuntimeError(value))
+
+    def _fail(self, futures: List[Future], error: Exception):
+        self.stats["errors"] += len(futures)
+        for future in futures:
+            future.set_exception(error)
+
+
+_batcher: Optional[EmbeddingBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Process-wide batcher, started on first use"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher()
+        return _batcher
+
+
+def shutdown_embedding_batcher(timeout: Optional[float] = 30):
+    with _batcher_lock:
+        batcher = _batcher
+    if batcher is not None:
+        batcher.stop(timeout)
+
+
+def benchmark(concurrency: int = 8, n_requests: int = 64, signals: Optional[List[np.ndarray]] = None,
+              workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    Compare per-request extraction with the batcher under the same concurrent load
+
+    `concurrency` caller threads each submit requests back to back; reports
+    throughput and latency percentiles for both modes.
+    """
+    if signals is None:
+        from tools.embedding_warmup import synthesize_warmup_clip
+        signals = [synthesize_warmup_clip(SAMPLE_RATE, seconds) for seconds in (2.0, 3.0, 4.5, 6.0)]
+    workload = [signals[i % len(signals)] for i in range(n_requests)]
+
+    def run(extract) -> Dict[str, Any]:
+        latencies = []
+
+        def timed(y):
+            started = time.perf_counter()
+            extract(y)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(timed, workload))
+        elapsed = time.perf_counter() - started
+
+        latencies_ms = np.array(latencies) * 1000
+        return {
+            "throughput_per_s": round(n_requests / elapsed, 2),
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies_ms, 99)), 1)
+        }
+
+    # Warm caches (filter banks, FFT plans) before timing
+    compute_voice_features_lite(signals[0])
+
+    per_request = run(compute_voice_features_lite)
+    batcher = EmbeddingBatcher(workers=workers)
+    # Start the worker processes before timing
+    batcher.embed_signal(signals[0])
+    batched = run(batcher.embed_signal)
+    stats = batcher.get_stats()
+    batcher.stop()
+
+    return {
+        "concurrency": concurrency,
+        "workers": workers,
+        "requests": n_requests,
+        "per_request": per_request,
+        "batched": batched,
+        "batcher": stats,
+        "throughput_gain": round(batched["throughput_per_s"] / per_request["throughput_per_s"], 2)
+    }
+
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WORKERS
+    print(json.dumps(benchmark(concurrency=concurrency, workers=workers), indent=2))
@@ -0,0 +1,438 @@
+import sqlite3
+import json
+import os
+import sys
+import threading
+import numpy as np
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.structured_logging import get_logger
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+# Directory that holds the shared, read-only embedding snapshot
+DEFAULT_SNAPSHOT_DIR = os.getenv("VOICE_SNAPSHOT_DIR", "voice_snapshot")
+# How often the background refresher checks the database generation (seconds)
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("VOICE_SNAPSHOT_REFRESH_SECONDS", "5"))
+MANIFEST_NAME = "manifest.json"
+EXPORT_LOCK_NAME = ".export.lock"
+# Minimum matrix width; wider speaker-model rows widen it, narrower rows are zero-padded
+EMBEDDING_DIMENSIONS = 100
+
+_export_thread_lock = threading.Lock()
+
+
+def ensure_generation_tracking(db_path: str):
+    """
+    Create the generation counter and the triggers that bump it.
+
+    Every insert, update or delete on voice_auth increments the counter, so
+    workers can tell whether their mapped snapshot is stale with one query.
+    """
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS snapshot_generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                generation INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO snapshot_generation (id, generation) VALUES (1, 0)')
+
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS voice_auth_generation_{event.lower()}
+                AFTER {event} ON voice_auth
+                BEGIN
+                    UPDATE snapshot_generation SET generation = generation + 1 WHERE id = 1;
+                END
+            ''')
+        conn.commit()
+
+
+def get_db_generation(db_path: str) -> int:
+    """Return the current generation counter of the database"""
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute('SELECT generation FROM snapshot_generation WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+
+def read_manifest(snapshot_dir: str) -> Optional[Dict]:
+    """Read the snapshot manifest, or None if no snapshot was exported yet"""
+    manifest_path = Path(snapshot_dir) / MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+@contextmanager
+def export_lock(snapshot_dir: str):
+    """
+    Hold the snapshot directory's export lock
+
+    An flock on the lock file serializes exporters across worker processes and
+    CLI jobs (where fcntl exists); the thread lock covers threads of one process.
+    """
+    snapshot_path = Path(snapshot_dir)
+    snapshot_path.mkdir(parents=True, exist_ok=True)
+    with _export_thread_lock:
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        with open(snapshot_path / EXPORT_LOCK_NAME, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def export_if_stale(db_path: str, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> Optional[Dict]:
+    """
+    Export a new snapshot unless the manifest already matches the database generation
+
+    Exporters that queued behind the lock find the manifest current and skip, so
+    one generation is exported once per host.
+
+    Returns:
+        The new manifest, or None if the snapshot was already current
+    """
+    ensure_generation_tracking(db_path)
+    with export_lock(snapshot_dir):
+        manifest = read_manifest(snapshot_dir)
+        if manifest is not None and manifest["generation"] == get_db_generation(db_path):
+            return None
+        return _write_snapshot(db_path, snapshot_dir)
+
+
+def export_embedding_snapshot(db_path: str, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> Dict:
+    """
+    Export all active embeddings from the database into a memory-mappable snapshot
+
+    Files written (suffixed with the generation they were taken at):
+        embeddings-<gen>.npy: float32 matrix (N x widest row, at least 100), rows
+                              L2-normalized and zero-padded (padding leaves cosines unchanged)
+        pins-<gen>.npy:       int16 matrix (N x 5) of secret numbers
+        ids-<gen>.json:       id table (row id, user_id, embedding_method, dimensions) in row order
+        manifest.json:        points at the current generation, replaced atomically
+
+    Args:
+        db_path: Path to the voice_auth SQLite database
+        snapshot_dir: Directory to write the snapshot into
+
+    Returns:
+        The manifest dictionary of the exported snapshot
+    """
+    ensure_generation_tracking(db_path)
+    with export_lock(snapshot_dir):
+        return _write_snapshot(db_path, snapshot_dir)
+
+
+def _write_snapshot(db_path: str, snapshot_dir: str) -> Dict:
+    """Write the snapshot files and publish the manifest (caller holds the export lock)"""
+    snapshot_path = Path(snapshot_dir)
+    previous = read_manifest(snapshot_dir)
+
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        # Read the counter and the rows in one transaction so they agree
+        cursor.execute('BEGIN')
+        generation = cursor.execute(
+            'SELECT generation FROM snapshot_generation WHERE id = 1'
+        ).fetchone()[0]
+        rows = cursor.execute('''
+            SELECT id, user_id, voice_embedding, secret_numbers, embedding_method
+            FROM voice_auth WHERE is_active = 1
+            ORDER BY id
+        ''').fetchall()
+        conn.rollback()
+
+    vectors = [np.asarray(json.loads(row[2]), dtype=np.float32) for row in rows]
+    # A row without a usable vector (e.g. 'null' from a failed extraction) can't be
+    # scored; leave it out rather than failing the export for every user
+    valid = [vector.ndim == 1 and len(vector) > 0 for vector in vectors]
+    if not all(valid):
+        logger.warning("Embedding snapshot skipped rows without a usable embedding",
+                       extra={"user_ids": [row[1] for row, ok in zip(rows, valid) if not ok]})
+        rows = [row for row, ok in zip(rows, valid) if ok]
+        vectors = [vector for vector, ok in zip(vectors, valid) if ok]
+    width = max([EMBEDDING_DIMENSIONS] + [len(vector) for vector in vectors])
+    embeddings = np.zeros((len(rows), width), dtype=np.float32)
+    pins = np.full((len(rows), 5), -1, dtype=np.int16)
+    id_table = []
+
+    for i, ((row_id, user_id, _, numbers_json, method), vector) in enumerate(zip(rows, vectors)):
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            embeddings[i, :len(vector)] = vector / norm
+        numbers = json.loads(numbers_json)
+        if len(numbers) == 5:
+            pins[i] = numbers
+        id_table.append({"id": row_id, "user_id": user_id, "embedding_method": method, "dimensions": len(vector)})
+
+    files = {
+        "embeddings": f"embeddings-{generation}.npy",
+        "pins": f"pins-{generation}.npy",
+        "ids": f"ids-{generation}.json"
+    }
+
+    # Write under temporary names first, then publish with atomic renames
+    tmp_suffix = f".tmp-{os.getpid()}"
+    with open(snapshot_path / (files["embeddings"] + tmp_suffix), 'wb') as f:
+        np.save(f, embeddings, allow_pickle=False)
+    with open(snapshot_path / (files["pins"] + tmp_suffix), 'wb') as f:
+        np.save(f, pins, allow_pickle=False)
+    with open(snapshot_path / (files["ids"] + tmp_suffix), 'w', encoding='utf-8') as f:
+        json.dump(id_table, f)
+
+    for name in files.values():
+        os.replace(snapshot_path / (name + tmp_suffix), snapshot_path / name)
+
+    manifest = {
+        "generation": generation,
+        "count": len(rows),
+        "dimensions": width,
+        "files": files
+    }
+    manifest_tmp = snapshot_path / (MANIFEST_NAME + tmp_suffix)
+    with open(manifest_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_tmp, snapshot_path / MANIFEST_NAME)
+
+    # Generations advance once per changed row, so keep the previously published
+    # snapshot (workers may still be mapping it) rather than generation - 1
+    keep = {generation}
+    if previous is not None:
+        keep.add(previous["generation"])
+    _remove_old_generations(snapshot_path, keep=keep)
+    logger.info("Embedding snapshot exported", extra={"users": len(rows), "generation": generation})
+    return manifest
+
+
+def _remove_old_generations(snapshot_path: Path, keep: set):
+    """Delete snapshot files of generations no worker should still be mapping"""
+    for file in snapshot_path.glob("*-*.*"):
+        stem = file.name.split('.')[0]
+        prefix, _, gen = stem.rpartition('-')
+        if prefix not in ("embeddings", "pins", "ids") or not gen.isdigit():
+            continue
+        if int(gen) not in keep:
+            try:
+                file.unlink()
+            except OSError:
+                # Another worker may still hold it open (e.g. on Windows)
+                pass
+
+
+class SnapshotRefresher:
+    """
+    Background thread that re-exports the snapshot when the database changes
+
+    It checks the generation every SNAPSHOT_REFRESH_SECONDS (or sooner when woken
+    by request_export), so a bulk job's many small batches cost one export per
+    interval rather than one per batch. Exports run under export_lock, so workers
+    on the same host don't export the same generation twice.
+    """
+
+    def __init__(self, db_path: str, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR,
+                 interval: float = SNAPSHOT_REFRESH_SECONDS):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="embedding-snapshot-refresher", daemon=True)
+                self._thread.start()
+
+    def request_export(self):
+        """Check the generation now instead of at the next interval (e.g. after an enrollment)"""
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                export_if_stale(self.db_path, self.snapshot_dir)
+            except Exception as e:
+                logger.warning(f"Embedding snapshot export failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+class EmbeddingSnapshot:
+    """
+    Read-only view of the embedding snapshot shared by all worker processes.
+
+    The embedding matrix is opened with np.memmap (via np.load(mmap_mode='r')),
+    so every worker on the host reads the same page-cache copy instead of holding
+    its own. Requests only remap when a newer manifest has been published; the
+    exports themselves run on the SnapshotRefresher thread.
+    """
+
+    def __init__(self, db_path: str = "voice_auth.db", snapshot_dir: str = DEFAULT_SNAPSHOT_DIR):
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.generation = None
+        self.embeddings = None
+        self.pins = None
+        self.user_ids: List[str] = []
+        self.embedding_methods: List[str] = []
+        self.row_dimensions: List[int] = []
+        self.refresher = SnapshotRefresher(db_path, snapshot_dir)
+        self._manifest_mtime = None
+        ensure_generation_tracking(db_path)
+
+    def load(self, manifest: Optional[Dict] = None) -> bool:
+        """Map the snapshot named by the manifest (read from disk if not given)"""
+        if manifest is None:
+            manifest = read_manifest(self.snapshot_dir)
+        if manifest is None:
+            return False
+
+        snapshot_path = Path(self.snapshot_dir)
+        files = manifest["files"]
+        try:
+            embeddings = np.load(snapshot_path / files["embeddings"], mmap_mode='r')
+            pins = np.load(snapshot_path / files["pins"], mmap_mode='r')
+            with open(snapshot_path / files["ids"], 'r', encoding='utf-8') as f:
+                id_table = json.load(f)
+        except FileNotFoundError:
+            # Manifest was replaced while we were reading; caller will retry
+            return False
+
+        self.embeddings = embeddings
+        self.pins = pins
+        self.user_ids = [entry["user_id"] for entry in id_table]
+        self.embedding_methods = [entry["embedding_method"] for entry in id_table]
+        self.row_dimensions = [entry.get("dimensions", EMBEDDING_DIMENSIONS) for entry in id_table]
+        self.generation = manifest["generation"]
+        return True
+
+    def refresh_if_stale(self):
+        """Remap when the refresher has published a new manifest (never exports here)"""
+        if not self.refresher.running:
+            self.refresher.start()
+        try:
+            mtime = os.stat(Path(self.snapshot_dir) / MANIFEST_NAME).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+
+        manifest = read_manifest(self.snapshot_dir)
+        if manifest is not None and manifest["generation"] != self.generation and not self.load(manifest):
+            # Files of that manifest were already replaced; retry on the next request
+            return
+        self._manifest_mtime = mtime
+
+    def _still_enrolled(self, user_id: str, secret_numbers: List[int]) -> bool:
+        """Confirm a snapshot match against the database while the snapshot lags behind it"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                'SELECT secret_numbers FROM voice_auth WHERE user_id = ? AND is_active = 1', (user_id,)
+            ).fetchone()
+        return row is not None and json.loads(row[0]) == list(secret_numbers)
+
+    def authenticate_user(self, voice_embedding: List[float], secret_numbers: List[int],
+                          similarity_threshold: float = 0.85,
+                          probe_for_method: Optional[Callable[[str], Optional[List[float]]]] = None
+                          ) -> Tuple[Optional[str], float]:
+        """
+        Same contract as VoiceAuthDatabase.authenticate_user, scored against the snapshot
+
+        Args:
+            voice_embedding: Embedding to compare (100-D, or the speaker model's width)
+            secret_numbers: 5 secret numbers to verify
+            similarity_threshold: Minimum cosine similarity required
+            probe_for_method: Optional lookup returning the probe embedding for a stored
+                              row's embedding_method (dual-version scoring during migrations)
+
+        Returns:
+            Tuple of (user_id if authenticated, similarity_score) or (None, 0.0)
+        """
+        self.refresh_if_stale()
+        if self.embeddings is None:
+            # Nothing exported yet; callers fall back to the database
+            self.refresher.request_export()
+            raise RuntimeError("Embedding snapshot has not been exported yet")
+        if len(self.user_ids) == 0 or len(secret_numbers) != 5:
+            return None, 0.0
+
+        candidates = np.flatnonzero((self.pins == np.asarray(secret_numbers)).all(axis=1))
+        if len(candidates) == 0:
+            return None, 0.0
+
+        # Score each group of candidates against a probe in that group's embedding method
+        groups: Dict[str, List[int]] = {}
+        for index in candidates:
+            groups.setdefault(self.embedding_methods[index], []).append(int(index))
+
+        best_index = None
+        best_similarity = 0.0
+        for method, indices in groups.items():
+            probe = probe_for_method(method) if probe_for_method else None
+            if probe_for_method and probe is None:
+                # No extractor for this group's method: the probe isn't comparable, fail closed
+                logger.warning("No probe for stored embedding method", extra={"embedding_method": method})
+                continue
+            query = np.asarray(probe if probe is not None else voice_embedding, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            # A probe of another width comes from a different method and can't be compared
+            if norm == 0 or len(query) != self.row_dimensions[indices[0]]:
+                continue
+            padded = np.zeros(self.embeddings.shape[1], dtype=np.float32)
+            padded[:len(query)] = query / norm
+            scores = self.embeddings[indices] @ padded
+            top = int(np.argmax(scores))
+            if scores[top] > best_similarity:
+                best_similarity = float(scores[top])
+                best_index = indices[top]
+
+        if best_index is not None and best_similarity >= similarity_threshold:
+            user_id = self.user_ids[best_index]
+            # A user deactivated or re-enrolled since the last export must not pass
+            if self.generation != get_db_generation(self.db_path) and not self._still_enrolled(user_id, secret_numbers):
+                return None, 0.0
+            return user_id, best_similarity
+        return None, 0.0
+
+    def get_stats(self) -> Dict:
+        """Describe the currently mapped snapshot"""
+        return {
+            "generation": self.generation,
+            "users": len(self.user_ids),
+            "snapshot_dir": os.path.abspath(self.snapshot_dir),
+            "memory_mapped": isinstance(self.embeddings, np.memmap),
+            "refresher_running": self.refresher.running,
+            "refresh_seconds": self.refresher.interval
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "voice_auth.db"
+    target_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_SNAPSHOT_DIR
+    print(json.dumps(export_embedding_snapshot(db_file, target_dir), indent=2))
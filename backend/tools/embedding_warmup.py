@@ -0,0 +1,136 @@
+import sys
+import os
+import time
+import wave
+import tempfile
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import (generate_voice_embedding, get_embedding_extractor, normalize_embedding_method,
+                                     ACTIVE_EMBEDDING_METHOD, CURRENT_EMBEDDING_METHOD)
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+WARMUP_SAMPLE_RATE = 16000  # Same rate main.py converts uploads to, so resampling is warmed too
+WARMUP_SECONDS = 3.0
+
+# Warm-up state shared with the readiness endpoint
+_state: Dict[str, Any] = {
+    "status": "pending",  # pending, running, warm, failed, disabled
+    "seconds": None,
+    "error": None,
+    "started_at": None,
+    "finished_at": None
+}
+_lock = threading.Lock()
+
+
+def synthesize_warmup_clip(sample_rate: int = WARMUP_SAMPLE_RATE, seconds: float = WARMUP_SECONDS) -> np.ndarray:
+    """
+    Deterministic speech-like test signal
+
+    A harmonic series on a ~120 Hz fundamental with vibrato, gated into syllables
+    with a little noise, so pitch tracking, onset and beat detection, HPSS and the
+    spectral features all take their real code paths.
+    """
+    rng = np.random.default_rng(1234)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+
+    f0 = 120.0 + 15.0 * np.sin(2 * np.pi * 5.0 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 11))
+
+    # ~4 syllables per second, with short pauses between them
+    envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 0.5
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    return (signal / np.max(np.abs(signal)) * 0.8).astype(np.float32)
+
+
+def write_wav(path: str, signal: np.ndarray, sample_rate: int):
+    """Write a mono float signal as 16-bit PCM WAV"""
+    pcm = (np.clip(signal, -1, 1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+
+
+def run_embedding_warmup() -> Dict[str, Any]:
+    """
+    Run the active embedding method's extractor once on the synthetic clip
+
+    Only the configured extractor (VPAY_EMBEDDING_METHOD) is warmed, so lite and
+    ONNX workers don't import librosa and numba just for the warm-up. For the
+    librosa method this triggers numba's JIT compilation (YIN, beat tracking, onset
+    detection); with NUMBA_CACHE_DIR persistent the compiled kernels are loaded
+    from disk on later restarts instead of being compiled again.
+    """
+    with _lock:
+        if _state["status"] in ("running", "warm"):
+            return dict(_state)
+        _state.update(status="running", started_at=time.time(), error=None)
+
+    started = time.perf_counter()
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
+            tmp_path = tmp_file.name
+        write_wav(tmp_path, synthesize_warmup_clip(), WARMUP_SAMPLE_RATE)
+
+        # generate_voice_embedding falls back to the librosa method for unknown methods
+        expected = ACTIVE_EMBEDDING_METHOD if get_embedding_extractor(ACTIVE_EMBEDDING_METHOD) else CURRENT_EMBEDDING_METHOD
+        result = generate_voice_embedding(tmp_path)
+        if normalize_embedding_method(result.get("method")) != expected:
+            raise RuntimeError(result.get("error", f"pipeline fell back to {result.get('method')}"))
+
+        status, error = "warm", None
+    except Exception as e:
+        status, error = "failed", str(e)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    with _lock:
+        _state.update(
+            status=status,
+            error=error,
+            seconds=round(time.perf_counter() - started, 3),
+            finished_at=time.time()
+        )
+        log = logger.warning if error else logger.info
+        log(f"Embedding warm-up {status} in {_state['seconds']}s" + (f": {error}" if error else ""))
+        return dict(_state)
+
+
+def start_embedding_warmup_in_background() -> threading.Thread:
+    """Run the warm-up on a daemon thread so startup isn't blocked"""
+    thread = threading.Thread(target=run_embedding_warmup, name="embedding-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_warmup_status() -> Dict[str, Any]:
+    """Current warm-up state plus the numba cache location"""
+    with _lock:
+        status = dict(_state)
+    status["numba_cache_dir"] = os.environ.get("NUMBA_CACHE_DIR")
+    return status
+
+
+def disable_warmup():
+    """Mark warm-up as skipped (readiness then doesn't wait for it)"""
+    with _lock:
+        if _state["status"] == "pending":
+            _state["status"] = "disabled"
+
+
+if __name__ == "__main__":
+    print(run_embedding_warmup())
@@ -0,0 +1,43 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Enrollment recordings are kept (content-addressed by file hash) so embeddings
+# can be re-derived when the feature extraction code changes
+ARCHIVE_DIR = Path(os.getenv("VOICE_ARCHIVE_DIR", str(Path(__file__).parent.parent / "enrollment_audio")))
+
+
+def archive_enrollment_audio(audio_path: str, file_hash: str) -> Optional[str]:
+    """
+    Copy an enrollment recording into the archive
+
+    Args:
+        audio_path: Path to the recording used for enrollment
+        file_hash: get_audio_hash() of the recording, stored alongside the embedding
+
+    Returns:
+        Path of the archived copy, or None if archiving failed
+    """
+    try:
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        archived_path = ARCHIVE_DIR / f"{file_hash}{Path(audio_path).suffix.lower()}"
+        if not archived_path.exists():
+            shutil.copyfile(audio_path, archived_path)
+        return str(archived_path)
+    except Exception as e:
+        logger.warning(f"Failed to archive enrollment audio {audio_path}: {e}")
+        return None
+
+
+def find_archived_audio(file_hash: Optional[str]) -> Optional[str]:
+    """Return the archived recording for a file hash, or None if it isn't archived"""
+    if not file_hash or not ARCHIVE_DIR.exists():
+        return None
+    for candidate in ARCHIVE_DIR.glob(f"{file_hash}.*"):
+        return str(candidate)
+    return None
@@ -1,12 +1,13 @@
 # payment_tool.py
 import asyncio
 from google.adk.agents import BaseAgent
-from utils.stripe_service import create_payment_intent
+from utils.stripe_service import create_payment_intent_async, close_stripe_client
 
 class Payment_Tool(BaseAgent):
     """
     ADK-compatible agent that handles Stripe payments.
-    Receives a payment intent message and calls stripe_service to create/confirm payment.
+    Receives a payment intent message and calls stripe_service to create/confirm payment
+    over the shared async Stripe client, so the event loop isn't blocked.
     """
 
     def __init__(self, name="Payment_Tool"):
@@ -20,7 +21,8 @@ class Payment_Tool(BaseAgent):
             "amount": 2000,   # cents
             "currency": "usd",
             "recipient": "Starbucks",
-            "payer": "Miguel"
+            "payer": "Miguel",
+            "idempotency_key": "vpay_..."   # optional, passed to Stripe
         }
         """
         # Basic validation
@@ -33,11 +35,18 @@ class Payment_Tool(BaseAgent):
 
         currency = message.get("currency", "usd")
 
-        # Call Stripe service
-        try:
-            result = create_payment_intent(amount, currency)
-        except Exception as e:
-            return {"status": "error", "reason": str(e)}
+        recipient = message.get("recipient", "")
+        payer = message.get("payer", "")
+        metadata = {key: value for key, value in (("recipient", recipient), ("payer", payer)) if value}
+
+        # Call Stripe service (returns a structured result, never raises)
+        result = await create_payment_intent_async(
+            amount,
+            currency,
+            description=f"Voice payment to {recipient}" if recipient else None,
+            metadata=metadata or None,
+            idempotency_key=message.get("idempotency_key") or None
+        )
 
         # Return result back to ADK workflow
         return result
@@ -56,6 +65,7 @@ async def demo_payment():
     agent = Payment_Tool()
     result = await agent.on_message_received(test_message)
     print("Demo Payment Result:", result)
+    await close_stripe_client()
 
 
 if __name__ == "__main__":
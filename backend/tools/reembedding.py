@@ -0,0 +1,385 @@
+import sys
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import (
+    ACTIVE_EMBEDDING_METHOD,
+    normalize_embedding_method,
+    get_embedding_extractor
+)
+from tools.enrollment_archive import find_archived_audio
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Fraction of one CPU core the job may use (0.25 = sleep 3x as long as it works)
+DEFAULT_CPU_BUDGET = float(os.getenv("REEMBED_CPU_BUDGET", "0.25"))
+DEFAULT_BATCH_SIZE = 20
+
+
+def init_reembedding_tables(db_path: str):
+    """Create the previous-version store and the job checkpoint table"""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        # Embeddings replaced by a migration, kept for dual-version scoring and rollback
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS voice_embedding_versions (
+                user_id TEXT NOT NULL,
+                embedding_method TEXT NOT NULL,
+                voice_embedding TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, embedding_method)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reembedding_jobs (
+                target_method TEXT PRIMARY KEY,
+                last_row_id INTEGER NOT NULL DEFAULT 0,
+                migrated INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, paused, incomplete, completed
+                last_error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Rows the scan passed but couldn't migrate (no archived audio, extractor
+        # failure); every run retries them after the scan
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reembedding_retries (
+                target_method TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                reason TEXT NOT NULL,  -- skipped, failed
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (target_method, row_id)
+            )
+        ''')
+        conn.commit()
+
+
+def get_reembedding_status(db_path: str, target_method: str = ACTIVE_EMBEDDING_METHOD) -> Dict[str, Any]:
+    """Report checkpoint progress and how many rows still use an outdated method"""
+    init_reembedding_tables(db_path)
+    with sqlite3.connect(db_path) as conn:
+        job = conn.execute('''
+            SELECT last_row_id, migrated, skipped, failed, status, last_error, updated_at
+            FROM reembedding_jobs WHERE target_method = ?
+        ''', (target_method,)).fetchone()
+        methods = conn.execute('''
+            SELECT embedding_method, COUNT(*) FROM voice_auth GROUP BY embedding_method
+        ''').fetchall()
+        retries = dict(conn.execute('''
+            SELECT reason, COUNT(*) FROM reembedding_retries WHERE target_method = ? GROUP BY reason
+        ''', (target_method,)).fetchall())
+
+    outdated = sum(count for method, count in methods
+                   if normalize_embedding_method(method) != target_method)
+    status = {
+        "target_method": target_method,
+        "rows_by_method": {method: count for method, count in methods},
+        "outdated_rows": outdated,
+        "pending_retries": {"skipped": retries.get("skipped", 0), "failed": retries.get("failed", 0)}
+    }
+    if job:
+        status.update({
+            "last_row_id": job[0],
+            "migrated": job[1],
+            "skipped": job[2],
+            "failed": job[3],
+            "status": job[4],
+            "last_error": job[5],
+            "updated_at": job[6]
+        })
+    else:
+        status["status"] = "not_started"
+    return status
+
+
+def run_reembedding_job(db_path: str = "voice_auth.db", target_method: str = ACTIVE_EMBEDDING_METHOD,
+                        cpu_budget: float = DEFAULT_CPU_BUDGET, batch_size: int = DEFAULT_BATCH_SIZE,
+                        stop_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Re-derive embeddings for rows whose embedding_method is older than target_method
+
+    Rows are processed in id order from the last checkpoint. For each row the
+    archived enrollment recording is run through the target extractor; the old
+    embedding is moved into voice_embedding_versions and the row is updated in the
+    same transaction as the checkpoint, so a restart never loses or repeats work.
+    Rows without archived audio or whose extraction failed keep their old embedding
+    and go on the reembedding_retries list, which is retried after the scan (and on
+    every later run); the job is "completed" only once that list is empty.
+
+    Args:
+        db_path: Path to the voice_auth database
+        target_method: Versioned embedding method to migrate to
+        cpu_budget: Fraction of one core to use, enforced by sleeping between rows
+        batch_size: Rows committed per transaction
+        stop_event: Set it to pause the job at the next row boundary
+
+    Returns:
+        Final job status dictionary
+    """
+    init_reembedding_tables(db_path)
+    extractor = get_embedding_extractor(target_method)
+    if extractor is None:
+        raise ValueError(f"No extractor registered for embedding method {target_method}")
+
+    cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO reembedding_jobs (target_method) VALUES (?)
+        ''', (target_method,))
+        conn.execute('''
+            UPDATE reembedding_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE target_method = ?
+        ''', (target_method,))
+        last_row_id = conn.execute('''
+            SELECT last_row_id FROM reembedding_jobs WHERE target_method = ?
+        ''', (target_method,)).fetchone()[0]
+        conn.commit()
+
+    logger.info("Re-embedding started", extra={"target_method": target_method, "from_row": last_row_id,
+                                                "cpu_budget": cpu_budget})
+
+    def stopped() -> bool:
+        return stop_event is not None and stop_event.is_set()
+
+    # Pass 1: scan rows past the checkpoint
+    while not stopped():
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute('''
+                SELECT id, user_id, voice_embedding, embedding_method, file_hash
+                FROM voice_auth WHERE id > ?
+                ORDER BY id LIMIT ?
+            ''', (last_row_id, batch_size)).fetchall()
+        if not rows:
+            break
+
+        outcomes = _reembed_rows(rows, extractor, target_method, cpu_budget, stopped)
+        if outcomes:
+            last_row_id = outcomes[-1]["row_id"]
+        _commit_outcomes(db_path, target_method, outcomes, checkpoint=last_row_id)
+
+    # Pass 2: retry rows the scan (this run or an earlier one) couldn't migrate
+    retry_after = 0
+    while not stopped():
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute('''
+                SELECT v.id, v.user_id, v.voice_embedding, v.embedding_method, v.file_hash
+                FROM reembedding_retries r JOIN voice_auth v ON v.id = r.row_id
+                WHERE r.target_method = ? AND r.row_id > ?
+                ORDER BY r.row_id LIMIT ?
+            ''', (target_method, retry_after, batch_size)).fetchall()
+        if not rows:
+            break
+
+        outcomes = _reembed_rows(rows, extractor, target_method, cpu_budget, stopped)
+        if outcomes:
+            retry_after = outcomes[-1]["row_id"]
+        _commit_outcomes(db_path, target_method, outcomes, checkpoint=None)
+
+    if stopped():
+        _set_job_status(db_path, target_method, "paused")
+        return get_reembedding_status(db_path, target_method)
+
+    with sqlite3.connect(db_path) as conn:
+        # Rows deleted since they were listed can't be retried
+        conn.execute('''
+            DELETE FROM reembedding_retries
+            WHERE target_method = ? AND row_id NOT IN (SELECT id FROM voice_auth)
+        ''', (target_method,))
+        remaining = conn.execute('''
+            SELECT COUNT(*) FROM reembedding_retries WHERE target_method = ?
+        ''', (target_method,)).fetchone()[0]
+        conn.commit()
+
+    _set_job_status(db_path, target_method, "incomplete" if remaining else "completed")
+    return get_reembedding_status(db_path, target_method)
+
+
+def _reembed_rows(rows, extractor, target_method: str, cpu_budget: float, stopped) -> list:
+    """Run the extractor over rows, returning one outcome per row handled before a stop"""
+    outcomes = []
+    for row_id, user_id, old_embedding_json, method, file_hash in rows:
+        if stopped():
+            break
+        outcome = {"row_id": row_id, "user_id": user_id}
+        outcomes.append(outcome)
+
+        if normalize_embedding_method(method) == target_method:
+            outcome["result"] = "current"
+            continue
+
+        audio_path = find_archived_audio(file_hash)
+        if audio_path is None:
+            outcome.update(result="skipped", error="No archived enrollment audio")
+            continue
+
+        # Process CPU covers BLAS/ONNX threads; wall time covers work done in other
+        # processes (e.g. the embedding batcher's workers). Budget against the larger.
+        wall_started, cpu_started = time.perf_counter(), time.process_time()
+        try:
+            result = extractor(audio_path)
+        except Exception as e:
+            result = {"error": str(e)}
+        work_seconds = max(time.perf_counter() - wall_started, time.process_time() - cpu_started)
+
+        if result.get("voice_embedding") is None:
+            outcome.update(result="failed", error=result.get("error") or "extractor returned no embedding")
+        elif normalize_embedding_method(result.get("method")) != target_method:
+            outcome.update(result="failed",
+                           error=result.get("error", "extractor fell back to " + str(result.get("method"))))
+        else:
+            outcome.update(result="migrated", old_method=method, old_embedding=old_embedding_json,
+                           file_hash=file_hash, new_embedding=result["voice_embedding"])
+
+        # Stay within the CPU budget: idle (budget^-1 - 1) times the work just done
+        time.sleep(work_seconds * (1.0 / cpu_budget - 1.0))
+    return outcomes
+
+
+def _commit_outcomes(db_path: str, target_method: str, outcomes: list, checkpoint: Optional[int]):
+    """Write migrated rows, update the retry list and (for the scan) the checkpoint in one transaction"""
+    counts = {"migrated": 0, "skipped": 0, "failed": 0}
+    last_error = None
+
+    with sqlite3.connect(db_path) as conn:
+        for outcome in outcomes:
+            result = outcome["result"]
+            if result == "migrated":
+                # Only if the row still holds the enrollment we embedded; a user who
+                # re-enrolled meanwhile keeps the new enrollment
+                updated = conn.execute('''
+                    UPDATE voice_auth
+                    SET voice_embedding = ?, embedding_method = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND file_hash = ?
+                ''', (json.dumps(outcome["new_embedding"]), target_method, outcome["row_id"],
+                      outcome["file_hash"])).rowcount
+                if updated:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO voice_embedding_versions
+                        (user_id, embedding_method, voice_embedding)
+                        VALUES (?, ?, ?)
+                    ''', (outcome["user_id"], normalize_embedding_method(outcome["old_method"]),
+                          outcome["old_embedding"]))
+                    counts["migrated"] += 1
+                else:
+                    # Retry it against the new enrollment's audio
+                    result = "skipped"
+                    outcome["error"] = "Re-enrolled during migration"
+
+            if result in ("skipped", "failed"):
+                counts[result] += 1
+                if result == "failed":
+                    last_error = f"{outcome['user_id']}: {outcome['error']}"
+                conn.execute('''
+                    INSERT INTO reembedding_retries (target_method, row_id, reason, error)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (target_method, row_id) DO UPDATE SET
+                        reason = excluded.reason, error = excluded.error,
+                        attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                ''', (target_method, outcome["row_id"], result, outcome["error"]))
+            else:
+                conn.execute('''
+                    DELETE FROM reembedding_retries WHERE target_method = ? AND row_id = ?
+                ''', (target_method, outcome["row_id"]))
+
+        conn.execute('''
+            UPDATE reembedding_jobs
+            SET last_row_id = COALESCE(?, last_row_id), migrated = migrated + ?, skipped = skipped + ?,
+                failed = failed + ?, last_error = COALESCE(?, last_error),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE target_method = ?
+        ''', (checkpoint, counts["migrated"], counts["skipped"], counts["failed"],
+              last_error, target_method))
+        conn.commit()
+
+    logger.info("Re-embedding checkpoint", extra={"last_row_id": checkpoint, **counts})
+
+
+def _set_job_status(db_path: str, target_method: str, status: str):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''
+            UPDATE reembedding_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE target_method = ?
+        ''', (status, target_method))
+        conn.commit()
+
+
+class ReembeddingWorker:
+    """Runs the re-embedding job on a low-priority background thread"""
+
+    def __init__(self, db_path: str = "voice_auth.db", cpu_budget: float = DEFAULT_CPU_BUDGET):
+        self.db_path = db_path
+        self.cpu_budget = cpu_budget
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_result = None
+        self.last_error = None
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, target_method: str = ACTIVE_EMBEDDING_METHOD) -> bool:
+        """Start (or resume) the job; returns False if it is already running"""
+        if self.is_running():
+            return False
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(target_method,),
+                                       name="reembedding", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """Pause the job at the next row boundary"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self, target_method: str):
+        try:
+            self.last_result = run_reembedding_job(
+                self.db_path, target_method, cpu_budget=self.cpu_budget, stop_event=self.stop_event
+            )
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Re-embedding job failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-derive voice embeddings after an embedding method upgrade")
+    parser.add_argument("--db", default="voice_auth.db", help="Path to the voice_auth database")
+    parser.add_argument("--target-method", default=ACTIVE_EMBEDDING_METHOD)
+    parser.add_argument("--cpu-budget", type=float, default=DEFAULT_CPU_BUDGET,
+                        help="Fraction of one core to use (0-1)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--status", action="store_true", help="Only print migration status")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(get_reembedding_status(args.db, args.target_method), indent=2))
+        return
+
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+    result = run_reembedding_job(args.db, args.target_method, cpu_budget=args.cpu_budget,
+                                 batch_size=args.batch_size)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Neural speaker embeddings on CPU with ONNX Runtime (optional backend)
+
+Runs a pretrained speaker-verification network (ResNet/ECAPA-TDNN exported to
+ONNX, e.g. from WeSpeaker or 3D-Speaker) on 80-band Kaldi-style log-mel
+filterbanks. Input shape is (batch, frames, 80) and output is one speaker
+vector per row. Utterances are cut into fixed 3 s segments. Segments from any
+number of utterances are stacked into one batched session call, and each
+utterance's embedding is the mean of its L2-normalized segment embeddings.
+
+The network's own speaker vector (e.g. 192-D or 256-D) is stored as is;
+voice_auth accepts native widths for this method and the snapshot zero-pads
+narrower rows, which leaves cosine scores unchanged.
+
+Configuration:
+    VPAY_SPEAKER_MODEL      Path to the fp32 ONNX model
+    VPAY_SPEAKER_MODEL_INT8 1 (default) to run a dynamically int8-quantized copy,
+                            created next to the model on first use
+    ONNX_INTRA_OP_THREADS   Threads per inference call (default 1; requests
+                            already run concurrently in worker threads)
+    ONNX_BATCH_SEGMENTS     Max segments per session call (default 32)
+
+The method's version is a hash of the model file ("onnx_speaker:<sha256 prefix>",
+plus "-int8" for the quantized copy), so swapping the model starts a new version
+that tools/reembedding.py migrates stored rows to, instead of mixing
+embeddings from two models.
+"""
+
+import sys
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import get_audio_hash
+from tools.voice_to_embedded_lite import load_audio, MAX_DURATION, _cosine
+from utils.structured_logging import get_logger
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNXRUNTIME_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+ONNX_EMBEDDING_METHOD = "onnx_speaker"
+
+DEFAULT_MODEL_PATH = os.getenv("VPAY_SPEAKER_MODEL", str(backend_dir / "models" / "speaker_encoder.onnx"))
+USE_INT8 = os.getenv("VPAY_SPEAKER_MODEL_INT8", "1").lower() in ("1", "true", "yes")
+INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "1"))
+BATCH_SEGMENTS = int(os.getenv("ONNX_BATCH_SEGMENTS", "32"))
+
+# Kaldi fbank front end (16 kHz, 25 ms window, 10 ms shift, 80 bands)
+FBANK_SAMPLE_RATE = 16000
+FRAME_LENGTH = 400
+FRAME_SHIFT = 160
+FBANK_N_FFT = 512
+N_FBANK = 80
+FBANK_LOW_FREQ = 20.0
+PREEMPHASIS = 0.97
+FBANK_EPS = np.finfo(np.float32).eps
+
+# 3 s segments with 50% overlap
+SEGMENT_FRAMES = 300
+SEGMENT_HOP = 150
+
+
+
+def onnxruntime_available() -> bool:
+    return ONNXRUNTIME_AVAILABLE
+
+
+@lru_cache(maxsize=8)
+def _file_sha256(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def onnx_embedding_method(model_path: str = DEFAULT_MODEL_PATH, quantized: bool = USE_INT8) -> str:
+    """
+    Versioned method name of embeddings produced by a model file
+
+    Raises:
+        FileNotFoundError: If the model file doesn't exist
+    """
+    return f"{ONNX_EMBEDDING_METHOD}:{model_version(model_path)}{'-int8' if quantized else ''}"
+
+
+def model_version(model_path: str) -> str:
+    """First 12 hex digits of the model file's SHA-256 (cached per path, mtime and size)"""
+    stat = os.stat(model_path)
+    return _file_sha256(os.path.abspath(model_path), stat.st_mtime_ns, stat.st_size)[:12]
+
+
+def quantized_model_path(model_path: str) -> str:
+    """<model>.<version>.int8.onnx: a replaced fp32 model never reuses the old int8 file"""
+    return str(Path(model_path).with_suffix(f".{model_version(model_path)}.int8.onnx"))
+
+
+def _mel(freq):
+    return 1127.0 * np.log(1.0 + np.asarray(freq, dtype=np.float64) / 700.0)
+
+
+@lru_cache(maxsize=None)
+def kaldi_mel_banks() -> np.ndarray:
+    """Triangular HTK-mel filters, shape (N_FBANK, FBANK_N_FFT // 2 + 1), as in Kaldi"""
+    mel_low = _mel(FBANK_LOW_FREQ)
+    mel_high = _mel(FBANK_SAMPLE_RATE / 2.0)
+    delta = (mel_high - mel_low) / (N_FBANK + 1)
+    edges = mel_low + delta * np.arange(N_FBANK + 2)
+
+    bin_mel = _mel(np.arange(FBANK_N_FFT // 2 + 1) * FBANK_SAMPLE_RATE / FBANK_N_FFT)
+    left, center, right = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    up = (bin_mel - left) / (center - left)
+    down = (right - bin_mel) / (right - center)
+    return np.maximum(0.0, np.minimum(up, down))
+
+
+@lru_cache(maxsize=None)
+def povey_window() -> np.ndarray:
+    n = np.arange(FRAME_LENGTH)
+    return (0.5 - 0.5 * np.cos(2 * np.pi * n / (FRAME_LENGTH - 1))) ** 0.85
+
+
+def compute_fbank(y: np.ndarray) -> np.ndarray:
+    """
+    Kaldi-compatible log-mel filterbank with mean normalization
+
+    Args:
+        y: Mono signal in [-1, 1] at FBANK_SAMPLE_RATE
+
+    Returns:
+        float32 array of shape (frames, N_FBANK)
+    """
+    # Kaldi-trained models expect 16-bit sample scale
+    y = np.asarray(y, dtype=np.float64) * 32768.0
+    if len(y) < FRAME_LENGTH:
+        y = np.pad(y, (0, FRAME_LENGTH - len(y)))
+
+    frames = np.lib.stride_tricks.sliding_window_view(y, FRAME_LENGTH)[::FRAME_SHIFT]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    frames = np.concatenate((frames[:, :1] * (1.0 - PREEMPHASIS), frames[:, 1:] - PREEMPHASIS * frames[:, :-1]), axis=1)
+    power = np.abs(np.fft.rfft(frames * povey_window(), n=FBANK_N_FFT, axis=1)) ** 2
+
+    fbank = np.log(np.maximum(power @ kaldi_mel_banks().T, FBANK_EPS))
+    return (fbank - fbank.mean(axis=0)).astype(np.float32)
+
+
+def split_segments(fbank: np.ndarray) -> np.ndarray:
+    """Fixed-length windows of an utterance; short ones are repeated to fill one window"""
+    if len(fbank) < SEGMENT_FRAMES:
+        return np.resize(fbank, (SEGMENT_FRAMES, fbank.shape[1]))[None]
+    starts = list(range(0, len(fbank) - SEGMENT_FRAMES + 1, SEGMENT_HOP))
+    if starts[-1] + SEGMENT_FRAMES < len(fbank):
+        starts.append(len(fbank) - SEGMENT_FRAMES)
+    return np.stack([fbank[start:start + SEGMENT_FRAMES] for start in starts])
+
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norm == 0, 1.0, norm)
+
+
+def quantize_speaker_model(model_path: str, output_path: Optional[str] = None) -> str:
+    """
+    Dynamically quantize a model's weights to int8 (activations stay float)
+
+    Args:
+        model_path: fp32 ONNX model
+        output_path: Where to write the quantized model (default: quantized_model_path)
+
+    Returns:
+        Path of the quantized model
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_path = output_path or quantized_model_path(model_path)
+    # Written under a temporary name, so a worker never loads a half-written model
+    tmp_path = str(Path(output_path).with_suffix(f".tmp-{os.getpid()}.onnx"))
+    quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, output_path)
+    logger.info(f"Quantized {model_path} -> {output_path}")
+    return output_path
+
+
+class SpeakerEncoder:
+    """ONNX Runtime session for the speaker model plus its batched front end"""
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, quantized: bool = USE_INT8,
+                 intra_op_threads: int = INTRA_OP_THREADS, batch_segments: int = BATCH_SEGMENTS):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise RuntimeError("onnxruntime not installed. Install with: pip install onnxruntime")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Speaker model not found: {model_path} (set VPAY_SPEAKER_MODEL)")
+
+        self.method = onnx_embedding_method(model_path, quantized)
+        if quantized:
+            # Keyed by the fp32 model's hash, the same version self.method carries
+            quantized_path = quantized_model_path(model_path)
+            if not os.path.exists(quantized_path):
+                quantize_speaker_model(model_path, quantized_path)
+            model_path = quantized_path
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, intra_op_threads)
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.model_path = model_path
+        self.quantized = quantized
+        self.batch_segments = max(1, batch_segments)
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def embed_batch(self, signals: List[np.ndarray]) -> np.ndarray:
+        """
+        Speaker embeddings for several utterances with as few session calls as possible
+
+        Args:
+            signals: Mono signals at FBANK_SAMPLE_RATE
+
+        Returns:
+            Array of shape (len(signals), model_dims), rows L2-normalized
+        """
+        segments = [split_segments(compute_fbank(y)) for y in signals]
+        owners = np.repeat(np.arange(len(signals)), [len(s) for s in segments])
+        stacked = np.concatenate(segments)
+
+        outputs = [
+            self.session.run([self.output_name], {self.input_name: stacked[start:start + self.batch_segments]})[0]
+            for start in range(0, len(stacked), self.batch_segments)
+        ]
+        segment_embeddings = _l2_normalize(np.concatenate(outputs).reshape(len(stacked), -1))
+
+        sums = np.zeros((len(signals), segment_embeddings.shape[1]))
+        np.add.at(sums, owners, segment_embeddings)
+        return _l2_normalize(sums)
+
+    def embed(self, y: np.ndarray) -> np.ndarray:
+        return self.embed_batch([y])[0]
+
+
+_encoder: Optional[SpeakerEncoder] = None
+_encoder_lock = threading.Lock()
+
+
+def get_speaker_encoder() -> SpeakerEncoder:
+    """Process-wide encoder, session created on first use"""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = SpeakerEncoder()
+        return _encoder
+
+
+def current_onnx_embedding_method() -> str:
+    """Method of the model this process embeds with (loaded encoder, else the configured file)"""
+    if _encoder is not None:
+        return _encoder.method
+    return onnx_embedding_method()
+
+
+def generate_onnx_voice_embedding(file_path: str) -> Dict[str, Any]:
+    """
+    Same result format as generate_100d_voice_embedding, from the neural speaker model
+
+    Failures return voice_embedding None with the error, rather than a hash-based
+    stand-in that would be stored or scored as if it were a voice.
+    """
+    try:
+        encoder = get_speaker_encoder()
+        y = load_audio(file_path, sr=FBANK_SAMPLE_RATE, duration=MAX_DURATION)
+        features = encoder.embed(y)
+
+        return {
+            "voice_embedding": features.round(6).tolist(),
+            "method": encoder.method,
+            "dimensions": len(features),
+            "file_hash": get_audio_hash(file_path)
+        }
+
+    except Exception as e:
+        logger.error(f"Speaker model embedding failed: {e}")
+        # No method: a failure must never normalize to (and be stored as) the model's version
+        return {
+            "voice_embedding": None,
+            "method": None,
+            "dimensions": 0,
+            "error": f"Speaker model embedding failed: {e}"
+        }
+
+
+def benchmark(dataset_dir: str, model_path: str = DEFAULT_MODEL_PATH) -> Dict[str, Any]:
+    """
+    Latency and EER of the handcrafted extractors vs the speaker model (fp32 and int8)
+
+    Every pair of recordings is scored with tools/verification_eval.py; pairs
+    from the same speaker directory are genuine trials, the rest impostor trials.
+    """
+    from tools.voice_to_embedded import CURRENT_EMBEDDING_METHOD, generate_100d_voice_embedding
+    from tools.voice_to_embedded_lite import CURRENT_LITE_EMBEDDING_METHOD, generate_100d_voice_embedding_lite
+    from tools.verification_eval import load_corpus, evaluate_embeddings
+
+    items = load_corpus(dataset_dir)
+    speakers = [speaker for speaker, _ in items]
+    if len(set(speakers)) < 2:
+        raise ValueError("Need recordings from at least two speakers")
+
+    def score(embeddings: np.ndarray) -> Dict[str, Any]:
+        result = evaluate_embeddings(embeddings, speakers)
+        return {"eer": round(result["eer"], 4), "threshold": round(result["eer_threshold"], 4)}
+
+    def latency(seconds: List[float]) -> Dict[str, float]:
+        ms = np.array(seconds) * 1000
+        return {"first_ms": round(float(ms[0]), 1), "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1)}
+
+    results = {"recordings": len(items), "speakers": len(set(speakers)), "methods": {}}
+
+    for method, extract in ((CURRENT_EMBEDDING_METHOD, generate_100d_voice_embedding),
+                            (CURRENT_LITE_EMBEDDING_METHOD, generate_100d_voice_embedding_lite)):
+        embeddings, seconds = [], []
+        for _, path in items:
+            started = time.perf_counter()
+            embeddings.append(extract(path)["voice_embedding"])
+            seconds.append(time.perf_counter() - started)
+        results["methods"][method] = {**score(np.array(embeddings)), **latency(seconds)}
+
+    if not ONNXRUNTIME_AVAILABLE or not os.path.exists(model_path):
+        results["methods"][ONNX_EMBEDDING_METHOD] = {"error": "onnxruntime or speaker model not available"}
+        return results
+
+    signals = [load_audio(path, sr=FBANK_SAMPLE_RATE) for _, path in items]
+    for quantized in (False, True):
+        encoder = SpeakerEncoder(model_path, quantized=quantized)
+        seconds, embeddings = [], []
+        for y in signals:
+            started = time.perf_counter()
+            embeddings.append(encoder.embed(y))
+            seconds.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        native = encoder.embed_batch(signals)
+        batch_seconds = time.perf_counter() - started
+
+        results["methods"][encoder.method] = {
+            **score(np.array(embeddings)),
+            "eer_batched": score(native)["eer"],
+            "dimensions": native.shape[1],
+            **latency(seconds),
+            "batched_ms_per_recording": round(batch_seconds * 1000 / len(signals), 1),
+            "model_mb": round(os.path.getsize(encoder.model_path) / 1e6, 1)
+        }
+
+    fp32 = SpeakerEncoder(model_path, quantized=False).embed_batch(signals)
+    int8 = SpeakerEncoder(model_path, quantized=True).embed_batch(signals)
+    results["int8_vs_fp32_min_cosine"] = round(min(_cosine(a, b) for a, b in zip(fp32, int8)), 5)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python tools/speaker_encoder_onnx.py <dataset_dir> [model.onnx]")
+        print("  dataset_dir holds one sub-directory of recordings per speaker")
+        sys.exit(1)
+    model = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MODEL_PATH
+    print(json.dumps(benchmark(sys.argv[1], model), indent=2))
@@ -0,0 +1,746 @@
+"""
+Incremental version of the lite 100-D voice embedding
+
+StreamingVoiceEmbedder consumes PCM as it arrives and keeps only running
+statistics, so the embedding is ready as soon as the last chunk is fed and a
+long recording never has to be held in memory:
+
+- MFCC, chroma, mel, spectral shape, energy and pitch features use running
+  moments (Welford / Chan merges); percentiles come from fixed-resolution
+  histograms.
+- HPSS uses a 31-frame median window, so it needs 15 frames of lookahead; the
+  harmonic signal is rebuilt by streaming overlap-add.
+- Log-mel (MFCC, onset) and chroma statistics trail the input by a ~3 s
+  settling window, so the 80 dB floor and the tuning estimate have seen the
+  start of the utterance; clips shorter than that are exact.
+- Tempo, beat and onset features need the whole onset envelope, which is kept
+  (two floats per STFT frame, ~40 KB per minute of audio).
+
+Compared with the whole-clip lite extractor, three things are approximated:
+- Past the settling window, the 80 dB log-mel floor and the tuning are
+  estimated from the audio seen so far.
+- The tuning estimate and the percentiles come from fixed-resolution
+  histograms.
+- Input at other sample rates goes through a windowed-sinc resampler instead
+  of an FFT resample. The result is scored as audio_features_lite:v1, and
+`python tools/streaming_embedding.py` checks the parity.
+"""
+import sys
+import os
+import json
+import time
+import wave
+import hashlib
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import normalize_voice_features
+from tools.voice_to_embedded_lite import (
+    CURRENT_LITE_EMBEDDING_METHOD, SAMPLE_RATE, N_FFT, HOP_LENGTH, MAX_DURATION,
+    AMIN, TOP_DB, TINY, PITCH_FMIN,
+    hann_window, mel_filterbank, dct_matrix, chroma_filterbank, fft_frequencies,
+    frame_autocorrelation, yin_max_period, yin, spectral_shape, beat_track, onset_detect,
+    spectral_peaks, tuning_residuals, TUNING_BINS,
+    _median_filter, load_audio, compute_raw_voice_features_lite, _cosine
+)
+
+HPSS_KERNEL = 31
+# Frames wait this long (~3 s) before entering the log-mel and chroma statistics, so the
+# 80 dB floor and the tuning estimate have seen the loudest part of an utterance's start
+SETTLE_FRAMES = int(os.getenv("STREAMING_SETTLE_FRAMES", "128"))
+# Shorter streams carry no usable voice statistics, so finish() rejects them
+MIN_STREAM_SECONDS = float(os.getenv("STREAMING_MIN_SECONDS", "0.5"))
+
+
+class RunningStats:
+    """Streaming mean/variance/min/max per component (Chan's parallel Welford update)"""
+
+    def __init__(self, size: int = 1):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+
+    def update(self, values):
+        """Add a batch of observations, shape (n, size) (or (n,) when size is 1)"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.mean))
+        n = len(values)
+        if n == 0:
+            return
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+
+    @property
+    def var(self) -> np.ndarray:
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+
+class StreamingHistogram:
+    """Fixed-bin histogram for approximate percentiles of values in [low, high]"""
+
+    def __init__(self, low: float, high: float, bins: int):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        index = np.clip(((values - self.low) / self.width).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(index, minlength=self.bins)
+
+    def percentile(self, q: float) -> float:
+        """Value at rank q/100 * (n - 1), interpolated inside its bin"""
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        rank = q / 100.0 * (total - 1)
+        cumulative = np.cumsum(self.counts)
+        b = int(np.searchsorted(cumulative, rank, side='right'))
+        before = cumulative[b - 1] if b > 0 else 0
+        within = (rank - before + 0.5) / self.counts[b]
+        return float(self.low + (b + min(max(within, 0.0), 1.0)) * self.width)
+
+    def fraction_above(self, value: float) -> float:
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        b = int(np.clip((value - self.low) / self.width, 0, self.bins - 1))
+        partial = self.counts[b] * (1.0 - ((value - self.low) / self.width - b))
+        return float((self.counts[b + 1:].sum() + max(partial, 0.0)) / total)
+
+
+class StreamingTuning:
+    """
+    Running librosa.estimate_tuning: a (peak magnitude x tuning deviation)
+    histogram, so the median-magnitude cut can be applied at any time
+    """
+
+    def __init__(self, mag_bins: int = 400, log_low: float = -20.0, log_high: float = 20.0):
+        self.log_low = log_low
+        self.log_width = (log_high - log_low) / mag_bins
+        self.mag_bins = mag_bins
+        self.counts = np.zeros((mag_bins, len(TUNING_BINS) - 1), dtype=np.int64)
+
+    def update(self, power: np.ndarray):
+        """Add the spectral peaks of power frames, shape (freq, n_frames)"""
+        pitches, mags = spectral_peaks(power)
+        keep = pitches > 0
+        if not keep.any():
+            return
+        mag_index = np.clip(((np.log10(np.maximum(mags[keep], TINY)) - self.log_low) / self.log_width).astype(np.int64),
+                            0, self.mag_bins - 1)
+        residual_index = np.clip(np.searchsorted(TUNING_BINS, tuning_residuals(pitches[keep]), side='right') - 1,
+                                 0, len(TUNING_BINS) - 2)
+        np.add.at(self.counts, (mag_index, residual_index), 1)
+
+    def estimate(self) -> float:
+        by_magnitude = self.counts.sum(axis=1)
+        total = by_magnitude.sum()
+        if total == 0:
+            return 0.0
+        median_bin = int(np.searchsorted(np.cumsum(by_magnitude), (total - 1) / 2.0, side='right'))
+        residuals = self.counts[median_bin:].sum(axis=0)
+        return float(TUNING_BINS[np.argmax(residuals)])
+
+
+class StreamingResampler:
+    """Hann-windowed sinc interpolation that can be fed in arbitrary chunks"""
+
+    def __init__(self, orig_sr: int, target_sr: int, half_width: int = 32):
+        self.ratio = target_sr / orig_sr
+        self.cutoff = min(1.0, self.ratio)
+        self.half_width = half_width
+        # Input history; buffer[0] is input sample buffer_start (negative indices are zeros)
+        self.buffer = np.zeros(half_width, dtype=np.float64)
+        self.buffer_start = -half_width
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, x: np.ndarray, final: bool = False) -> np.ndarray:
+        self.buffer = np.concatenate((self.buffer, np.asarray(x, dtype=np.float64)))
+        self.n_in += len(x)
+
+        if final:
+            self.buffer = np.concatenate((self.buffer, np.zeros(self.half_width + 1)))
+            end = int(np.ceil(self.n_in * self.ratio))
+        else:
+            # Outputs whose kernel support lies entirely within the received input
+            last_input = self.buffer_start + len(self.buffer) - 1
+            end = int(np.floor((last_input - self.half_width + 1) * self.ratio))
+        if end <= self.n_out:
+            return np.zeros(0, dtype=np.float32)
+
+        positions = np.arange(self.n_out, end) / self.ratio
+        taps = np.floor(positions).astype(np.int64)[:, None] + np.arange(-self.half_width + 1, self.half_width + 1)
+        distance = positions[:, None] - taps
+        kernel = self.cutoff * np.sinc(self.cutoff * distance) * \
+            (0.5 + 0.5 * np.cos(np.pi * np.clip(distance / self.half_width, -1, 1)))
+        out = np.sum(self.buffer[taps - self.buffer_start] * kernel, axis=1)
+        self.n_out = end
+
+        keep_from = int(np.floor(self.n_out / self.ratio)) - self.half_width
+        if keep_from > self.buffer_start:
+            self.buffer = self.buffer[keep_from - self.buffer_start:]
+            self.buffer_start = keep_from
+        return out.astype(np.float32)
+
+
+class StreamingVoiceEmbedder:
+    """
+    Accumulates the lite embedding features chunk by chunk.
+
+    Feed float samples with feed() or little-endian 16-bit PCM with
+    feed_pcm16(), then call finish() for the embedding.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, max_duration: Optional[float] = MAX_DURATION):
+        self.input_rate = sample_rate
+        self.resampler = StreamingResampler(sample_rate, SAMPLE_RATE) if sample_rate != SAMPLE_RATE else None
+        # Same cut-off as librosa.load(duration=...): counted at the input rate
+        self.max_input_samples = int(max_duration * sample_rate) if max_duration else None
+        self.input_samples = 0
+        self.truncated = False
+        self.finished = False
+        self.hash = hashlib.md5()
+        self.pcm_carry = b''
+
+        # Centered framing: frames start at padded index t * HOP_LENGTH
+        self.pad = N_FFT // 2
+        self.buffer = np.zeros(self.pad, dtype=np.float32)
+        self.buffer_start = 0  # padded index of buffer[0]
+        self.n_samples = 0  # real samples (at SAMPLE_RATE) received
+        self.n_frames = 0
+
+        self.mel_fb = mel_filterbank(SAMPLE_RATE)
+        self.mel13_fb = mel_filterbank(SAMPLE_RATE, N_FFT, 13)
+        self.dct = dct_matrix()
+        self.max_period = yin_max_period(SAMPLE_RATE, PITCH_FMIN)
+
+        # Sample-level statistics
+        self.sample_stats = RunningStats()
+        self.power_stats = RunningStats()
+        self.abs_sum = 0.0
+        self.peak = 0.0
+        self.sample_histogram = StreamingHistogram(-1.0, 1.0, 1 << 16)
+        self.abs_diff_stats = RunningStats()
+        self.last_sample = None
+
+        # Frame-level statistics
+        self.mfcc_stats = RunningStats(13)
+        self.chroma_stats = RunningStats(12)
+        self.mel13_stats = RunningStats(13)
+        self.centroid_stats = RunningStats()
+        self.rolloff_stats = RunningStats()
+        self.bandwidth_stats = RunningStats()
+        self.zcr_stats = RunningStats()
+        self.rms_stats = RunningStats()
+        self.rms_histogram = StreamingHistogram(0.0, 1.0, 1 << 17)
+        self.magnitude_stats = RunningStats()
+        self.frame_magnitude_stats = RunningStats()
+        self.magnitude_bin_sum = np.zeros(N_FFT // 2 + 1)
+        self.frame_energy_stats = RunningStats()
+        self.frame_energy_diff_stats = RunningStats()
+        self.last_frame_energy = None
+        self.f0_stats = RunningStats()
+        self.f0_histogram = StreamingHistogram(0.0, 1000.0, 20000)
+        self.f0_diff_stats = RunningStats()
+        self.last_f0 = None
+
+        # Settling window of raw log-mel and power frames
+        self.pending_mel_db: List[np.ndarray] = []
+        self.pending_power: List[np.ndarray] = []
+        self.tuning = StreamingTuning()
+
+        # Onset envelopes (spectral flux of the log-mel spectrogram), one value per frame
+        self.max_db = -np.inf
+        self.last_mel_db = None
+        self.flux_mean: List[float] = []
+        self.flux_median: List[float] = []
+
+        # HPSS: magnitude/STFT frames inside the median window, streaming overlap-add
+        self.hpss_frames: Dict[int, tuple] = {}
+        self.hpss_next = 0
+        self.ola = np.zeros(N_FFT)
+        self.ola_weight = np.zeros(N_FFT)
+        self.ola_start = 0  # padded index of ola[0]
+        self.delay = np.zeros(0, dtype=np.float32)  # real samples waiting for their harmonic part
+        self.delay_start = 0
+        self.harmonic_sums = np.zeros(6)  # n, sum h, sum h^2, sum |h|, sum p, sum p^2
+        self.cross_sum = 0.0
+        self.percussive_abs_sum = 0.0
+
+    # -- input ---------------------------------------------------------------
+
+    def feed_pcm16(self, data: bytes):
+        """Feed little-endian signed 16-bit mono PCM (chunks may split samples)"""
+        self.hash.update(data)
+        data = self.pcm_carry + data
+        usable = len(data) - len(data) % 2
+        self.pcm_carry = data[usable:]
+        self._feed(np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0)
+
+    def feed(self, samples: np.ndarray):
+        """Feed mono float samples in [-1, 1] at the input sample rate"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self.hash.update(samples.tobytes())
+        self._feed(samples)
+
+    def _feed(self, samples: np.ndarray):
+        if self.finished:
+            raise RuntimeError("Stream already finished")
+        if self.max_input_samples is not None:
+            room = self.max_input_samples - self.input_samples
+            if len(samples) > room:
+                samples = samples[:max(room, 0)]
+                self.truncated = True
+        self.input_samples += len(samples)
+        if len(samples) == 0:
+            return
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        self._process_samples(samples)
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Flush the tail and return the embedding in generate_100d_voice_embedding_lite's format
+
+        Raises:
+            ValueError: If less than MIN_STREAM_SECONDS of audio was received
+        """
+        if not self.finished:
+            if self.resampler is not None:
+                self._process_samples(self.resampler.process(np.zeros(0, dtype=np.float32), final=True))
+            self.finished = True
+            self.buffer = np.concatenate((self.buffer, np.zeros(self.pad, dtype=np.float32)))
+            self._consume_frames(final=True)
+            self._emit_hpss(final=True)
+
+        if self.n_samples < MIN_STREAM_SECONDS * SAMPLE_RATE:
+            raise ValueError(f"Audio stream too short: {self.n_samples / SAMPLE_RATE:.3f} s received, "
+                             f"at least {MIN_STREAM_SECONDS} s required")
+
+        features = normalize_voice_features(self.raw_features())
+        return {
+            "voice_embedding": features.round(6).tolist(),
+            "method": CURRENT_LITE_EMBEDDING_METHOD,
+            "dimensions": len(features),
+            "file_hash": self.hash.hexdigest(),
+            "seconds": round(self.n_samples / SAMPLE_RATE, 3),
+            "truncated": self.truncated
+        }
+
+    # -- sample level --------------------------------------------------------
+
+    def _process_samples(self, y: np.ndarray):
+        if len(y) == 0:
+            return
+        y64 = y.astype(np.float64)
+        self.sample_stats.update(y64)
+        self.power_stats.update(y64 ** 2)
+        self.abs_sum += float(np.abs(y64).sum())
+        self.peak = max(self.peak, float(np.max(np.abs(y64))))
+        self.sample_histogram.update(y64)
+        previous = y64 if self.last_sample is None else np.concatenate(([self.last_sample], y64))
+        self.abs_diff_stats.update(np.abs(np.diff(previous)))
+        self.last_sample = float(y64[-1])
+
+        self.n_samples += len(y)
+        self.buffer = np.concatenate((self.buffer, y))
+        self.delay = np.concatenate((self.delay, y))
+        self._consume_frames()
+
+    # -- frame level ---------------------------------------------------------
+
+    def _consume_frames(self, final: bool = False):
+        available = self.buffer_start + len(self.buffer)
+        if final:
+            total = 1 + self.n_samples // HOP_LENGTH
+        else:
+            total = max(0, (available - N_FFT) // HOP_LENGTH + 1)
+        if total <= self.n_frames:
+            return
+
+        first = self.n_frames
+        offset = first * HOP_LENGTH - self.buffer_start
+        frames = np.lib.stride_tricks.sliding_window_view(self.buffer[offset:], N_FFT)[::HOP_LENGTH][:total - first]
+        self._process_frames(frames, first, final)
+        self.n_frames = total
+
+        keep_from = self.n_frames * HOP_LENGTH
+        if keep_from > self.buffer_start:
+            self.buffer = self.buffer[keep_from - self.buffer_start:]
+            self.buffer_start = keep_from
+
+    def _process_frames(self, frames: np.ndarray, first: int, final: bool):
+        n = len(frames)
+        stft = np.fft.rfft(frames * hann_window(), axis=-1)
+        magnitude = np.abs(stft)
+        power = magnitude ** 2
+
+        # Log-mel and chroma wait in the settling window (see SETTLE_FRAMES)
+        mel_db = 10.0 * np.log10(np.maximum(AMIN, power @ self.mel_fb.T))
+        self.max_db = max(self.max_db, float(mel_db.max()))
+        self.tuning.update(power.T)
+        self.pending_mel_db.extend(mel_db)
+        self.pending_power.extend(power)
+        self._commit_settled(final)
+
+        self.mel13_stats.update(power @ self.mel13_fb.T)
+
+        centroid, rolloff, bandwidth = spectral_shape(magnitude.T, SAMPLE_RATE)
+        self.centroid_stats.update(centroid)
+        self.rolloff_stats.update(rolloff)
+        self.bandwidth_stats.update(bandwidth)
+
+        self.zcr_stats.update(self._zero_crossing_rate(frames, first))
+
+        frame_rms = np.sqrt(np.mean(np.abs(frames) ** 2, axis=-1))
+        self.rms_stats.update(frame_rms)
+        self.rms_histogram.update(frame_rms)
+
+        self.magnitude_stats.update(magnitude.ravel())
+        self.frame_magnitude_stats.update(magnitude.sum(axis=1))
+        self.magnitude_bin_sum += magnitude.sum(axis=0)
+
+        frame_energy = power.sum(axis=1)
+        self.frame_energy_stats.update(frame_energy)
+        previous_energy = frame_energy if self.last_frame_energy is None else np.concatenate(([self.last_frame_energy], frame_energy))
+        self.frame_energy_diff_stats.update(np.diff(previous_energy))
+        self.last_frame_energy = float(frame_energy[-1])
+
+        f0 = yin(None, sr=SAMPLE_RATE, frames=frames,
+                 autocorrelation=frame_autocorrelation(frames, self.max_period))
+        f0 = f0[f0 > 0]
+        if len(f0):
+            self.f0_stats.update(f0)
+            self.f0_histogram.update(f0)
+            previous_f0 = f0 if self.last_f0 is None else np.concatenate(([self.last_f0], f0))
+            self.f0_diff_stats.update(np.diff(previous_f0))
+            self.last_f0 = float(f0[-1])
+
+        for i in range(n):
+            self.hpss_frames[first + i] = (stft[i], magnitude[i].astype(np.float32))
+        self._emit_hpss(final=False)
+
+    def _commit_settled(self, final: bool):
+        count = len(self.pending_mel_db) - (0 if final else SETTLE_FRAMES)
+        if count <= 0:
+            return
+        mel_db = np.maximum(np.array(self.pending_mel_db[:count]), self.max_db - TOP_DB)
+        power = np.array(self.pending_power[:count])
+        del self.pending_mel_db[:count]
+        del self.pending_power[:count]
+
+        self.mfcc_stats.update(mel_db @ self.dct.T)
+
+        previous = mel_db if self.last_mel_db is None else np.vstack((self.last_mel_db, mel_db))
+        flux = np.maximum(0.0, previous[1:] - previous[:-1])
+        self.flux_mean.extend(flux.mean(axis=1).tolist())
+        self.flux_median.extend(np.median(flux, axis=1).tolist())
+        self.last_mel_db = mel_db[-1:]
+
+        chroma_fb = chroma_filterbank(SAMPLE_RATE, N_FFT, round(self.tuning.estimate(), 2))
+        chroma = power @ chroma_fb.T
+        peak = np.max(chroma, axis=1, keepdims=True)
+        self.chroma_stats.update(chroma / np.where(peak < TINY, 1.0, peak))
+
+    def _zero_crossing_rate(self, frames: np.ndarray, first: int) -> np.ndarray:
+        """librosa pads with edge values for ZCR, so crossings touching the zero padding don't count"""
+        signs = np.signbit(np.where(np.abs(frames) <= 1e-10, 0.0, frames))
+        crossings = signs[:, 1:] != signs[:, :-1]
+        starts = (first + np.arange(len(frames)))[:, None] * HOP_LENGTH
+        left = starts + np.arange(N_FFT - 1)  # padded index of the earlier sample of each pair
+        valid = (left >= self.pad) & (left + 1 < self.pad + self.n_samples)
+        return np.sum(crossings & valid, axis=1) / N_FFT
+
+    # -- HPSS ----------------------------------------------------------------
+
+    def _emit_hpss(self, final: bool):
+        half = HPSS_KERNEL // 2
+        if final:
+            last = self.n_frames - 1
+            emit_until = last + 1
+        else:
+            last = max(self.hpss_frames) if self.hpss_frames else -1
+            emit_until = last - half + 1
+        if emit_until <= self.hpss_next:
+            return
+
+        targets = np.arange(self.hpss_next, emit_until)
+        window = targets[:, None] + np.arange(-half, half + 1)
+        if final:
+            period = 2 * (last + 1)
+            window = np.mod(window, period)
+            window = np.where(window > last, period - 1 - window, window)
+        else:
+            window = np.where(window < 0, -window - 1, window)
+
+        stacked = np.stack([np.stack([self.hpss_frames[i][1] for i in row]) for row in window])
+        harmonic = np.partition(stacked, half, axis=1)[:, half, :].astype(np.float64)
+
+        magnitude = np.stack([self.hpss_frames[t][1] for t in targets])
+        percussive = _median_filter(magnitude, HPSS_KERNEL, axis=1).astype(np.float64)
+        stft = np.stack([self.hpss_frames[t][0] for t in targets])
+
+        harmonic_power = harmonic ** 2
+        silent = np.maximum(harmonic, percussive) < TINY
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mask = np.where(silent, 0.5, harmonic_power / (harmonic_power + percussive ** 2))
+        segments = np.fft.irfft(stft * mask, n=N_FFT, axis=-1) * hann_window()
+
+        self._overlap_add(segments, int(targets[0]), final)
+        self.hpss_next = emit_until
+
+        # Keep the frames later windows (and the left reflection) still need
+        keep_from = self.hpss_next - half
+        for index in [i for i in self.hpss_frames if i < keep_from]:
+            del self.hpss_frames[index]
+
+    def _overlap_add(self, segments: np.ndarray, first: int, final: bool):
+        window_sq = hann_window() ** 2
+        end = (first + len(segments) - 1) * HOP_LENGTH + N_FFT
+        if end - self.ola_start > len(self.ola):
+            grow = end - self.ola_start - len(self.ola)
+            self.ola = np.concatenate((self.ola, np.zeros(grow)))
+            self.ola_weight = np.concatenate((self.ola_weight, np.zeros(grow)))
+        for i, segment in enumerate(segments):
+            start = (first + i) * HOP_LENGTH - self.ola_start
+            self.ola[start:start + N_FFT] += segment
+            self.ola_weight[start:start + N_FFT] += window_sq
+
+        # Samples before the next frame's start receive no more contributions
+        done = (self.pad + self.n_samples) if final else (first + len(segments)) * HOP_LENGTH
+        count = done - self.ola_start
+        if count <= 0:
+            return
+        out = self.ola[:count].copy()
+        weight = self.ola_weight[:count]
+        nonzero = weight > TINY
+        out[nonzero] /= weight[nonzero]
+
+        # Padded index -> real sample index; drop the centering pad
+        real_start = self.ola_start - self.pad
+        if real_start < 0:
+            out = out[-real_start:]
+            real_start = 0
+        self._accumulate_harmonic(out, real_start)
+
+        self.ola = self.ola[count:]
+        self.ola_weight = self.ola_weight[count:]
+        self.ola_start = done
+
+    def _accumulate_harmonic(self, harmonic: np.ndarray, real_start: int):
+        if len(harmonic) == 0:
+            return
+        offset = real_start - self.delay_start
+        y = self.delay[offset:offset + len(harmonic)].astype(np.float64)
+        harmonic = harmonic[:len(y)]
+        percussive = y - harmonic  # istft is linear and the masks sum to one
+        self.harmonic_sums += [len(y), harmonic.sum(), (harmonic ** 2).sum(), np.abs(harmonic).sum(),
+                               percussive.sum(), (percussive ** 2).sum()]
+        self.cross_sum += float((harmonic * percussive).sum())
+        self.percussive_abs_sum += float(np.abs(percussive).sum())
+
+        consumed = offset + len(y)
+        self.delay = self.delay[consumed:]
+        self.delay_start += consumed
+
+    # -- result --------------------------------------------------------------
+
+    def raw_features(self) -> List[float]:
+        """The 100 unnormalized features accumulated so far, in compute_raw_voice_features order"""
+        duration = self.n_samples / SAMPLE_RATE
+        features = []
+
+        features.extend(self.mfcc_stats.mean)
+        features.extend(self.mfcc_stats.std)
+        features.extend(self.chroma_stats.mean)
+
+        features.extend([
+            self.centroid_stats.mean[0], self.centroid_stats.std[0],
+            self.rolloff_stats.mean[0], self.rolloff_stats.std[0],
+            self.bandwidth_stats.mean[0], self.bandwidth_stats.std[0],
+            self.zcr_stats.mean[0]
+        ])
+
+        n_frames = max(self.n_frames, 1)
+        onset_mean = np.pad(np.array(self.flux_mean), (1 + N_FFT // (2 * HOP_LENGTH), 0))[:n_frames]
+        onset_median = np.pad(np.array(self.flux_median), (1 + N_FFT // (2 * HOP_LENGTH), 0))[:n_frames]
+        tempo, beats = beat_track(onset_median, SAMPLE_RATE)
+        onset_frames = onset_detect(onset_mean, SAMPLE_RATE)
+        features.extend([
+            tempo / 200.0,
+            len(beats) / duration if self.n_samples > 0 else 0,
+            len(onset_frames) / duration if self.n_samples > 0 else 0,
+            np.std(np.diff(beats)) if len(beats) > 1 else 0,
+            np.mean(onset_mean),
+            np.std(onset_mean),
+            np.mean(np.diff(onset_frames)) if len(onset_frames) > 1 else 0
+        ])
+
+        n = max(self.sample_stats.count, 1)
+        features.extend([
+            self.rms_stats.mean[0], self.rms_stats.std[0],
+            self.power_stats.mean[0], self.power_stats.std[0],
+            self.peak, self.abs_sum / n,
+            *[self.sample_histogram.percentile(q) for q in (95, 75, 25, 5)],
+            duration,
+            self.abs_diff_stats.mean[0], self.abs_diff_stats.std[0]
+        ])
+
+        features.extend(self.mel13_stats.mean)
+
+        count, h_sum, h_sq, h_abs, p_sum, p_sq = self.harmonic_sums
+        count = max(count, 1)
+        h_var = max(h_sq / count - (h_sum / count) ** 2, 0.0)
+        p_var = max(p_sq / count - (p_sum / count) ** 2, 0.0)
+        covariance = self.cross_sum / count - (h_sum / count) * (p_sum / count)
+        features.extend([
+            h_sq / count, p_sq / count,
+            np.sqrt(h_var), np.sqrt(p_var),
+            covariance / np.sqrt(h_var * p_var) if h_var > 0 and p_var > 0 else np.nan,
+            h_abs / count, self.percussive_abs_sum / count
+        ])
+
+        if self.f0_stats.count > 0:
+            features.extend([
+                self.f0_stats.mean[0], self.f0_stats.std[0],
+                self.f0_stats.min[0], self.f0_stats.max[0],
+                self.f0_histogram.percentile(75) - self.f0_histogram.percentile(25)
+            ])
+        else:
+            features.extend([0, 0, 0, 0, 0])
+
+        features.extend([
+            self.magnitude_stats.mean[0], self.magnitude_stats.std[0],
+            self.frame_magnitude_stats.mean[0], self.frame_magnitude_stats.std[0]
+        ])
+
+        f0_mean = self.f0_stats.mean[0] if self.f0_stats.count else 0
+        features.append(self.f0_diff_stats.std[0] / f0_mean if self.f0_stats.count > 1 and f0_mean > 0 else 0)
+
+        energy_mean = self.frame_energy_stats.mean[0] if self.frame_energy_stats.count else 0
+        features.append(self.frame_energy_diff_stats.std[0] / energy_mean
+                        if self.frame_energy_stats.count > 1 and energy_mean > 0 else 0)
+
+        hnr = (h_sq / count) / (p_sq / count + 1e-10)
+        features.append(np.log10(hnr + 1e-10))
+
+        freqs = fft_frequencies(SAMPLE_RATE)
+        half = len(freqs) // 2
+        mean_magnitude = self.magnitude_bin_sum[:half] / n_frames
+        features.append(np.polyfit(freqs[:half], mean_magnitude, 1)[0])
+
+        features.append(self.rms_histogram.fraction_above(self.rms_histogram.percentile(30)))
+        features.append(self.centroid_stats.var[0])
+
+        return [float(value) for value in features[:100]]
+
+
+def generate_streaming_voice_embedding(file_path: str, chunk_seconds: float = 0.1) -> Dict[str, Any]:
+    """Embed a file by streaming it through StreamingVoiceEmbedder in chunk_seconds pieces"""
+    try:
+        with wave.open(file_path, 'rb') as wav_file:
+            if wav_file.getsampwidth() != 2:
+                raise wave.Error("not 16-bit PCM")
+            n_channels = wav_file.getnchannels()
+            embedder = StreamingVoiceEmbedder(wav_file.getframerate())
+            chunk_frames = max(1, int(chunk_seconds * wav_file.getframerate()))
+            while True:
+                data = wav_file.readframes(chunk_frames)
+                if not data:
+                    break
+                if n_channels == 1:
+                    embedder.feed_pcm16(data)
+                else:
+                    samples = np.frombuffer(data, dtype='<i2').reshape(-1, n_channels).mean(axis=1) / 32768.0
+                    embedder.feed(samples)
+    except (wave.Error, EOFError):
+        y = load_audio(file_path)
+        embedder = StreamingVoiceEmbedder(SAMPLE_RATE)
+        step = max(1, int(chunk_seconds * SAMPLE_RATE))
+        for start in range(0, len(y), step):
+            embedder.feed(y[start:start + step])
+    return embedder.finish()
+
+
+def compare_with_batch(file_paths: List[str], chunk_seconds: float = 0.1) -> Dict[str, Any]:
+    """Streaming vs whole-clip lite embeddings, plus time from last chunk to embedding"""
+    results = []
+    for file_path in file_paths:
+        batch = normalize_voice_features(compute_raw_voice_features_lite(load_audio(file_path)))
+
+        with wave.open(file_path, 'rb') as wav_file:
+            rate = wav_file.getframerate()
+            pcm = wav_file.readframes(wav_file.getnframes())
+        embedder = StreamingVoiceEmbedder(rate)
+        step = int(chunk_seconds * rate) * 2
+        started = time.perf_counter()
+        for start in range(0, len(pcm), step):
+            embedder.feed_pcm16(pcm[start:start + step])
+        fed = time.perf_counter()
+        streamed = embedder.finish()
+        finished = time.perf_counter()
+
+        results.append({
+            "file": file_path,
+            "cosine_vs_batch": round(_cosine(batch, streamed["voice_embedding"]), 5),
+            "feed_seconds": round(fed - started, 3),
+            "finish_ms": round((finished - fed) * 1000, 1)
+        })
+    return {"clips": results}
+
+
+def compare_memory(seconds: float = 300.0) -> Dict[str, Any]:
+    """Peak traced memory for a long synthetic recording: streaming vs whole clip"""
+    from tools.embedding_warmup import synthesize_warmup_clip
+    clip = synthesize_warmup_clip(SAMPLE_RATE, 10.0)
+    repeats = int(np.ceil(seconds / 10.0))
+
+    tracemalloc.start()
+    embedder = StreamingVoiceEmbedder(SAMPLE_RATE, max_duration=None)
+    for _ in range(repeats):
+        for start in range(0, len(clip), SAMPLE_RATE // 10):
+            embedder.feed(clip[start:start + SAMPLE_RATE // 10])
+    embedder.finish()
+    streaming_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    compute_raw_voice_features_lite(np.tile(clip, repeats))
+    batch_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "seconds": repeats * 10.0,
+        "streaming_peak_mb": round(streaming_peak / 1e6, 1),
+        "whole_clip_peak_mb": round(batch_peak / 1e6, 1)
+    }
+
+
+if __name__ == "__main__":
+    clips = sys.argv[1:]
+    if clips:
+        print(json.dumps(compare_with_batch(clips), indent=2))
+    print(json.dumps(compare_memory(), indent=2))
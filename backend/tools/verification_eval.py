@@ -0,0 +1,291 @@
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import ACTIVE_EMBEDDING_METHOD, normalize_embedding_method, get_embedding_extractor
+from tools.bulk_enrollment import AUDIO_EXTENSIONS
+
+DEFAULT_THRESHOLD = float(os.getenv("VOICE_SIMILARITY_THRESHOLD", "0.85"))
+DEFAULT_BINS = 20000  # score resolution of 1e-4 over [-1, 1]
+BLOCK_ROWS = 1024
+TARGET_FARS = (1e-2, 1e-3, 1e-4)
+
+
+def load_corpus(source: str) -> List[Tuple[str, str]]:
+    """
+    Labelled recordings for evaluation
+
+    Args:
+        source: A directory with one sub-directory of recordings per speaker, or a
+                CSV/JSON manifest with speaker,audio_path entries (paths relative
+                to the manifest)
+
+    Returns:
+        List of (speaker, audio_path) pairs
+    """
+    source_path = Path(source)
+
+    if source_path.is_dir():
+        return [
+            (speaker_dir.name, str(file.resolve()))
+            for speaker_dir in sorted(source_path.iterdir()) if speaker_dir.is_dir()
+            for file in sorted(speaker_dir.iterdir()) if file.suffix.lower() in AUDIO_EXTENSIONS
+        ]
+
+    if source_path.suffix.lower() == ".json":
+        with open(source_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    else:
+        with open(source_path, 'r', encoding='utf-8', newline='') as f:
+            entries = list(csv.DictReader(f))
+
+    items = []
+    for entry in entries:
+        audio_path = Path(entry["audio_path"])
+        if not audio_path.is_absolute():
+            audio_path = source_path.parent / audio_path
+        items.append((str(entry["speaker"]).strip(), str(audio_path.resolve())))
+    return items
+
+
+def _extract(job: Tuple[str, str]) -> Optional[List[float]]:
+    """Worker-process entry point: embedding of one file, None if the method fell back"""
+    audio_path, method = job
+    result = get_embedding_extractor(method)(audio_path)
+    if normalize_embedding_method(result.get("method")) != method:
+        return None
+    return result["voice_embedding"]
+
+
+def extract_embeddings(paths: List[str], method: str = ACTIVE_EMBEDDING_METHOD, workers: Optional[int] = None,
+                       cache_path: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Embed every recording in parallel worker processes
+
+    Args:
+        paths: Audio files
+        method: Versioned embedding method
+        workers: Worker processes (default: one per CPU)
+        cache_path: .npz file reused across runs for files already embedded with `method`
+
+    Returns:
+        {path: embedding} for the files that embedded successfully
+    """
+    if get_embedding_extractor(method) is None:
+        raise ValueError(f"Unknown embedding method: {method}")
+
+    embeddings: Dict[str, np.ndarray] = {}
+    if cache_path and os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if str(cached["method"]) == method:
+            embeddings = dict(zip(cached["paths"].tolist(), cached["embeddings"]))
+
+    missing = [path for path in paths if path not in embeddings]
+    if missing:
+        print(f"Embedding {len(missing)} recordings with {method} ({len(paths) - len(missing)} cached)")
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            jobs = [(path, method) for path in missing]
+            for path, embedding in zip(missing, pool.map(_extract, jobs, chunksize=16)):
+                if embedding is not None:
+                    embeddings[path] = np.asarray(embedding, dtype=np.float32)
+
+        if cache_path and embeddings:
+            np.savez(cache_path, method=method, paths=np.array(list(embeddings)),
+                     embeddings=np.stack(list(embeddings.values())))
+
+    return {path: embeddings[path] for path in paths if path in embeddings}
+
+
+def _score_bins(scores: np.ndarray, bins: int) -> np.ndarray:
+    index = np.clip(((scores + 1.0) * (bins / 2.0)).astype(np.int64), 0, bins - 1)
+    return np.bincount(index, minlength=bins)
+
+
+def score_histograms(embeddings: np.ndarray, speakers: List[str], bins: int = DEFAULT_BINS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Genuine and impostor cosine-score histograms over all unordered pairs
+
+    The score matrix is computed one block of rows at a time (one matmul per block)
+    and folded into fixed bins, so memory doesn't grow with the square of the
+    corpus. Genuine pairs come from per-speaker blocks; impostors are all pairs
+    minus genuine ones.
+
+    Returns:
+        (genuine_counts, impostor_counts), each of length `bins` over [-1, 1]
+    """
+    order = np.argsort(np.asarray(speakers), kind="stable")
+    labels = np.asarray(speakers)[order]
+    normalized = np.asarray(embeddings, dtype=np.float32)[order]
+    norms = np.linalg.norm(normalized, axis=1, keepdims=True)
+    normalized /= np.where(norms == 0, 1.0, norms)
+
+    n = len(normalized)
+    all_pairs = np.zeros(bins, dtype=np.int64)
+    for start in range(0, n, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n)
+        block = normalized[start:stop] @ normalized[start:].T
+        diagonal = block[:, :stop - start]
+        all_pairs += _score_bins(diagonal[np.triu_indices(stop - start, k=1)], bins)
+        all_pairs += _score_bins(block[:, stop - start:].ravel(), bins)
+
+    genuine = np.zeros(bins, dtype=np.int64)
+    boundaries = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1], True])
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        if stop - start > 1:
+            group = normalized[start:stop]
+            genuine += _score_bins((group @ group.T)[np.triu_indices(stop - start, k=1)], bins)
+
+    return genuine, all_pairs - genuine
+
+
+def error_curves(genuine: np.ndarray, impostor: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    FAR and FRR at every bin edge, for the `similarity >= threshold` accept rule
+
+    Returns:
+        {"threshold", "far", "frr"} arrays
+    """
+    bins = len(genuine)
+    thresholds = -1.0 + 2.0 * np.arange(bins + 1) / bins
+    frr = np.r_[0, np.cumsum(genuine)] / max(genuine.sum(), 1)
+    far = 1.0 - np.r_[0, np.cumsum(impostor)] / max(impostor.sum(), 1)
+    return {"threshold": thresholds, "far": far, "frr": frr}
+
+
+def summarize(curves: Dict[str, np.ndarray], threshold: float = DEFAULT_THRESHOLD,
+              target_fars=TARGET_FARS) -> Dict[str, Any]:
+    """EER, the error rates at `threshold`, and the operating points for target FARs"""
+    thresholds, far, frr = curves["threshold"], curves["far"], curves["frr"]
+
+    # FAR falls and FRR rises with the threshold: interpolate where they cross
+    crossing = int(np.argmax(frr >= far))
+    if crossing == 0:
+        eer, eer_threshold = float(far[0]), float(thresholds[0])
+    else:
+        before = far[crossing - 1] - frr[crossing - 1]
+        after = far[crossing] - frr[crossing]
+        weight = before / (before - after) if before != after else 0.0
+        eer = float(far[crossing - 1] + weight * (far[crossing] - far[crossing - 1]))
+        eer_threshold = float(thresholds[crossing - 1] + weight * (thresholds[crossing] - thresholds[crossing - 1]))
+
+    at = int(np.argmin(np.abs(thresholds - threshold)))
+    operating_points = []
+    for target in target_fars:
+        index = int(np.argmax(far <= target))
+        operating_points.append({
+            "target_far": target,
+            "threshold": round(float(thresholds[index]), 4),
+            "far": round(float(far[index]), 6),
+            "frr": round(float(frr[index]), 6)
+        })
+
+    return {
+        "eer": round(eer, 6),
+        "eer_threshold": round(eer_threshold, 4),
+        "at_threshold": {
+            "threshold": threshold,
+            "far": round(float(far[at]), 6),
+            "frr": round(float(frr[at]), 6)
+        },
+        "operating_points": operating_points
+    }
+
+
+def evaluate_embeddings(embeddings: np.ndarray, speakers: List[str], threshold: float = DEFAULT_THRESHOLD,
+                        bins: int = DEFAULT_BINS) -> Dict[str, Any]:
+    """Score all pairs and summarize; `curves` holds the full FAR/FRR sweep"""
+    genuine, impostor = score_histograms(embeddings, speakers, bins)
+    curves = error_curves(genuine, impostor)
+    return {
+        "genuine_trials": int(genuine.sum()),
+        "impostor_trials": int(impostor.sum()),
+        **summarize(curves, threshold),
+        "curves": curves
+    }
+
+
+def write_curves(curves: Dict[str, np.ndarray], output_path: str, step: int = 10):
+    """Write threshold,far,frr rows (every `step`-th bin edge) as CSV"""
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["threshold", "far", "frr"])
+        for threshold, far, frr in zip(curves["threshold"][::step], curves["far"][::step], curves["frr"][::step]):
+            writer.writerow([f"{threshold:.4f}", f"{far:.6f}", f"{frr:.6f}"])
+
+
+def run_evaluation(source: str, method: str = ACTIVE_EMBEDDING_METHOD, workers: Optional[int] = None,
+                   cache_path: Optional[str] = None, threshold: float = DEFAULT_THRESHOLD,
+                   bins: int = DEFAULT_BINS, curves_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Evaluate speaker verification on a labelled corpus
+
+    Args:
+        source: Corpus directory or manifest (see load_corpus)
+        method: Embedding method to evaluate
+        workers: Embedding worker processes
+        cache_path: Embedding cache (.npz) reused across runs
+        threshold: Threshold to report FAR/FRR at (the one authentication uses)
+        bins: Score histogram resolution
+        curves_path: Optional CSV for the FAR/FRR curves
+
+    Returns:
+        Summary dictionary
+    """
+    method = normalize_embedding_method(method)
+    items = load_corpus(source)
+    if len({speaker for speaker, _ in items}) < 2:
+        raise ValueError("Need recordings from at least two speakers")
+
+    started = time.perf_counter()
+    embedded = extract_embeddings([path for _, path in items], method, workers, cache_path)
+    extraction_seconds = time.perf_counter() - started
+
+    speakers = [speaker for speaker, path in items if path in embedded]
+    started = time.perf_counter()
+    result = evaluate_embeddings(np.stack(list(embedded.values())), speakers, threshold, bins)
+    scoring_seconds = time.perf_counter() - started
+
+    curves = result.pop("curves")
+    if curves_path:
+        write_curves(curves, curves_path)
+
+    return {
+        "method": method,
+        "recordings": len(items),
+        "embedded": len(embedded),
+        "failed": len(items) - len(embedded),
+        "speakers": len(set(speakers)),
+        **result,
+        "extraction_seconds": round(extraction_seconds, 2),
+        "scoring_seconds": round(scoring_seconds, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FAR/FRR/EER of voice embeddings on a labelled corpus")
+    parser.add_argument("source", help="Directory of per-speaker sub-directories, or a CSV/JSON manifest (speaker,audio_path)")
+    parser.add_argument("--method", default=ACTIVE_EMBEDDING_METHOD, help="Embedding method to evaluate")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding worker processes (default: CPU count)")
+    parser.add_argument("--cache", default=None, help="Embedding cache .npz, reused across runs")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Report FAR/FRR at this threshold")
+    parser.add_argument("--bins", type=int, default=DEFAULT_BINS, help="Score histogram bins over [-1, 1]")
+    parser.add_argument("--curves", default=None, help="Write the FAR/FRR curves to this CSV")
+    args = parser.parse_args()
+
+    result = run_evaluation(args.source, args.method, args.workers, args.cache, args.threshold, args.bins, args.curves)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
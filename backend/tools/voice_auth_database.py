@@ -1,11 +1,90 @@
 import sqlite3
 import json
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Callable
 import os
+import sys
+from pathlib import Path
 from datetime import datetime
 import hashlib
 
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import embedding_length_valid
+from utils.pagination import encode_cursor, decode_cursor, clamp_page_size, DEFAULT_PAGE_SIZE
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+def list_users_page(db_path: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                    include_secret_numbers: bool = False) -> Dict:
+    """
+    Get one page of users, newest first, using keyset pagination on (created_at, id)
+    
+    Args:
+        db_path: voice_auth SQLite file
+        limit: Maximum number of users on the page
+        cursor: next_cursor from the previous page, or None for the first page
+        include_secret_numbers: Add each user's PIN as secret_pin (admin inspection)
+        
+    Returns:
+        Dictionary with the users on the page and next_cursor (None on the last page)
+    """
+    try:
+        limit = clamp_page_size(limit)
+        after = decode_cursor(cursor)
+        where = 'WHERE (created_at, id) < (?, ?)' if after else ''
+        params = (after[0], after[1], limit + 1) if after else (limit + 1,)
+        
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(f'''
+                SELECT id, user_id, embedding_method, created_at, updated_at, is_active, secret_numbers
+                FROM voice_auth {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', params).fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        users = []
+        for row in rows:
+            user = {
+                'user_id': row[1],
+                'embedding_method': row[2],
+                'created_at': row[3],
+                'updated_at': row[4],
+                'is_active': bool(row[5])
+            }
+            if include_secret_numbers:
+                try:
+                    user['secret_pin'] = json.loads(row[6])
+                except (TypeError, json.JSONDecodeError):
+                    user['secret_pin'] = "Failed to decode"
+            users.append(user)
+        
+        return {
+            'users': users,
+            'next_cursor': encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None
+        }
+        
+    except Exception as e:
+        logger.error(f"Error listing users page: {e}")
+        return {'users': [], 'next_cursor': None, 'error': str(e)}
+
+def iter_users(db_path: str, batch_size: int = 500, include_secret_numbers: bool = False):
+    """Yield every user page by page, holding at most one page in memory"""
+    cursor = None
+    while True:
+        page = list_users_page(db_path, batch_size, cursor, include_secret_numbers)
+        if page.get('error'):
+            raise RuntimeError(page['error'])
+        yield from page['users']
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
 class VoiceAuthDatabase:
     def __init__(self, db_path: str = "voice_auth.db"):
         """Initialize the voice authentication database"""
@@ -42,8 +121,13 @@ class VoiceAuthDatabase:
                 CREATE INDEX IF NOT EXISTS idx_active ON voice_auth(is_active)
             ''')
             
+            # Create index for keyset pagination over (created_at, id)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_created_id ON voice_auth(created_at, id)
+            ''')
+            
             conn.commit()
-            print(f"Database initialized at: {os.path.abspath(self.db_path)}")
+            logger.debug(f"Database initialized at: {os.path.abspath(self.db_path)}")
     
     def store_voice_data(self, user_id: str, voice_embedding: List[float], 
                         secret_numbers: List[int], embedding_method: str = "audio_features",
@@ -53,7 +137,7 @@ class VoiceAuthDatabase:
         
         Args:
             user_id: Unique identifier for the user (links to bank card)
-            voice_embedding: List of 100 float values
+            voice_embedding: List of 100 float values (the model's width for onnx_speaker methods)
             secret_numbers: List of 5 integers
             embedding_method: Method used to generate embedding
             file_hash: Hash of the original audio file
@@ -63,8 +147,9 @@ class VoiceAuthDatabase:
         """
         try:
             # Validate input
-            if len(voice_embedding) != 100:
-                raise ValueError(f"Voice embedding must be exactly 100 dimensions, got {len(voice_embedding)}")
+            if not embedding_length_valid(voice_embedding, embedding_method):
+                raise ValueError(f"Voice embedding has the wrong number of dimensions for {embedding_method}: "
+                                 f"{len(voice_embedding)}")
             
             if len(secret_numbers) != 5:
                 raise ValueError(f"Secret numbers must be exactly 5 numbers, got {len(secret_numbers)}")
@@ -84,13 +169,55 @@ class VoiceAuthDatabase:
                 ''', (user_id, embedding_json, numbers_json, embedding_method, file_hash))
                 
                 conn.commit()
-                print(f"✅ Voice data stored for user: {user_id}")
+                logger.info(f"Voice data stored for user: {user_id}")
                 return True
                 
         except Exception as e:
-            print(f"❌ Error storing voice data: {e}")
+            logger.error(f"Error storing voice data: {e}")
             return False
     
+    def store_voice_data_batch(self, records: List[Dict]) -> int:
+        """
+        Store many users' voice data in a single transaction
+        
+        Args:
+            records: Dictionaries with user_id, voice_embedding, secret_numbers and
+                     optionally embedding_method and file_hash
+            
+        Returns:
+            Number of rows written (0 if the batch was rejected)
+        """
+        rows = []
+        for record in records:
+            method = record.get("embedding_method", "audio_features")
+            if not embedding_length_valid(record["voice_embedding"], method) or len(record["secret_numbers"]) != 5:
+                logger.error(f"Skipping invalid record for user: {record.get('user_id')}")
+                continue
+            rows.append((
+                record["user_id"],
+                json.dumps(record["voice_embedding"]),
+                json.dumps(record["secret_numbers"]),
+                method,
+                record.get("file_hash")
+            ))
+        
+        if not rows:
+            return 0
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO voice_auth 
+                    (user_id, voice_embedding, secret_numbers, embedding_method, file_hash, updated_at)
+                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', rows)
+                conn.commit()
+                return len(rows)
+                
+        except Exception as e:
+            logger.error(f"Error storing voice data batch: {e}")
+            return 0
+    
     def get_voice_data(self, user_id: str) -> Optional[Dict]:
         """
         Retrieve voice authentication data for a user
@@ -129,11 +256,13 @@ class VoiceAuthDatabase:
                     return None
                     
         except Exception as e:
-            print(f"❌ Error retrieving voice data: {e}")
+            logger.error(f"Error retrieving voice data: {e}")
             return None
     
     def authenticate_user(self, voice_embedding: List[float], secret_numbers: List[int], 
-                         similarity_threshold: float = 0.85) -> Tuple[Optional[str], float]:
+                         similarity_threshold: float = 0.85,
+                         probe_for_method: Optional[Callable[[str], Optional[List[float]]]] = None
+                         ) -> Tuple[Optional[str], float]:
         """
         Authenticate a user by comparing voice embedding and secret numbers
         
@@ -141,6 +270,8 @@ class VoiceAuthDatabase:
             voice_embedding: 100-dimensional embedding to compare
             secret_numbers: 5 secret numbers to verify
             similarity_threshold: Minimum cosine similarity required
+            probe_for_method: Optional lookup returning the probe embedding in a stored
+                              row's embedding_method (used while re-embedding is in progress)
             
         Returns:
             Tuple of (user_id if authenticated, similarity_score) or (None, 0.0)
@@ -151,7 +282,7 @@ class VoiceAuthDatabase:
                 
                 # Get all active voice records
                 cursor.execute('''
-                    SELECT user_id, voice_embedding, secret_numbers 
+                    SELECT user_id, voice_embedding, secret_numbers, embedding_method 
                     FROM voice_auth 
                     WHERE is_active = 1
                 ''')
@@ -161,10 +292,8 @@ class VoiceAuthDatabase:
                 best_match = None
                 best_similarity = 0.0
                 
-                input_embedding = np.array(voice_embedding)
-                
                 for row in rows:
-                    user_id, stored_embedding_json, stored_numbers_json = row
+                    user_id, stored_embedding_json, stored_numbers_json, embedding_method = row
                     
                     # Parse stored data
                     stored_embedding = np.array(json.loads(stored_embedding_json))
@@ -174,6 +303,15 @@ class VoiceAuthDatabase:
                     if stored_numbers != secret_numbers:
                         continue
                     
+                    # Use a probe in the row's embedding method when one is available
+                    probe = probe_for_method(embedding_method) if probe_for_method else None
+                    if probe_for_method and probe is None:
+                        # No extractor for the row's method: the probe isn't comparable, fail closed
+                        logger.warning("No probe for stored embedding method", extra={"user_id": user_id,
+                                                                                   "embedding_method": embedding_method})
+                        continue
+                    input_embedding = np.array(probe if probe is not None else voice_embedding)
+                    
                     # Calculate cosine similarity
                     similarity = self.cosine_similarity(input_embedding, stored_embedding)
                     
@@ -185,7 +323,7 @@ class VoiceAuthDatabase:
                 return best_match, best_similarity
                 
         except Exception as e:
-            print(f"❌ Error during authentication: {e}")
+            logger.error(f"Error during authentication: {e}")
             return None, 0.0
     
     def cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
@@ -205,32 +343,20 @@ class VoiceAuthDatabase:
     def list_all_users(self) -> List[Dict]:
         """Get a list of all registered users"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT user_id, embedding_method, created_at, updated_at, is_active
-                    FROM voice_auth 
-                    ORDER BY created_at DESC
-                ''')
-                
-                rows = cursor.fetchall()
-                
-                return [
-                    {
-                        'user_id': row[0],
-                        'embedding_method': row[1],
-                        'created_at': row[2],
-                        'updated_at': row[3],
-                        'is_active': bool(row[4])
-                    }
-                    for row in rows
-                ]
-                
+            return list(self.iter_users())
         except Exception as e:
-            print(f"❌ Error listing users: {e}")
+            logger.error(f"Error listing users: {e}")
             return []
     
+    def list_users_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                        include_secret_numbers: bool = False) -> Dict:
+        """Get one page of users, newest first (see list_users_page)"""
+        return list_users_page(self.db_path, limit, cursor, include_secret_numbers)
+    
+    def iter_users(self, batch_size: int = 500, include_secret_numbers: bool = False):
+        """Yield every user page by page, holding at most one page in memory"""
+        return iter_users(self.db_path, batch_size, include_secret_numbers)
+    
     def deactivate_user(self, user_id: str) -> bool:
         """Deactivate a user's voice authentication (soft delete)"""
         try:
@@ -245,14 +371,14 @@ class VoiceAuthDatabase:
                 
                 if cursor.rowcount > 0:
                     conn.commit()
-                    print(f"✅ User {user_id} deactivated")
+                    logger.info(f"User {user_id} deactivated")
                     return True
                 else:
-                    print(f"❌ User {user_id} not found")
+                    logger.warning(f"User {user_id} not found")
                     return False
                     
         except Exception as e:
-            print(f"❌ Error deactivating user: {e}")
+            logger.error(f"Error deactivating user: {e}")
             return False
     
     def get_database_stats(self) -> Dict:
@@ -281,7 +407,7 @@ class VoiceAuthDatabase:
                 }
                 
         except Exception as e:
-            print(f"❌ Error getting stats: {e}")
+            logger.error(f"Error getting stats: {e}")
             return {}
 
 # Example usage and testing functions
@@ -7,8 +7,9 @@ from typing import Dict, Any, Optional, Tuple
 backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
-from tools.voice_to_embedded import generate_100d_voice_embedding, get_audio_hash
+from tools.voice_to_embedded import generate_voice_embedding, get_audio_hash, ProbeEmbeddings
 from tools.voice_to_number import AudioProcessor
+from tools.enrollment_archive import archive_enrollment_audio
 from .voice_auth_database import VoiceAuthDatabase
 
 class VoiceAuthenticationService:
@@ -23,10 +24,17 @@ class VoiceAuthenticationService:
             similarity_threshold: Minimum similarity score for authentication (0.0 to 1.0)
         """
         self.db = VoiceAuthDatabase(db_path)
-        self.audio_processor = AudioProcessor()
+        self._audio_processor = None
         self.similarity_threshold = similarity_threshold
         print(f"Voice Authentication Service initialized with threshold: {similarity_threshold}")
     
+    @property
+    def audio_processor(self) -> AudioProcessor:
+        """Vertex AI client, created only when numbers actually need extracting"""
+        if self._audio_processor is None:
+            self._audio_processor = AudioProcessor()
+        return self._audio_processor
+    
     def register_user(self, user_id: str, audio_file_path: str) -> Dict[str, Any]:
         """
         Register a new user by processing their audio file and storing in database
@@ -50,7 +58,7 @@ class VoiceAuthenticationService:
                 }
             
             # Generate voice embedding
-            embedding_result = generate_100d_voice_embedding(audio_file_path)
+            embedding_result = generate_voice_embedding(audio_file_path)
             if not embedding_result.get("voice_embedding"):
                 return {
                     "success": False,
@@ -70,6 +78,9 @@ class VoiceAuthenticationService:
             # Get file hash
             file_hash = get_audio_hash(audio_file_path)
             
+            # Keep the recording so the embedding can be re-derived after method upgrades
+            archive_enrollment_audio(audio_file_path, file_hash)
+            
             # Store in database
             success = self.db.store_voice_data(
                 user_id=user_id,
@@ -127,7 +138,7 @@ class VoiceAuthenticationService:
                 }
             
             # Generate voice embedding
-            embedding_result = generate_100d_voice_embedding(audio_file_path)
+            embedding_result = generate_voice_embedding(audio_file_path)
             if not embedding_result.get("voice_embedding"):
                 return {
                     "success": False,
@@ -148,11 +159,13 @@ class VoiceAuthenticationService:
                     "similarity_score": 0.0
                 }
             
-            # Authenticate against database
+            # Authenticate against database (dual-version probes during method migrations)
+            probes = ProbeEmbeddings(audio_file_path, embedding_result)
             authenticated_user_id, similarity_score = self.db.authenticate_user(
                 voice_embedding=embedding_result["voice_embedding"],
                 secret_numbers=numbers_result["numbers"],
-                similarity_threshold=self.similarity_threshold
+                similarity_threshold=self.similarity_threshold,
+                probe_for_method=probes.for_method
             )
             
             if authenticated_user_id:
@@ -210,15 +223,25 @@ class VoiceAuthenticationService:
                 "error": f"Error retrieving user info: {str(e)}"
             }
     
-    def list_all_users(self) -> Dict[str, Any]:
-        """List all registered users"""
+    def list_all_users(self, cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """List registered users one keyset-paginated page at a time"""
         try:
-            users = self.db.list_all_users()
-            return {
+            page = self.db.list_users_page(limit=limit, cursor=cursor)
+            if page.get("error"):
+                return {
+                    "success": False,
+                    "error": f"Error listing users: {page['error']}",
+                    "users": []
+                }
+            result = {
                 "success": True,
-                "users": users,
-                "total_count": len(users)
+                "users": page["users"],
+                "next_cursor": page["next_cursor"]
             }
+            if cursor is None:
+                # Counted once per listing, not on every page
+                result["total_count"] = self.db.get_database_stats().get("total_users", 0)
+            return result
         except Exception as e:
             return {
                 "success": False,
@@ -292,10 +315,10 @@ def get_voice_user_info(user_id: str) -> Dict[str, Any]:
     service = VoiceAuthenticationService()
     return service.get_user_info(user_id)
 
-def list_voice_users() -> Dict[str, Any]:
-    """List all registered voice users"""
+def list_voice_users(cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+    """List registered voice users one page at a time"""
     service = VoiceAuthenticationService()
-    return service.list_all_users()
+    return service.list_all_users(cursor=cursor, limit=limit)
 
 def get_voice_system_stats() -> Dict[str, Any]:
     """Get voice authentication system statistics"""
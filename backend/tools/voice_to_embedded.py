@@ -1,202 +1,287 @@
-import librosa
 import numpy as np
 import json
 import hashlib
+import sys
 from pathlib import Path
 import os
 from dotenv import load_dotenv
 
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.structured_logging import get_logger
+
 # Load environment variables
 load_dotenv()
 
+logger = get_logger(__name__)
+
+# Persist numba's compiled librosa kernels across restarts so only the very first
+# deploy pays the JIT cost. Must be set before librosa (and so numba) is imported.
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR",
+    os.getenv("VPAY_NUMBA_CACHE_DIR", str(Path(__file__).parent.parent / ".numba_cache"))
+)
+
+# Bump EMBEDDING_VERSION whenever the feature code below changes in a way that makes
+# new embeddings incomparable with stored ones; tools/reembedding.py migrates old rows.
+EMBEDDING_METHOD = "audio_features"
+EMBEDDING_VERSION = 1
+CURRENT_EMBEDDING_METHOD = f"{EMBEDDING_METHOD}:v{EMBEDDING_VERSION}"
+
+# Neural speaker embeddings are versioned by their model file's hash (tools/speaker_encoder_onnx.py)
+ONNX_EMBEDDING_METHOD = "onnx_speaker"
+
+# Handcrafted methods store exactly 100 features; speaker models keep their own width
+HANDCRAFTED_EMBEDDING_DIMENSIONS = 100
+MAX_EMBEDDING_DIMENSIONS = 1024
+
+def normalize_embedding_method(method):
+    """
+    Map stored method names onto versioned ones ('audio_features' predates versioning;
+    a bare 'onnx_speaker' means the configured model's version)
+    """
+    if method == EMBEDDING_METHOD:
+        return f"{EMBEDDING_METHOD}:v1"
+    if method == ONNX_EMBEDDING_METHOD:
+        try:
+            from tools.speaker_encoder_onnx import current_onnx_embedding_method
+            return current_onnx_embedding_method()
+        except OSError:
+            return method
+    return method
+
+def is_onnx_embedding_method(method):
+    return str(method or "").startswith(ONNX_EMBEDDING_METHOD + ":")
+
+def embedding_length_valid(embedding, method):
+    """Whether an embedding has the width its method produces"""
+    if not embedding:
+        return False
+    if is_onnx_embedding_method(method):
+        return len(embedding) <= MAX_EMBEDDING_DIMENSIONS
+    return len(embedding) == HANDCRAFTED_EMBEDDING_DIMENSIONS
+
 def get_audio_hash(file_path):
     """Generate a hash of the audio file for consistency"""
     with open(file_path, 'rb') as f:
         audio_data = f.read()
         return hashlib.md5(audio_data).hexdigest()
 
+def compute_voice_features(y, sr):
+    """
+    Compute the normalized 100-dimensional feature vector of an audio signal
+    
+    Args:
+        y: Mono audio signal (float numpy array)
+        sr: Sample rate of y
+        
+    Returns:
+        numpy array of 100 features, z-score normalized and clipped to [-1, 1]
+    """
+    return normalize_voice_features(compute_raw_voice_features(y, sr))
+
+def compute_raw_voice_features(y, sr):
+    """The 100 unnormalized features of an audio signal, in embedding order"""
+    import librosa
+    
+    features = []
+    
+    # 1-13: MFCC features (mean values)
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    for i in range(13):
+        features.append(np.mean(mfcc[i]))
+    
+    # 14-26: MFCC standard deviations
+    for i in range(13):
+        features.append(np.std(mfcc[i]))
+    
+    # 27-38: Chroma features (pitch class profiles)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+    for i in range(12):
+        features.append(np.mean(chroma[i]))
+    
+    # 39-45: Spectral features
+    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
+    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
+    zero_crossings = librosa.feature.zero_crossing_rate(y)
+    
+    features.extend([
+        np.mean(spectral_centroids),
+        np.std(spectral_centroids),
+        np.mean(spectral_rolloff),
+        np.std(spectral_rolloff),
+        np.mean(spectral_bandwidth),
+        np.std(spectral_bandwidth),
+        np.mean(zero_crossings)
+    ])
+    
+    # 46-52: Tempo and rhythm features
+    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+    tempo = float(np.atleast_1d(tempo)[0])  # librosa >= 0.10 returns an array
+    onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
+    features.extend([
+        tempo / 200.0,  # Normalized tempo
+        len(beats) / (len(y) / sr) if len(y) > 0 else 0,  # Beat density
+        len(onset_frames) / (len(y) / sr) if len(y) > 0 else 0,  # Onset density
+        np.std(np.diff(beats)) if len(beats) > 1 else 0,  # Beat consistency
+        np.mean(librosa.onset.onset_strength(y=y, sr=sr)),  # Onset strength
+        np.std(librosa.onset.onset_strength(y=y, sr=sr)),
+        np.mean(np.diff(onset_frames)) if len(onset_frames) > 1 else 0
+    ])
+    
+    # 53-65: Energy and amplitude features
+    rms = librosa.feature.rms(y=y)
+    features.extend([
+        np.mean(rms),
+        np.std(rms),
+        np.mean(y**2),  # Power
+        np.std(y**2),
+        np.max(np.abs(y)),  # Peak amplitude
+        np.mean(np.abs(y)),  # Mean amplitude
+        np.percentile(y, 95),  # 95th percentile
+        np.percentile(y, 75),  # 75th percentile
+        np.percentile(y, 25),  # 25th percentile
+        np.percentile(y, 5),   # 5th percentile
+        len(y) / sr,  # Duration
+        np.mean(np.abs(np.diff(y))),  # Spectral flux
+        np.std(np.abs(np.diff(y)))
+    ])
+    
+    # 66-78: Mel-scale spectral features
+    mel_spectrogram = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=13)
+    for i in range(13):
+        features.append(np.mean(mel_spectrogram[i]))
+    
+    # 79-85: Harmonic and percussive features
+    y_harmonic, y_percussive = librosa.effects.hpss(y)
+    features.extend([
+        np.mean(y_harmonic**2),  # Harmonic energy
+        np.mean(y_percussive**2),  # Percussive energy
+        np.std(y_harmonic),
+        np.std(y_percussive),
+        np.corrcoef(y_harmonic, y_percussive)[0,1] if len(y_harmonic) == len(y_percussive) else 0,
+        np.mean(np.abs(y_harmonic)),
+        np.mean(np.abs(y_percussive))
+    ])
+    
+    # 86-90: Pitch features (F0)
+    f0 = librosa.yin(y, fmin=50, fmax=400)  # Typical human voice range
+    f0_clean = f0[f0 > 0]  # Remove unvoiced frames
+    
+    if len(f0_clean) > 0:
+        features.extend([
+            np.mean(f0_clean),  # Average pitch
+            np.std(f0_clean),   # Pitch variance
+            np.min(f0_clean),   # Lowest pitch
+            np.max(f0_clean),   # Highest pitch
+            np.percentile(f0_clean, 75) - np.percentile(f0_clean, 25),  # Pitch range
+        ])
+    else:
+        features.extend([0, 0, 0, 0, 0])
+    
+    # 91-94: Additional spectral features
+    stft = librosa.stft(y)
+    magnitude = np.abs(stft)
+    features.extend([
+        np.mean(magnitude),
+        np.std(magnitude),
+        np.mean(np.sum(magnitude, axis=0)),  # Spectral energy per frame
+        np.std(np.sum(magnitude, axis=0))
+    ])
+    
+    # 95-100: Voice quality indicators
+    # Jitter approximation (pitch period variation)
+    if len(f0_clean) > 1:
+        features.append(np.std(np.diff(f0_clean)) / np.mean(f0_clean) if np.mean(f0_clean) > 0 else 0)
+    else:
+        features.append(0)
+    
+    # Shimmer approximation (amplitude variation)
+    frame_energies = np.sum(magnitude**2, axis=0)
+    if len(frame_energies) > 1:
+        features.append(np.std(np.diff(frame_energies)) / np.mean(frame_energies) if np.mean(frame_energies) > 0 else 0)
+    else:
+        features.append(0)
+    
+    # Harmonics-to-noise ratio approximation
+    harmonic_energy = np.mean(y_harmonic**2)
+    noise_energy = np.mean((y - y_harmonic)**2)
+    hnr = harmonic_energy / (noise_energy + 1e-10)
+    features.append(np.log10(hnr + 1e-10))
+    
+    # Spectral slope
+    freqs = librosa.fft_frequencies(sr=sr)
+    spectral_slope = np.polyfit(freqs[:len(freqs)//2], 
+                              np.mean(magnitude[:len(freqs)//2], axis=1), 1)[0]
+    features.append(spectral_slope)
+    
+    # Voice activity (speech vs silence ratio)
+    voice_activity = np.mean(rms > np.percentile(rms, 30))
+    features.append(voice_activity)
+    
+    # Spectral centroid variation
+    features.append(np.var(spectral_centroids))
+    
+    # Ensure exactly 100 features
+    features = features[:100]
+    while len(features) < 100:
+        features.append(0.0)
+    
+    logger.debug(f"Extracted {len(features)} audio features")
+    
+    return features
+
+def normalize_voice_features(features):
+    """Z-score normalize raw features into the stored [-1, 1] embedding"""
+    # Normalize to [-1, 1] range and handle any NaN/inf values
+    features = np.array(features, dtype=np.float64)
+    features = np.nan_to_num(features, nan=0.0, posinf=1.0, neginf=-1.0)
+    
+    # Z-score normalization then clip to [-1, 1]
+    if np.std(features) > 0:
+        features = (features - np.mean(features)) / np.std(features)
+    features = np.clip(features, -1, 1)
+    
+    return features
+
 def generate_100d_voice_embedding(file_path):
     """Generate consistent 100-dimensional voice embedding based on audio features"""
     try:
-        print(f"Processing audio file: {file_path}")
+        # Imported here so importing this module doesn't pull in librosa/numba/scipy
+        import librosa
+        
+        logger.debug(f"Processing audio file: {file_path}")
         
         # Load audio file (limit to 30 seconds for consistency)
         y, sr = librosa.load(file_path, duration=30)
-        print(f"Loaded audio: {len(y)} samples at {sr} Hz")
-        
-        features = []
-        
-        # 1-13: MFCC features (mean values)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        for i in range(13):
-            features.append(np.mean(mfcc[i]))
-        
-        # 14-26: MFCC standard deviations
-        for i in range(13):
-            features.append(np.std(mfcc[i]))
-        
-        # 27-38: Chroma features (pitch class profiles)
-        chroma = librosa.feature.chroma(y=y, sr=sr)
-        for i in range(12):
-            features.append(np.mean(chroma[i]))
-        
-        # 39-45: Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)
-        zero_crossings = librosa.feature.zero_crossing_rate(y)
-        
-        features.extend([
-            np.mean(spectral_centroids),
-            np.std(spectral_centroids),
-            np.mean(spectral_rolloff),
-            np.std(spectral_rolloff),
-            np.mean(spectral_bandwidth),
-            np.std(spectral_bandwidth),
-            np.mean(zero_crossings)
-        ])
-        
-        # 46-52: Tempo and rhythm features
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
-        features.extend([
-            tempo / 200.0,  # Normalized tempo
-            len(beats) / (len(y) / sr) if len(y) > 0 else 0,  # Beat density
-            len(onset_frames) / (len(y) / sr) if len(y) > 0 else 0,  # Onset density
-            np.std(np.diff(beats)) if len(beats) > 1 else 0,  # Beat consistency
-            np.mean(librosa.onset.onset_strength(y=y, sr=sr)),  # Onset strength
-            np.std(librosa.onset.onset_strength(y=y, sr=sr)),
-            np.mean(np.diff(onset_frames)) if len(onset_frames) > 1 else 0
-        ])
-        
-        # 53-65: Energy and amplitude features
-        rms = librosa.feature.rms(y=y)
-        features.extend([
-            np.mean(rms),
-            np.std(rms),
-            np.mean(y**2),  # Power
-            np.std(y**2),
-            np.max(np.abs(y)),  # Peak amplitude
-            np.mean(np.abs(y)),  # Mean amplitude
-            np.percentile(y, 95),  # 95th percentile
-            np.percentile(y, 75),  # 75th percentile
-            np.percentile(y, 25),  # 25th percentile
-            np.percentile(y, 5),   # 5th percentile
-            len(y) / sr,  # Duration
-            np.mean(np.abs(np.diff(y))),  # Spectral flux
-            np.std(np.abs(np.diff(y)))
-        ])
-        
-        # 66-78: Mel-scale spectral features
-        mel_spectrogram = librosa.feature.melspectrogram(y=y, sr=sr, n_mels=13)
-        for i in range(13):
-            features.append(np.mean(mel_spectrogram[i]))
-        
-        # 79-85: Harmonic and percussive features
-        y_harmonic, y_percussive = librosa.effects.hpss(y)
-        features.extend([
-            np.mean(y_harmonic**2),  # Harmonic energy
-            np.mean(y_percussive**2),  # Percussive energy
-            np.std(y_harmonic),
-            np.std(y_percussive),
-            np.corrcoef(y_harmonic, y_percussive)[0,1] if len(y_harmonic) == len(y_percussive) else 0,
-            np.mean(np.abs(y_harmonic)),
-            np.mean(np.abs(y_percussive))
-        ])
-        
-        # 86-90: Pitch features (F0)
-        f0 = librosa.yin(y, fmin=50, fmax=400)  # Typical human voice range
-        f0_clean = f0[f0 > 0]  # Remove unvoiced frames
-        
-        if len(f0_clean) > 0:
-            features.extend([
-                np.mean(f0_clean),  # Average pitch
-                np.std(f0_clean),   # Pitch variance
-                np.min(f0_clean),   # Lowest pitch
-                np.max(f0_clean),   # Highest pitch
-                np.percentile(f0_clean, 75) - np.percentile(f0_clean, 25),  # Pitch range
-            ])
-        else:
-            features.extend([0, 0, 0, 0, 0])
-        
-        # 91-94: Additional spectral features
-        stft = librosa.stft(y)
-        magnitude = np.abs(stft)
-        features.extend([
-            np.mean(magnitude),
-            np.std(magnitude),
-            np.mean(np.sum(magnitude, axis=0)),  # Spectral energy per frame
-            np.std(np.sum(magnitude, axis=0))
-        ])
-        
-        # 95-100: Voice quality indicators
-        # Jitter approximation (pitch period variation)
-        if len(f0_clean) > 1:
-            features.append(np.std(np.diff(f0_clean)) / np.mean(f0_clean) if np.mean(f0_clean) > 0 else 0)
-        else:
-            features.append(0)
-        
-        # Shimmer approximation (amplitude variation)
-        frame_energies = np.sum(magnitude**2, axis=0)
-        if len(frame_energies) > 1:
-            features.append(np.std(np.diff(frame_energies)) / np.mean(frame_energies) if np.mean(frame_energies) > 0 else 0)
-        else:
-            features.append(0)
-        
-        # Harmonics-to-noise ratio approximation
-        harmonic_energy = np.mean(y_harmonic**2)
-        noise_energy = np.mean((y - y_harmonic)**2)
-        hnr = harmonic_energy / (noise_energy + 1e-10)
-        features.append(np.log10(hnr + 1e-10))
-        
-        # Spectral slope
-        freqs = librosa.fft_frequencies(sr=sr)
-        spectral_slope = np.polyfit(freqs[:len(freqs)//2], 
-                                  np.mean(magnitude[:len(freqs)//2], axis=1), 1)[0]
-        features.append(spectral_slope)
-        
-        # Voice activity (speech vs silence ratio)
-        voice_activity = np.mean(rms > np.percentile(rms, 30))
-        features.append(voice_activity)
-        
-        # Spectral centroid variation
-        features.append(np.var(spectral_centroids))
-        
-        # Ensure exactly 100 features
-        features = features[:100]
-        while len(features) < 100:
-            features.append(0.0)
-        
-        print(f"Extracted {len(features)} audio features")
-        
-        # Normalize to [-1, 1] range and handle any NaN/inf values
-        features = np.array(features, dtype=np.float64)
-        features = np.nan_to_num(features, nan=0.0, posinf=1.0, neginf=-1.0)
+        logger.debug(f"Loaded audio: {len(y)} samples at {sr} Hz")
         
-        # Z-score normalization then clip to [-1, 1]
-        if np.std(features) > 0:
-            features = (features - np.mean(features)) / np.std(features)
-        features = np.clip(features, -1, 1)
+        features = compute_voice_features(y, sr)
         
-        print(f"Successfully generated 100D embedding")
+        logger.debug("Successfully generated 100D embedding")
         
         return {
             "voice_embedding": features.round(6).tolist(),
-            "method": "audio_features",
+            "method": CURRENT_EMBEDDING_METHOD,
             "dimensions": len(features),
             "file_hash": get_audio_hash(file_path)
         }
         
     except ImportError:
-        print("Error: librosa not installed. Install with: pip install librosa")
+        logger.error("librosa not installed. Install with: pip install librosa")
         return generate_hash_based_embedding(file_path, "librosa not installed")
     except Exception as e:
-        print(f"Audio feature extraction failed: {e}")
+        logger.warning(f"Audio feature extraction failed: {e}")
         return generate_hash_based_embedding(file_path, str(e))
 
 def generate_hash_based_embedding(file_path, error_msg=""):
     """Generate a deterministic 100-dimensional embedding based on file hash"""
-    print(f"Using hash-based fallback embedding for: {file_path}")
+    logger.warning(f"Using hash-based fallback embedding for: {file_path}")
+    from utils.metrics import count_fallback
+    count_fallback("embedding", "hash_based")
     
     audio_hash = get_audio_hash(file_path)
     
@@ -218,6 +303,85 @@ def generate_hash_based_embedding(file_path, error_msg=""):
         
     return result
 
+def embedding_batching_enabled():
+    """VPAY_EMBEDDING_BATCHING=1 routes lite extraction through tools/embedding_batcher.py"""
+    return os.getenv("VPAY_EMBEDDING_BATCHING", "0").lower() in ("1", "true", "yes")
+
+def generate_lite_voice_embedding(file_path):
+    """numpy-only extractor (tools/voice_to_embedded_lite.py), imported on first use"""
+    if embedding_batching_enabled():
+        from tools.embedding_batcher import get_embedding_batcher
+        return get_embedding_batcher().embed_file(file_path)
+    from tools.voice_to_embedded_lite import generate_100d_voice_embedding_lite
+    return generate_100d_voice_embedding_lite(file_path)
+
+def generate_onnx_voice_embedding(file_path):
+    """Neural speaker model via ONNX Runtime (tools/speaker_encoder_onnx.py), imported on first use"""
+    from tools.speaker_encoder_onnx import generate_onnx_voice_embedding as generate
+    return generate(file_path)
+
+# Extractors by versioned method. While a migration is running, keep the previous
+# version registered here so rows that weren't re-embedded yet can still be scored.
+# onnx_speaker:<model hash> methods are resolved in get_embedding_extractor.
+EMBEDDING_EXTRACTORS = {
+    CURRENT_EMBEDDING_METHOD: generate_100d_voice_embedding,
+    "audio_features_lite:v1": generate_lite_voice_embedding
+}
+
+# Method used for new enrollments and authentication probes (VPAY_EMBEDDING_METHOD)
+ACTIVE_EMBEDDING_METHOD = normalize_embedding_method(os.getenv("VPAY_EMBEDDING_METHOD", CURRENT_EMBEDDING_METHOD))
+
+def get_embedding_extractor(method):
+    """Return the extractor that produces embeddings comparable with `method`, or None"""
+    method = normalize_embedding_method(method)
+    if is_onnx_embedding_method(method):
+        # Only embeddings of the model file this process loads are comparable
+        try:
+            from tools.speaker_encoder_onnx import current_onnx_embedding_method
+            return generate_onnx_voice_embedding if method == current_onnx_embedding_method() else None
+        except OSError:
+            return None
+    return EMBEDDING_EXTRACTORS.get(method)
+
+def generate_voice_embedding(file_path):
+    """Embed a recording with the active embedding method"""
+    from utils.metrics import stage_timer
+    extractor = get_embedding_extractor(ACTIVE_EMBEDDING_METHOD)
+    if extractor is None:
+        logger.warning(f"Unknown VPAY_EMBEDDING_METHOD {ACTIVE_EMBEDDING_METHOD}, using {CURRENT_EMBEDDING_METHOD}")
+        extractor = generate_100d_voice_embedding
+    with stage_timer("embedding", ACTIVE_EMBEDDING_METHOD):
+        return extractor(file_path)
+
+class ProbeEmbeddings:
+    """
+    Embeddings of one authentication recording, computed lazily per method.
+    
+    During an embedding-method migration some stored rows still hold the old
+    version; scoring asks for the probe in that row's method so auth keeps working.
+    """
+    
+    def __init__(self, file_path, embedding_result):
+        self.file_path = file_path
+        self.cache = {}
+        if embedding_result.get("voice_embedding") is not None:
+            self.cache[normalize_embedding_method(embedding_result.get("method"))] = embedding_result["voice_embedding"]
+    
+    def for_method(self, method):
+        """Probe embedding comparable with `method`, or None if it can't be produced"""
+        from utils.metrics import count_cache
+        method = normalize_embedding_method(method)
+        count_cache("probe_embedding", method in self.cache)
+        if method not in self.cache:
+            extractor = get_embedding_extractor(method)
+            result = extractor(self.file_path) if extractor else None
+            if (result and result.get("voice_embedding") is not None
+                    and normalize_embedding_method(result.get("method")) == method):
+                self.cache[method] = result["voice_embedding"]
+            else:
+                self.cache[method] = None
+        return self.cache[method]
+
 def main():
     # Generate 100-dimensional voice embedding
     print("=== Generating 100D Voice Embedding ===")
@@ -0,0 +1,970 @@
+"""
+numpy-only version of the 100-D audio feature embedding
+
+Computes the same features as tools/voice_to_embedded.py without importing
+librosa (and with it scipy, numba, soundfile and audioread). The STFT is taken
+once and shared by every feature; the mel, DCT and chroma matrices are built
+once per process. The algorithms follow librosa 0.11 with its default
+parameters, so the output is close to, but not bit-identical with, the librosa
+extractor. It is registered under its own embedding method; rows enrolled with
+the librosa extractor can be migrated with
+`python tools/reembedding.py --target-method audio_features_lite:v1`.
+
+Only PCM WAV is decoded natively (that's what main.py converts uploads to);
+anything else is decoded with ffmpeg.
+"""
+import sys
+import os
+import json
+import wave
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from tools.voice_to_embedded import get_audio_hash, generate_hash_based_embedding, normalize_voice_features
+from utils.structured_logging import get_logger
+
+LITE_EMBEDDING_METHOD = "audio_features_lite"
+LITE_EMBEDDING_VERSION = 1
+CURRENT_LITE_EMBEDDING_METHOD = f"{LITE_EMBEDDING_METHOD}:v{LITE_EMBEDDING_VERSION}"
+
+logger = get_logger(__name__)
+
+# librosa defaults the feature code relies on
+SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+N_MFCC = 13
+MAX_DURATION = 30.0
+TOP_DB = 80.0
+AMIN = 1e-10
+TINY = np.finfo(np.float64).tiny
+
+# Pitch search range (typical human voice)
+PITCH_FMIN = 50
+PITCH_FMAX = 400
+
+# Largest relative error allowed between lite and librosa raw features of the same
+# signal, per feature group. Cosine of the normalized embeddings can't be the gate:
+# different clips already score above 0.9999 against each other.
+PARITY_MAX_RELATIVE_ERROR = 1e-3
+
+
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+def load_audio(file_path: str, sr: int = SAMPLE_RATE, duration: Optional[float] = MAX_DURATION) -> np.ndarray:
+    """
+    Decode an audio file to mono float32 at `sr`, like librosa.load
+
+    Args:
+        file_path: Path to the audio file
+        sr: Target sample rate
+        duration: Only read this many seconds from the start (None for all)
+
+    Returns:
+        Mono float32 signal
+    """
+    try:
+        y, native_sr = _read_pcm_wav(file_path, duration)
+    except (wave.Error, EOFError, ValueError):
+        return _decode_with_ffmpeg(file_path, sr, duration)
+    return resample(y, native_sr, sr)
+
+
+def _read_pcm_wav(file_path: str, duration: Optional[float]):
+    with wave.open(file_path, 'rb') as wav_file:
+        n_channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        native_sr = wav_file.getframerate()
+        n_frames = wav_file.getnframes()
+        if duration is not None:
+            n_frames = min(n_frames, int(duration * native_sr))
+        raw = wav_file.readframes(n_frames)
+
+    if sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        data = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        ints = packed[:, 0].astype(np.int32) | (packed[:, 1].astype(np.int32) << 8) | (packed[:, 2].astype(np.int32) << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        data = ints.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        data = np.frombuffer(raw, dtype='<i4').astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width}")
+
+    return data.reshape(-1, n_channels).mean(axis=1).astype(np.float32), native_sr
+
+
+def _decode_with_ffmpeg(file_path: str, sr: int, duration: Optional[float]) -> np.ndarray:
+    cmd = ['ffmpeg', '-v', 'error', '-i', file_path]
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+    cmd += ['-ac', '1', '-ar', str(sr), '-f', 'f32le', '-']
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, timeout=60)
+    except FileNotFoundError:
+        raise RuntimeError(f"ffmpeg is required to decode {Path(file_path).suffix or 'this'} files")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg could not decode {file_path}: {e.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype='<f4').copy()
+
+
+def resample(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Band-limited (FFT) resampling to target_sr"""
+    if orig_sr == target_sr or len(y) == 0:
+        return y
+    n_out = int(np.ceil(len(y) * target_sr / orig_sr))
+    resampled = np.fft.irfft(np.fft.rfft(y), n_out) * (n_out / len(y))
+    return resampled.astype(np.float32)
+
+
+# ---------------------------------------------------------------------------
+# Precomputed filter banks (librosa.filters equivalents)
+# ---------------------------------------------------------------------------
+
+def _hz_to_mel(frequencies):
+    """Slaney mel scale: linear below 1 kHz, logarithmic above"""
+    frequencies = np.asanyarray(frequencies, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(
+        frequencies >= min_log_hz,
+        min_log_mel + np.log(np.maximum(frequencies, min_log_hz) / min_log_hz) / logstep,
+        frequencies / f_sp
+    )
+
+
+def _mel_to_hz(mels):
+    mels = np.asanyarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(
+        mels >= min_log_mel,
+        min_log_hz * np.exp(logstep * (mels - min_log_mel)),
+        f_sp * mels
+    )
+
+
+@lru_cache(maxsize=None)
+def fft_frequencies(sr: int = SAMPLE_RATE, n_fft: int = N_FFT) -> np.ndarray:
+    return np.fft.rfftfreq(n_fft, 1.0 / sr)
+
+
+@lru_cache(maxsize=None)
+def hann_window(length: int = N_FFT) -> np.ndarray:
+    """Periodic Hann window (scipy.signal.get_window('hann', fftbins=True))"""
+    return 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(length) / length)
+
+
+@lru_cache(maxsize=None)
+def mel_filterbank(sr: int = SAMPLE_RATE, n_fft: int = N_FFT, n_mels: int = N_MELS) -> np.ndarray:
+    """Slaney-normalized triangular mel filters, shape (n_mels, 1 + n_fft // 2)"""
+    fftfreqs = fft_frequencies(sr, n_fft)
+    mel_f = _mel_to_hz(np.linspace(_hz_to_mel(0.0), _hz_to_mel(sr / 2.0), n_mels + 2))
+
+    fdiff = np.diff(mel_f)
+    ramps = mel_f[:, None] - fftfreqs[None, :]
+    lower = -ramps[:-2] / fdiff[:-1, None]
+    upper = ramps[2:] / fdiff[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+
+    enorm = 2.0 / (mel_f[2:n_mels + 2] - mel_f[:n_mels])
+    return weights * enorm[:, None]
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(n_mfcc: int = N_MFCC, n_mels: int = N_MELS) -> np.ndarray:
+    """Orthonormal DCT-II basis, shape (n_mfcc, n_mels)"""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2.0 * n_mels)) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+def _hz_to_octs(frequencies, tuning=0.0, bins_per_octave=12):
+    a440 = 440.0 * 2.0 ** (tuning / bins_per_octave)
+    return np.log2(frequencies / (a440 / 16))
+
+
+@lru_cache(maxsize=None)
+def chroma_filterbank(sr: int = SAMPLE_RATE, n_fft: int = N_FFT, tuning: float = 0.0, n_chroma: int = 12) -> np.ndarray:
+    """Gaussian pitch-class filters centred on C, shape (n_chroma, 1 + n_fft // 2)"""
+    frequencies = np.linspace(0, sr, n_fft, endpoint=False)[1:]
+    frqbins = n_chroma * _hz_to_octs(frequencies, tuning=tuning, bins_per_octave=n_chroma)
+    frqbins = np.concatenate(([frqbins[0] - 1.5 * n_chroma], frqbins))
+    binwidthbins = np.concatenate((np.maximum(frqbins[1:] - frqbins[:-1], 1.0), [1]))
+
+    D = np.subtract.outer(frqbins, np.arange(0, n_chroma, dtype='d')).T
+    n_chroma2 = np.round(float(n_chroma) / 2)
+    D = np.remainder(D + n_chroma2 + 10 * n_chroma, n_chroma) - n_chroma2
+
+    wts = np.exp(-0.5 * (2 * D / np.tile(binwidthbins, (n_chroma, 1))) ** 2)
+    wts = wts / np.sqrt(np.sum(wts ** 2, axis=0, keepdims=True))
+    # Gaussian octave weighting centred on C5 (ctroct=5, octwidth=2)
+    wts *= np.tile(np.exp(-0.5 * (((frqbins / n_chroma - 5.0) / 2.0) ** 2)), (n_chroma, 1))
+    wts = np.roll(wts, -3 * (n_chroma // 12), axis=0)
+    return np.ascontiguousarray(wts[:, :int(1 + n_fft / 2)])
+
+
+# ---------------------------------------------------------------------------
+# Framing, STFT and the shared spectral front end
+# ---------------------------------------------------------------------------
+
+def frame_signal(y: np.ndarray, frame_length: int = N_FFT, hop_length: int = HOP_LENGTH,
+                 pad_mode: str = "constant") -> np.ndarray:
+    """Centered frames of y, shape (n_frames, frame_length) (a strided view)"""
+    y = np.pad(y, frame_length // 2, mode=pad_mode)
+    n_frames = 1 + (len(y) - frame_length) // hop_length
+    return np.lib.stride_tricks.sliding_window_view(y, frame_length)[::hop_length][:n_frames]
+
+
+def frame_autocorrelation(frames: np.ndarray, max_lag: int) -> np.ndarray:
+    """Autocorrelation of each frame for lags 0..max_lag (zero-padded FFT)"""
+    n_pad = 1 << int(np.ceil(np.log2(2 * frames.shape[-1] - 1)))
+    spectrum = np.fft.rfft(frames, n=n_pad, axis=-1)
+    return np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=n_pad, axis=-1)[:, :max_lag + 1]
+
+
+def spectral_frontend_batch(signals: List[np.ndarray], sr: int = SAMPLE_RATE) -> List[Dict[str, np.ndarray]]:
+    """
+    Frame-level front end of several signals, computed as stacked batches
+
+    The frames of all signals are concatenated (no padding between clips), so
+    the FFTs and the mel, MFCC and 13-band mel projections each run once for the
+    whole batch. The result is split back into one dict per signal holding the
+    STFT, magnitude, power, log-mel (80 dB floor relative to that signal's own
+    peak, as librosa.power_to_db), MFCC, 13-band mel spectrogram, the frames
+    and their autocorrelation for YIN.
+    """
+    frames = [frame_signal(y) for y in signals]
+    bounds = np.cumsum([0] + [len(f) for f in frames])
+    stacked = np.concatenate(frames)
+
+    stft = np.fft.rfft(stacked * hann_window(), axis=-1).T
+    magnitude = np.abs(stft)
+    power = magnitude ** 2
+
+    mel_db = 10.0 * np.log10(np.maximum(AMIN, mel_filterbank(sr) @ power))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        segment = mel_db[:, start:end]
+        np.maximum(segment, segment.max() - TOP_DB, out=segment)
+
+    mfcc = dct_matrix() @ mel_db
+    mel13 = mel_filterbank(sr, N_FFT, 13) @ power
+    autocorrelation = frame_autocorrelation(stacked, yin_max_period(sr))
+
+    return [
+        {
+            "stft": stft[:, start:end],
+            "magnitude": magnitude[:, start:end],
+            "power": power[:, start:end],
+            "mel_db": mel_db[:, start:end],
+            "mfcc": mfcc[:, start:end],
+            "mel13": mel13[:, start:end],
+            "frames": frames[i],
+            "autocorrelation": autocorrelation[start:end]
+        }
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+def spectral_frontend(y: np.ndarray, sr: int = SAMPLE_RATE) -> Dict[str, np.ndarray]:
+    """Compute the STFT once along with everything derived from it"""
+    return spectral_frontend_batch([y], sr)[0]
+
+
+def istft(stft: np.ndarray, length: int, n_fft: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    """Inverse of the centered STFT (windowed overlap-add), trimmed to `length` samples"""
+    n_frames = stft.shape[1]
+    overlap = n_fft // hop_length
+    window = hann_window(n_fft)
+
+    segments = (np.fft.irfft(stft.T, n=n_fft, axis=-1) * window).reshape(n_frames, overlap, hop_length)
+    window_sq = (window ** 2).reshape(overlap, hop_length)
+
+    signal = np.zeros((n_frames + overlap - 1, hop_length))
+    window_sum = np.zeros((n_frames + overlap - 1, hop_length))
+    for j in range(overlap):
+        signal[j:j + n_frames] += segments[:, j]
+        window_sum[j:j + n_frames] += window_sq[j]
+
+    signal = signal.ravel()
+    window_sum = window_sum.ravel()
+    nonzero = window_sum > TINY
+    signal[nonzero] /= window_sum[nonzero]
+
+    signal = signal[n_fft // 2:n_fft // 2 + length]
+    if len(signal) < length:
+        signal = np.pad(signal, (0, length - len(signal)))
+    return signal
+
+
+# ---------------------------------------------------------------------------
+# Individual features
+# ---------------------------------------------------------------------------
+
+def _normalize_columns(S: np.ndarray, norm: str) -> np.ndarray:
+    """Scale each frame to unit L1 or max norm (silent frames are left as is)"""
+    if norm == "l1":
+        length = np.sum(np.abs(S), axis=0, keepdims=True)
+    else:
+        length = np.max(np.abs(S), axis=0, keepdims=True)
+    length = np.where(length < TINY, 1.0, length)
+    return S / length
+
+
+def _localmax(x: np.ndarray, axis: int = 0) -> np.ndarray:
+    """x[i] > x[i-1] and x[i] >= x[i+1]; the first element is never a maximum"""
+    x = np.moveaxis(x, axis, 0)
+    peaks = np.zeros(x.shape, dtype=bool)
+    peaks[1:-1] = (x[1:-1] > x[:-2]) & (x[1:-1] >= x[2:])
+    peaks[-1] = x[-1] > x[-2]
+    return np.moveaxis(peaks, 0, axis)
+
+
+def _localmin(x: np.ndarray, axis: int = 0) -> np.ndarray:
+    return _localmax(-x, axis=axis)
+
+
+def _parabolic_shifts(x: np.ndarray, axis: int = 0) -> np.ndarray:
+    """Sub-bin offset of the vertex of the parabola through each point and its neighbours"""
+    x = np.moveaxis(x, axis, 0)
+    shifts = np.zeros_like(x)
+    a = x[2:] + x[:-2] - 2 * x[1:-1]
+    b = (x[2:] - x[:-2]) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shifts[1:-1] = np.where(np.abs(b) >= np.abs(a), 0.0, -b / a)
+    return np.moveaxis(shifts, 0, axis)
+
+
+def spectral_peaks(power: np.ndarray, sr: int = SAMPLE_RATE, n_fft: int = N_FFT):
+    """Interpolated frequency and magnitude of the spectral peaks librosa.piptrack reports"""
+    freqs = fft_frequencies(sr, n_fft)
+    shifts = _parabolic_shifts(power, axis=0)
+    dskew = 0.5 * np.gradient(power, axis=0) * shifts
+
+    freq_mask = ((150.0 <= freqs) & (freqs < min(4000.0, sr / 2.0)))[:, None]
+    ref_value = 0.1 * power.max(axis=0, keepdims=True)
+    idx = np.nonzero(freq_mask & _localmax(power * (power > ref_value), axis=0))
+    pitches = (idx[0] + shifts[idx]) * float(sr) / n_fft
+    mags = power[idx] + dskew[idx]
+    return pitches, mags
+
+
+# Histogram bins of the tuning deviation, in fractions of a semitone
+TUNING_BINS = np.linspace(-0.5, 0.5, 101)
+
+
+def tuning_residuals(pitches: np.ndarray) -> np.ndarray:
+    residual = np.mod(12 * _hz_to_octs(pitches), 1.0)
+    residual[residual >= 0.5] -= 1.0
+    return residual
+
+
+def estimate_tuning(power: np.ndarray, sr: int = SAMPLE_RATE, n_fft: int = N_FFT) -> float:
+    """Deviation from A440 tuning in fractions of a semitone (librosa.estimate_tuning)"""
+    pitches, mags = spectral_peaks(power, sr, n_fft)
+    if len(pitches) == 0:
+        return 0.0
+
+    pitches = pitches[(mags >= np.median(mags)) & (pitches > 0)]
+    if len(pitches) == 0:
+        return 0.0
+
+    counts, edges = np.histogram(tuning_residuals(pitches), TUNING_BINS)
+    return float(edges[np.argmax(counts)])
+
+
+def chroma_stft(power: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+    tuning = round(estimate_tuning(power, sr), 2)
+    return _normalize_columns(chroma_filterbank(sr, N_FFT, tuning) @ power, norm="max")
+
+
+def spectral_shape(magnitude: np.ndarray, sr: int = SAMPLE_RATE):
+    """Spectral centroid, 85% rolloff and bandwidth per frame"""
+    freqs = fft_frequencies(sr)[:, None]
+    S_norm = _normalize_columns(magnitude, norm="l1")
+    centroid = np.sum(freqs * S_norm, axis=0)
+    bandwidth = np.sqrt(np.sum(S_norm * (freqs - centroid) ** 2, axis=0))
+
+    total_energy = np.cumsum(magnitude, axis=0)
+    below = total_energy < 0.85 * total_energy[-1]
+    rolloff = np.min(np.where(below, np.inf, freqs), axis=0)
+    return centroid, rolloff, bandwidth
+
+
+def zero_crossing_rate(y: np.ndarray, frame_length: int = N_FFT, hop_length: int = HOP_LENGTH) -> np.ndarray:
+    padded = np.pad(y, frame_length // 2, mode="edge")
+    signs = np.signbit(np.where(np.abs(padded) <= 1e-10, 0.0, padded))
+    crossings = np.concatenate(([0], np.cumsum(signs[1:] != signs[:-1])))
+    n_frames = 1 + (len(padded) - frame_length) // hop_length
+    starts = np.arange(n_frames) * hop_length
+    # A frame counts crossings into each of its samples after the first
+    return (crossings[starts + frame_length - 1] - crossings[starts]) / frame_length
+
+
+def rms(y: np.ndarray) -> np.ndarray:
+    frames = frame_signal(y)
+    return np.sqrt(np.mean(np.abs(frames) ** 2, axis=-1))
+
+
+def onset_strength(mel_db: np.ndarray, aggregate=np.mean) -> np.ndarray:
+    """Spectral flux of the log-mel spectrogram, centered like librosa.onset.onset_strength"""
+    flux = np.maximum(0.0, mel_db[:, 1:] - mel_db[:, :-1])
+    envelope = aggregate(flux, axis=0)
+    envelope = np.pad(envelope, (1 + N_FFT // (2 * HOP_LENGTH), 0))
+    return envelope[:mel_db.shape[1]]
+
+
+def onset_detect(envelope: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Peak-picked onset frames (librosa.onset.onset_detect defaults)"""
+    envelope = envelope - np.min(envelope)
+    envelope = envelope / (np.max(envelope) + TINY)
+    if not envelope.any() or not np.all(np.isfinite(envelope)):
+        return np.array([], dtype=int)
+
+    pre_max = int(np.ceil(0.03 * sr // HOP_LENGTH))
+    post_max = int(np.ceil(0.00 * sr // HOP_LENGTH + 1))
+    pre_avg = int(np.ceil(0.10 * sr // HOP_LENGTH))
+    post_avg = int(np.ceil(0.10 * sr // HOP_LENGTH + 1))
+    wait = int(np.ceil(0.03 * sr // HOP_LENGTH))
+    delta = 0.07
+
+    x = envelope.tolist()
+    n_total = len(x)
+    peaks = []
+    if x[0] >= max(x[:min(post_max, n_total)]) and \
+            x[0] >= np.mean(x[:min(post_avg, n_total)]) + delta:
+        peaks.append(0)
+        n = wait + 1
+    else:
+        n = 1
+    while n < n_total:
+        if x[n] != max(x[max(0, n - pre_max):min(n + post_max, n_total)]):
+            n += 1
+            continue
+        window = x[max(0, n - pre_avg):min(n + post_avg, n_total)]
+        if x[n] < sum(window) / len(window) + delta:
+            n += 1
+            continue
+        peaks.append(n)
+        n += wait + 1
+    return np.array(peaks, dtype=int)
+
+
+TEMPOGRAM_BLOCK = 256
+
+
+def estimate_tempo(envelope: np.ndarray, sr: int = SAMPLE_RATE, start_bpm: float = 120.0) -> float:
+    """Global tempo from the mean autocorrelation tempogram with a log-normal prior around start_bpm"""
+    win_length = int(np.floor(8.0 * sr / HOP_LENGTH))
+    n = len(envelope)
+    padded = np.pad(envelope, win_length // 2, mode="linear_ramp", end_values=[0, 0])
+    frames = np.lib.stride_tricks.sliding_window_view(padded, win_length)[:n]
+
+    # Mean tempogram column, accumulated in blocks so memory stays flat for long clips
+    n_pad = 1 << int(np.ceil(np.log2(2 * win_length - 1)))
+    tempogram = np.zeros(win_length)
+    for start in range(0, n, TEMPOGRAM_BLOCK):
+        block = frames[start:start + TEMPOGRAM_BLOCK] * hann_window(win_length)
+        autocorr = np.fft.irfft(np.abs(np.fft.rfft(block, n=n_pad, axis=-1)) ** 2, n=n_pad, axis=-1)[:, :win_length]
+        tempogram += _normalize_columns(autocorr.T, norm="max").sum(axis=1)
+    tempogram /= max(n, 1)
+
+    with np.errstate(divide='ignore'):
+        bpms = np.concatenate(([np.inf], 60.0 * sr / (HOP_LENGTH * np.arange(1.0, win_length))))
+    logprior = -0.5 * ((np.log2(bpms) - np.log2(start_bpm)) / 1.0) ** 2
+    logprior[:int(np.argmax(bpms < 320.0))] = -np.inf
+    return float(bpms[np.argmax(np.log1p(1e6 * tempogram) + logprior)])
+
+
+def beat_track(envelope: np.ndarray, sr: int = SAMPLE_RATE, tightness: float = 100.0):
+    """
+    Ellis dynamic-programming beat tracker (librosa.beat.beat_track)
+
+    Args:
+        envelope: Median-aggregated onset strength envelope
+
+    Returns:
+        (tempo in BPM, beat frame indices)
+    """
+    if not envelope.any():
+        return 0.0, np.array([], dtype=int)
+
+    bpm = estimate_tempo(envelope, sr)
+    frames_per_beat = float(np.round(float(sr) / HOP_LENGTH * 60.0 / bpm))
+
+    onsets = envelope / (envelope.std(ddof=1) + TINY)
+    window = np.exp(-0.5 * (np.arange(-frames_per_beat, frames_per_beat + 1) * 32.0 / frames_per_beat) ** 2)
+    localscore = np.convolve(onsets, window, mode="full")[len(window) // 2:len(window) // 2 + len(onsets)]
+
+    n_frames = len(localscore)
+    min_gap = int(np.round(frames_per_beat / 2))
+    max_gap = int(2 * frames_per_beat)
+    gaps = np.arange(min_gap, max_gap + 1)
+    penalty = tightness * (np.log(np.maximum(gaps, 1)) - np.log(frames_per_beat)) ** 2
+
+    cumscore = np.zeros(n_frames)
+    backlink = np.full(n_frames, -1, dtype=int)
+    score_thresh = 0.01 * localscore.max()
+    first_beat = True
+    for i in range(n_frames):
+        usable = gaps <= i
+        beat_location = -1
+        best_score = 0.0
+        if usable.any():
+            candidates = cumscore[i - gaps[usable]] - penalty[usable]
+            best = int(np.argmax(candidates))
+            best_score = candidates[best]
+            beat_location = i - int(gaps[usable][best])
+        cumscore[i] = localscore[i] + best_score
+
+        if first_beat and localscore[i] < score_thresh:
+            backlink[i] = -1
+        else:
+            backlink[i] = beat_location
+            first_beat = False
+
+    # Last beat: the latest local maximum of the cumulative score above half the median peak
+    peaks = _localmax(cumscore)
+    threshold = 0.5 * np.median(cumscore[peaks]) if peaks.any() else 0.0
+    candidates = np.flatnonzero(peaks & (cumscore >= threshold))
+    tail = int(candidates[-1]) if len(candidates) else n_frames - 1
+
+    beats = np.zeros(n_frames, dtype=bool)
+    n = tail
+    while n >= 0:
+        beats[n] = True
+        n = backlink[n]
+
+    # Drop leading and trailing beats on weak onsets
+    hann5 = 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(5) / 4)
+    smooth = np.convolve(localscore[beats], hann5)[2:n_frames + 2]
+    trim_threshold = 0.5 * np.sqrt(np.mean(smooth ** 2))
+    n = 0
+    while n < n_frames and localscore[n] <= trim_threshold:
+        beats[n] = False
+        n += 1
+    n = n_frames - 1
+    while n >= 0 and localscore[n] <= trim_threshold:
+        beats[n] = False
+        n -= 1
+
+    return bpm, np.flatnonzero(beats)
+
+
+def _median_filter(x: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Median filter along one axis with symmetric edges, computed in row blocks to bound memory"""
+    x = np.moveaxis(x, axis, -1)
+    half = size // 2
+    padded = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(half, half)], mode="symmetric")
+    out = np.empty_like(x)
+    rows = max(1, (1 << 22) // max(1, x.shape[-1] * size))
+    for start in range(0, x.shape[0], rows):
+        windows = np.lib.stride_tricks.sliding_window_view(padded[start:start + rows], size, axis=-1)
+        out[start:start + rows] = np.partition(windows, half, axis=-1)[..., half]
+    return np.moveaxis(out, -1, axis)
+
+
+def hpss(stft: np.ndarray, magnitude: np.ndarray, length: int, kernel_size: int = 31):
+    """Harmonic/percussive separation by median filtering (librosa.effects.hpss)"""
+    # Median filtering dominates the extractor's cost; float32 (what librosa uses) is ~25% faster
+    magnitude32 = magnitude.astype(np.float32)
+    harmonic = _median_filter(magnitude32, kernel_size, axis=1).astype(np.float64)
+    percussive = _median_filter(magnitude32, kernel_size, axis=0).astype(np.float64)
+
+    harmonic_power = harmonic ** 2
+    total_power = harmonic_power + percussive ** 2
+    silent = np.maximum(harmonic, percussive) < TINY
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mask_harmonic = np.where(silent, 0.5, harmonic_power / total_power)
+
+    y_harmonic = istft(stft * mask_harmonic, length)
+    y_percussive = istft(stft * (1.0 - mask_harmonic), length)
+    return y_harmonic, y_percussive
+
+
+def yin_max_period(sr: int = SAMPLE_RATE, fmin: float = PITCH_FMIN, frame_length: int = N_FFT) -> int:
+    return min(int(np.ceil(sr / fmin)), frame_length - 1)
+
+
+def yin(y: np.ndarray, fmin: float = PITCH_FMIN, fmax: float = PITCH_FMAX, sr: int = SAMPLE_RATE,
+        frame_length: int = N_FFT, hop_length: int = HOP_LENGTH, trough_threshold: float = 0.1,
+        frames: Optional[np.ndarray] = None, autocorrelation: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Fundamental frequency per frame with the YIN algorithm (librosa.yin)
+
+    frames and autocorrelation can be passed in from spectral_frontend, whose
+    framing is the same as YIN's with the default frame and hop length.
+    """
+    if frames is None:
+        frames = frame_signal(y, frame_length, hop_length)
+    min_period = int(np.floor(sr / fmax))
+    max_period = yin_max_period(sr, fmin, frame_length)
+
+    if autocorrelation is None:
+        autocorrelation = frame_autocorrelation(frames, max_period)
+    acf = autocorrelation[:, :max_period + 1]
+
+    energy = np.cumsum(frames.astype(np.float64) ** 2, axis=-1)
+    energy[:, 0] = 0
+    difference = np.zeros((frames.shape[0], max_period + 1))
+    difference[:, 1:] = 2 * (acf[:, :1] - acf[:, 1:]) - energy[:, :max_period]
+
+    cumulative_mean = np.cumsum(difference[:, 1:], axis=-1) / np.arange(1, max_period + 1)
+    yin_frames = difference[:, min_period:] / (cumulative_mean[:, min_period - 1:] + TINY)
+
+    shifts = _parabolic_shifts(yin_frames, axis=1)
+    is_trough = _localmin(yin_frames, axis=1)
+    is_trough[:, 0] = yin_frames[:, 0] < yin_frames[:, 1]
+    is_threshold_trough = is_trough & (yin_frames < trough_threshold)
+
+    period = np.argmax(is_threshold_trough, axis=1)
+    no_trough = ~is_threshold_trough.any(axis=1)
+    period[no_trough] = np.argmin(yin_frames[no_trough], axis=1)
+
+    rows = np.arange(len(period))
+    return sr / (min_period + period + shifts[rows, period])
+
+
+# ---------------------------------------------------------------------------
+# Embedding
+# ---------------------------------------------------------------------------
+
+def compute_raw_voice_features_lite(y: np.ndarray, sr: int = SAMPLE_RATE,
+                                    frontend: Optional[Dict[str, np.ndarray]] = None) -> List[float]:
+    """
+    The 100 unnormalized features, in the order of compute_raw_voice_features
+
+    Args:
+        y: Mono float signal at SAMPLE_RATE
+        sr: Sample rate of y (the filter banks are built for it)
+        frontend: Precomputed spectral_frontend(y), e.g. from spectral_frontend_batch
+
+    Returns:
+        List of 100 floats
+    """
+    if frontend is None:
+        frontend = spectral_frontend(y, sr)
+    stft, magnitude, power = frontend["stft"], frontend["magnitude"], frontend["power"]
+    mfcc = frontend["mfcc"]
+    duration = len(y) / sr
+
+    features = []
+
+    # 1-26: MFCC means and standard deviations
+    features.extend(np.mean(mfcc, axis=1))
+    features.extend(np.std(mfcc, axis=1))
+
+    # 27-38: Chroma
+    features.extend(np.mean(chroma_stft(power, sr), axis=1))
+
+    # 39-45: Spectral shape
+    centroid, rolloff, bandwidth = spectral_shape(magnitude, sr)
+    features.extend([
+        np.mean(centroid), np.std(centroid),
+        np.mean(rolloff), np.std(rolloff),
+        np.mean(bandwidth), np.std(bandwidth),
+        np.mean(zero_crossing_rate(y))
+    ])
+
+    # 46-52: Tempo and rhythm
+    onset_envelope = onset_strength(frontend["mel_db"])
+    tempo, beats = beat_track(onset_strength(frontend["mel_db"], aggregate=np.median), sr)
+    onset_frames = onset_detect(onset_envelope, sr)
+    features.extend([
+        tempo / 200.0,
+        len(beats) / duration if len(y) > 0 else 0,
+        len(onset_frames) / duration if len(y) > 0 else 0,
+        np.std(np.diff(beats)) if len(beats) > 1 else 0,
+        np.mean(onset_envelope),
+        np.std(onset_envelope),
+        np.mean(np.diff(onset_frames)) if len(onset_frames) > 1 else 0
+    ])
+
+    # 53-65: Energy and amplitude
+    frame_rms = rms(y)
+    abs_diff = np.abs(np.diff(y))
+    features.extend([
+        np.mean(frame_rms), np.std(frame_rms),
+        np.mean(y ** 2), np.std(y ** 2),
+        np.max(np.abs(y)), np.mean(np.abs(y)),
+        *np.percentile(y, [95, 75, 25, 5]),
+        duration,
+        np.mean(abs_diff), np.std(abs_diff)
+    ])
+
+    # 66-78: 13-band mel spectrogram means
+    features.extend(np.mean(frontend["mel13"], axis=1))
+
+    # 79-85: Harmonic and percussive
+    y_harmonic, y_percussive = hpss(stft, magnitude, len(y))
+    features.extend([
+        np.mean(y_harmonic ** 2), np.mean(y_percussive ** 2),
+        np.std(y_harmonic), np.std(y_percussive),
+        np.corrcoef(y_harmonic, y_percussive)[0, 1],
+        np.mean(np.abs(y_harmonic)), np.mean(np.abs(y_percussive))
+    ])
+
+    # 86-90: Pitch
+    f0 = yin(y, sr=sr, frames=frontend["frames"], autocorrelation=frontend["autocorrelation"])
+    f0_clean = f0[f0 > 0]
+    if len(f0_clean) > 0:
+        features.extend([
+            np.mean(f0_clean), np.std(f0_clean),
+            np.min(f0_clean), np.max(f0_clean),
+            np.percentile(f0_clean, 75) - np.percentile(f0_clean, 25)
+        ])
+    else:
+        features.extend([0, 0, 0, 0, 0])
+
+    # 91-94: STFT magnitude statistics
+    frame_magnitude = np.sum(magnitude, axis=0)
+    features.extend([
+        np.mean(magnitude), np.std(magnitude),
+        np.mean(frame_magnitude), np.std(frame_magnitude)
+    ])
+
+    # 95-100: Voice quality
+    if len(f0_clean) > 1 and np.mean(f0_clean) > 0:
+        features.append(np.std(np.diff(f0_clean)) / np.mean(f0_clean))
+    else:
+        features.append(0)
+
+    frame_energies = np.sum(power, axis=0)
+    if len(frame_energies) > 1 and np.mean(frame_energies) > 0:
+        features.append(np.std(np.diff(frame_energies)) / np.mean(frame_energies))
+    else:
+        features.append(0)
+
+    hnr = np.mean(y_harmonic ** 2) / (np.mean((y - y_harmonic) ** 2) + 1e-10)
+    features.append(np.log10(hnr + 1e-10))
+
+    freqs = fft_frequencies(sr)
+    half = len(freqs) // 2
+    features.append(np.polyfit(freqs[:half], np.mean(magnitude[:half], axis=1), 1)[0])
+
+    features.append(np.mean(frame_rms > np.percentile(frame_rms, 30)))
+    features.append(np.var(centroid))
+
+    return [float(value) for value in features[:100]]
+
+
+def compute_voice_features_lite(y: np.ndarray, sr: int = SAMPLE_RATE,
+                                frontend: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """Normalized 100-D embedding of a signal (numpy-only counterpart of compute_voice_features)"""
+    return normalize_voice_features(compute_raw_voice_features_lite(y, sr, frontend))
+
+
+def generate_100d_voice_embedding_lite(file_path: str) -> Dict[str, Any]:
+    """Generate the 100-dimensional voice embedding without librosa"""
+    try:
+        logger.debug(f"Processing audio file (lite): {file_path}")
+        y = load_audio(file_path)
+        logger.debug(f"Loaded audio: {len(y)} samples at {SAMPLE_RATE} Hz")
+
+        features = compute_voice_features_lite(y)
+
+        return {
+            "voice_embedding": features.round(6).tolist(),
+            "method": CURRENT_LITE_EMBEDDING_METHOD,
+            "dimensions": len(features),
+            "file_hash": get_audio_hash(file_path)
+        }
+
+    except Exception as e:
+        logger.warning(f"Lite audio feature extraction failed: {e}")
+        return generate_hash_based_embedding(file_path, str(e))
+
+
+# ---------------------------------------------------------------------------
+# Parity and startup comparison against the librosa extractor
+# ---------------------------------------------------------------------------
+
+FEATURE_GROUPS = [
+    ("mfcc_mean", 0, 13), ("mfcc_std", 13, 26), ("chroma", 26, 38), ("spectral", 38, 45),
+    ("rhythm", 45, 52), ("energy", 52, 65), ("mel", 65, 78), ("hpss", 78, 85),
+    ("pitch", 85, 90), ("stft", 90, 94), ("voice_quality", 94, 100)
+]
+
+
+def _cosine(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    denominator = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denominator) if denominator > 0 else 0.0
+
+
+def compare_with_librosa(file_paths: List[str]) -> Dict[str, Any]:
+    """
+    Check lite features against the librosa extractor
+
+    Each clip is compared twice: on the signal decoded by librosa (feature code
+    only) and end to end (each extractor decoding the file itself). Parity passes
+    when every feature group's raw relative error on the same signal stays below
+    PARITY_MAX_RELATIVE_ERROR; the cosines are reported for information only.
+    """
+    import librosa
+    from tools.voice_to_embedded import compute_raw_voice_features
+
+    results = []
+    for file_path in file_paths:
+        y_ref, sr = librosa.load(file_path, duration=MAX_DURATION)
+        raw_ref = np.array(compute_raw_voice_features(y_ref, sr), dtype=np.float64)
+        raw_lite = np.array(compute_raw_voice_features_lite(y_ref, sr), dtype=np.float64)
+        end_to_end = compute_voice_features_lite(load_audio(file_path))
+
+        relative_error = np.abs(raw_lite - raw_ref) / np.maximum(np.abs(raw_ref), 1e-6)
+        results.append({
+            "file": file_path,
+            "cosine_same_signal": round(_cosine(normalize_voice_features(raw_ref), normalize_voice_features(raw_lite)), 5),
+            "cosine_end_to_end": round(_cosine(normalize_voice_features(raw_ref), end_to_end), 5),
+            "max_relative_error_by_group": {
+                name: float(f"{np.max(relative_error[start:end]):.3g}") for name, start, end in FEATURE_GROUPS
+            }
+        })
+
+    failures = [
+        {"file": r["file"], "group": group, "max_relative_error": error}
+        for r in results
+        for group, error in r["max_relative_error_by_group"].items()
+        if not error < PARITY_MAX_RELATIVE_ERROR
+    ]
+    return {
+        "passed": bool(results) and not failures,
+        "max_relative_error": PARITY_MAX_RELATIVE_ERROR,
+        "failures": failures,
+        "clips": results
+    }
+
+
+def write_synthetic_parity_clips(out_dir: str) -> List[str]:
+    """
+    PCM WAVs covering the parity-relevant paths, no ffmpeg or recordings needed
+
+    Speech-like clips at the native and the upload rate (resampling), a short clip
+    (few frames, edge padding) and a higher-pitched voice with more noise.
+    """
+    from tools.embedding_warmup import synthesize_warmup_clip, write_wav
+
+    rng = np.random.default_rng(7)
+    t = np.arange(SAMPLE_RATE * 2) / SAMPLE_RATE
+    f0 = 220.0 + 30.0 * np.sin(2 * np.pi * 3.0 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    high_voice = (0.5 * sum(np.sin(k * phase) / k for k in range(1, 6)) * np.clip(np.sin(2 * np.pi * 3.0 * t), 0, None)
+                  + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+    clips = [
+        ("speech_22k", synthesize_warmup_clip(SAMPLE_RATE), SAMPLE_RATE),
+        ("speech_16k", synthesize_warmup_clip(16000), 16000),
+        ("short_1s", synthesize_warmup_clip(SAMPLE_RATE, 1.0), SAMPLE_RATE),
+        ("high_voice", high_voice, SAMPLE_RATE)
+    ]
+    paths = []
+    for name, signal, sr in clips:
+        path = os.path.join(out_dir, f"{name}.wav")
+        write_wav(path, signal, sr)
+        paths.append(path)
+    return paths
+
+
+def check_synthetic_parity() -> Dict[str, Any]:
+    """compare_with_librosa on write_synthetic_parity_clips (the automated parity gate)"""
+    with tempfile.TemporaryDirectory(prefix="lite_parity_") as out_dir:
+        report = compare_with_librosa(write_synthetic_parity_clips(out_dir))
+    for clip in report["clips"]:
+        clip["file"] = os.path.basename(clip["file"])
+    for failure in report["failures"]:
+        failure["file"] = os.path.basename(failure["file"])
+    return report
+
+
+_STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from utils.lazy_loader import current_rss_mb
+import {module} as extractor
+imported = time.perf_counter()
+result = extractor.{function}({clip!r})
+finished = time.perf_counter()
+print(json.dumps({{"import_seconds": round(imported - started, 3),
+                  "first_call_seconds": round(finished - imported, 3),
+                  "method": result["method"], "rss_mb": current_rss_mb()}}))
+"""
+
+
+def compare_startup(clip_path: Optional[str] = None) -> Dict[str, Any]:
+    """Import time, first-call latency and process RSS of each extractor in a fresh interpreter"""
+    from tools.embedding_warmup import synthesize_warmup_clip, write_wav, WARMUP_SAMPLE_RATE
+
+    tmp_path = None
+    if clip_path is None:
+        tmp_path = str(backend_dir / "lite_startup_probe.wav")
+        write_wav(tmp_path, synthesize_warmup_clip(), WARMUP_SAMPLE_RATE)
+        clip_path = tmp_path
+
+    report = {}
+    try:
+        for name, module, function in [
+            ("librosa", "tools.voice_to_embedded", "generate_100d_voice_embedding"),
+            ("lite", "tools.voice_to_embedded_lite", "generate_100d_voice_embedding_lite")
+        ]:
+            script = _STARTUP_PROBE.format(backend=str(backend_dir), module=module, function=function, clip=clip_path)
+            proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=600)
+            lines = proc.stdout.strip().splitlines()
+            report[name] = json.loads(lines[-1]) if proc.returncode == 0 and lines else {"error": proc.stderr.strip()[-500:]}
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the lite extractor against librosa")
+    parser.add_argument("clips", nargs="*", help="Recordings to compare (default: prototype/*.mp3, needs ffmpeg)")
+    parser.add_argument("--synthetic-only", action="store_true",
+                        help="Only run the synthetic WAV parity gate (no ffmpeg or recordings needed)")
+    args = parser.parse_args()
+
+    print("=== Parity on synthetic WAVs ===")
+    synthetic = check_synthetic_parity()
+    print(json.dumps(synthetic, indent=2))
+    passed = synthetic["passed"]
+
+    if not args.synthetic_only:
+        clips = args.clips or [str(p) for p in sorted((backend_dir / "prototype").glob("*.mp3"))]
+        print("\n=== Parity with the librosa extractor ===")
+        parity = compare_with_librosa(clips)
+        print(json.dumps(parity, indent=2))
+        passed = passed and parity["passed"]
+
+        print("\n=== Startup and memory ===")
+        print(json.dumps(compare_startup(), indent=2))
+
+    if not passed:
+        print(f"\nParity FAILED: raw feature relative error at or above {PARITY_MAX_RELATIVE_ERROR}")
+        sys.exit(1)
+    print("\nParity OK")
+
+
+if __name__ == "__main__":
+    main()
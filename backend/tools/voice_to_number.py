@@ -1,28 +1,118 @@
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Part
 from pathlib import Path
 from dotenv import load_dotenv
+import sys
 import base64
 import os
+import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import threading
 import mimetypes
+from collections import deque
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.structured_logging import get_logger
 
 # Load environment variables once at startup
 load_dotenv()
 
+logger = get_logger(__name__)
+
+# Async Gemini calls: concurrent requests, per-call deadline, and hedging (a duplicate
+# request once the first has been outstanding longer than the recent p95 latency)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+GEMINI_HEDGING = os.getenv("GEMINI_HEDGING", "0").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = 20
+
+# Response schemas (OpenAPI subset) for Gemini structured output: the model is
+# constrained to emit JSON of this shape, so responses parse without cleanup
+SECRET_NUMBERS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "numbers": {"type": "ARRAY", "items": {"type": "INTEGER"}}
+    },
+    "required": ["numbers"]
+}
+
+VOICE_COMMAND_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "transcript": {"type": "STRING"},
+        "intent": {"type": "STRING", "enum": ["payment", "pin", "other"]},
+        "digits": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+        "amount": {"type": "NUMBER", "nullable": True},
+        "currency": {"type": "STRING", "nullable": True},
+        "recipient": {"type": "STRING", "nullable": True}
+    },
+    "required": ["transcript", "intent", "digits", "amount", "currency", "recipient"]
+}
+
+SECRET_NUMBERS_PROMPT = 'Extract exactly 5 secret numbers (single digits 0-9) spoken in this audio file.'
+
+VOICE_COMMAND_PROMPT = """
+Transcribe this voice recording and interpret it for a voice payment app.
+
+- transcript: what was said, verbatim
+- intent: "payment" if the speaker asks to pay/send/transfer money, "pin" if they
+  only say a sequence of digits, otherwise "other"
+- digits: every single digit spoken, in order (spoken words like "seven" count), as integers 0-9
+- amount: the payment amount in major units (e.g. 12.50), or null
+- currency: ISO 4217 code in lowercase (e.g. "usd"), or null if no amount
+- recipient: the name of who is being paid, or null
+"""
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging delay"""
+    
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+    
+    def percentile(self, q: float):
+        """q-th percentile in seconds, or None until HEDGE_MIN_SAMPLES calls have finished"""
+        with self.lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
 class AudioProcessor:
     def __init__(self):
-        # Initialize Vertex AI once
         self.PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
         self.LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
-        vertexai.init(project=self.PROJECT, location=self.LOCATION)
+        
+        from utils.offline_services import OFFLINE_MODE
+        if OFFLINE_MODE:
+            # In-process fake with injected latency/errors (VPAY_OFFLINE=1)
+            from utils.offline_services import FakeGenerativeModel as GenerativeModel, Part, GenerationConfig
+        else:
+            # Vertex AI is imported here so importing this module stays cheap
+            import vertexai
+            from vertexai.preview.generative_models import GenerativeModel, Part, GenerationConfig
+            
+            # Initialize Vertex AI once
+            vertexai.init(project=self.PROJECT, location=self.LOCATION)
+        self.Part = Part
+        self.GenerationConfig = GenerationConfig
         
         # Reuse model instance
         self.model = GenerativeModel('gemini-2.5-flash')
         
-        # Thread pool for I/O operations
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # Async call controls; the semaphore belongs to the event loop that created it
+        self.max_concurrency = max(1, GEMINI_MAX_CONCURRENCY)
+        self.timeout = GEMINI_TIMEOUT_SECONDS
+        self.hedging = GEMINI_HEDGING
+        self.latency = LatencyTracker()
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0}
 
     def audio_to_base64_optimized(self, file_path):
         """Optimized audio to base64 conversion with proper MIME type detection"""
@@ -38,24 +128,20 @@ class AudioProcessor:
             encoded = base64.b64encode(audio_file.read()).decode('utf-8')
             return f"data:{mime_type};base64,{encoded}"
 
+    def audio_part(self, file_path, data=None):
+        """Inline audio part for a request (pass `data` when the bytes are already read)"""
+        return self.Part.from_data(
+            data=data if data is not None else Path(file_path).read_bytes(),
+            mime_type=mimetypes.guess_type(str(file_path))[0] or 'audio/mp3'
+        )
+
     def process_audio_direct(self, file_path):
-        """Use direct file upload instead of base64 if supported"""
-        try:
-            # Try direct file approach first (more efficient)
-            audio_part = Part.from_data(
-                data=Path(file_path).read_bytes(),
-                mime_type=mimetypes.guess_type(str(file_path))[0] or 'audio/mp3'
-            )
-            
-            response = self.model.generate_content([
-                "Extract the 5 secret numbers from this audio file:",
-                audio_part
-            ])
-            return response.text
-            
-        except Exception as e:
-            print(f"Direct upload failed, falling back to base64: {e}")
-            return self.process_audio_base64(file_path)
+        """Upload the audio inline and return the model's text answer"""
+        response = self.model.generate_content([
+            "Extract the 5 secret numbers from this audio file:",
+            self.audio_part(file_path)
+        ])
+        return response.text
 
     def process_audio_base64(self, file_path):
         """Fallback base64 method"""
@@ -67,22 +153,97 @@ class AudioProcessor:
         ])
         return response.text
 
+    def semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _call_async(self, contents, generation_config=None):
+        """One model request, holding a concurrency slot while it runs"""
+        async with self.semaphore():
+            started = time.perf_counter()
+            self.stats["calls"] += 1
+            response = await self.model.generate_content_async(contents, generation_config=generation_config)
+            self.latency.record(time.perf_counter() - started)
+            return response
+
+    async def generate_async(self, contents, generation_config=None, timeout=None):
+        """
+        generate_content_async with bounded concurrency, a deadline and optional hedging
+        
+        With hedging on, a duplicate request is sent if the first hasn't answered by
+        the recent p95 latency and a concurrency slot is free; the first successful
+        response wins and the other request is cancelled.
+        
+        Args:
+            contents: Request contents (prompt and parts)
+            generation_config: Optional GenerationConfig
+            timeout: Deadline in seconds for the whole call (default GEMINI_TIMEOUT_SECONDS)
+            
+        Returns:
+            The model response
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(self._hedged_call(contents, generation_config), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise TimeoutError(f"Gemini call exceeded {timeout:.1f}s deadline")
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+    async def _hedged_call(self, contents, generation_config):
+        primary = asyncio.create_task(self._call_async(contents, generation_config))
+        hedge_delay = self.latency.percentile(95) if self.hedging else None
+        if hedge_delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and not self.semaphore().locked():
+                self.stats["hedges"] += 1
+                tasks.add(asyncio.create_task(self._call_async(contents, generation_config)))
+
+            # First successful response wins; only fail once every request has failed
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def process_audio_async(self, file_path):
-        """Async version for handling multiple files"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.executor, 
-            self.process_audio_direct, 
-            file_path
-        )
+        """Async process_audio_direct; waits on the network without holding a thread"""
+        data = await asyncio.to_thread(Path(file_path).read_bytes)
+        response = await self.generate_async([
+            "Extract the 5 secret numbers from this audio file:",
+            self.audio_part(file_path, data)
+        ])
+        return response.text
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        p95 = self.latency.percentile(95)
+        stats["p95_seconds"] = round(p95, 3) if p95 is not None else None
+        stats["max_concurrency"] = self.max_concurrency
+        stats["hedging"] = self.hedging
+        return stats
 
     def process_with_enhanced_prompt(self, file_path):
         """Enhanced prompt for better accuracy with JSON output"""
         try:
-            audio_part = Part.from_data(
-                data=Path(file_path).read_bytes(),
-                mime_type=mimetypes.guess_type(str(file_path))[0] or 'audio/mp3'
-            )
+            audio_part = self.audio_part(file_path)
             
             enhanced_prompt = """
             Carefully analyze this audio file and extract exactly 5 secret numbers.
@@ -99,53 +260,113 @@ class AudioProcessor:
             Example: {"numbers": [7, 42, 13, 89, 5]}
             """
             
-            response = self.model.generate_content([enhanced_prompt, audio_part])
+            response = self.model.generate_content(
+                [enhanced_prompt, audio_part],
+                generation_config=self.json_config(SECRET_NUMBERS_SCHEMA)
+            )
             return self.parse_json_response(response.text)
             
         except Exception as e:
-            print(f"Enhanced processing failed: {e}")
-            return self.process_audio_direct(file_path)
+            logger.warning("Enhanced processing failed", extra={"error": str(e)})
+            return {"numbers": [], "error": str(e)}
+    
+    def json_config(self, schema):
+        """Generation config that constrains the response to JSON matching `schema`"""
+        return self.GenerationConfig(
+            temperature=0.0,
+            response_mime_type="application/json",
+            response_schema=schema
+        )
     
     def parse_json_response(self, response_text):
-        """Parse and validate JSON response"""
+        """Parse a structured-output response (already JSON, no re-parsing of free text)"""
         import json
-        import re
         
         try:
-            # Try to parse directly first
-            return json.loads(response_text.strip())
-        except json.JSONDecodeError:
-            # Extract JSON from response if wrapped in other text
-            json_match = re.search(r'\{[^}]*"numbers"[^}]*\}', response_text)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    pass
-            
-            # Fallback: extract numbers and format as JSON
-            numbers = re.findall(r'\b\d+\b', response_text)
-            if numbers:
-                return {"numbers": [int(n) for n in numbers[:5]]}
-            
-            return {"numbers": [], "error": "Could not extract numbers"}
+            return json.loads(response_text)
+        except (json.JSONDecodeError, TypeError) as e:
+            return {"numbers": [], "error": f"Invalid JSON response: {e}"}
     
     def process_json_output(self, file_path):
         """Simple method that returns JSON format"""
         try:
-            audio_part = Part.from_data(
-                data=Path(file_path).read_bytes(),
-                mime_type=mimetypes.guess_type(str(file_path))[0] or 'audio/mp3'
+            response = self.model.generate_content(
+                [SECRET_NUMBERS_PROMPT, self.audio_part(file_path)],
+                generation_config=self.json_config(SECRET_NUMBERS_SCHEMA)
             )
+            return self.parse_json_response(response.text)
             
-            prompt = '''Extract exactly 5 secret numbers from this audio file. 
-            Return only this JSON format: {"numbers": [num1, num2, num3, num4, num5]}'''
-            
-            response = self.model.generate_content([prompt, audio_part])
+        except Exception as e:
+            return {"numbers": [], "error": str(e)}
+    
+    async def process_json_output_async(self, file_path):
+        """process_json_output through generate_async"""
+        try:
+            data = await asyncio.to_thread(Path(file_path).read_bytes)
+            response = await self.generate_async(
+                [SECRET_NUMBERS_PROMPT, self.audio_part(file_path, data)],
+                generation_config=self.json_config(SECRET_NUMBERS_SCHEMA)
+            )
             return self.parse_json_response(response.text)
             
         except Exception as e:
             return {"numbers": [], "error": str(e)}
+    
+    def extract_voice_command(self, file_path):
+        """
+        Transcript, spoken digits and payment intent from one structured-output call
+        
+        Args:
+            file_path: Path to the audio file
+            
+        Returns:
+            Dictionary with success, transcript, intent, digits, numbers (the first 5
+            digits), amount (major units or None), currency and recipient
+        """
+        try:
+            response = self.model.generate_content(
+                [VOICE_COMMAND_PROMPT, self.audio_part(file_path)],
+                generation_config=self.json_config(VOICE_COMMAND_SCHEMA)
+            )
+            return self.voice_command_result(response.text)
+            
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def extract_voice_command_async(self, file_path):
+        """extract_voice_command through generate_async"""
+        try:
+            data = await asyncio.to_thread(Path(file_path).read_bytes)
+            response = await self.generate_async(
+                [VOICE_COMMAND_PROMPT, self.audio_part(file_path, data)],
+                generation_config=self.json_config(VOICE_COMMAND_SCHEMA)
+            )
+            return self.voice_command_result(response.text)
+            
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def voice_command_result(self, response_text):
+        """Validate a VOICE_COMMAND_SCHEMA response into extract_voice_command's result"""
+        data = self.parse_json_response(response_text)
+        if "error" in data:
+            return {"success": False, "error": data["error"]}
+        
+        digits = [d for d in data.get("digits") or [] if isinstance(d, int) and 0 <= d <= 9]
+        amount = data.get("amount")
+        if not isinstance(amount, (int, float)) or amount <= 0:
+            amount = None
+        
+        return {
+            "success": True,
+            "transcript": data.get("transcript") or "",
+            "intent": data.get("intent") or "other",
+            "digits": digits,
+            "numbers": digits if len(digits) == 5 else [],
+            "amount": amount,
+            "currency": (data.get("currency") or "usd").lower(),
+            "recipient": (data.get("recipient") or "").strip() or None
+        }
 
 # Usage examples
 def main():
@@ -160,11 +381,15 @@ def main():
         numbers = result['numbers']
         print(f"Extracted numbers: {numbers}")
     
-    # Method 2: Enhanced prompt with JSON
+    # Method 2: Transcript, digits and payment details in one call
+    # result = processor.extract_voice_command('../prototype/Voice1.mp3')
+    # print("Voice command:", result)
+    
+    # Method 3: Enhanced prompt with JSON
     # result = processor.process_with_enhanced_prompt('../prototype/Voice1.mp3')
     # print("Enhanced JSON result:", result)
     
-    # Method 3: Direct processing (returns text, not JSON)
+    # Method 4: Direct processing (returns text, not JSON)
     # result = processor.process_audio_direct('../prototype/Voice1.mp3')
     # print("Direct result:", result)
 
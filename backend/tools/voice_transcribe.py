@@ -8,10 +8,29 @@ os.environ['GLOG_minloglevel'] = '2'
 # Optional: Suppress other Google Cloud logging
 logging.getLogger('google.cloud').setLevel(logging.ERROR)
 
-from google.cloud import speech
+import sys
+from pathlib import Path
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.offline_services import OFFLINE_MODE
+
+if OFFLINE_MODE:
+    # In-process fake with injected latency/errors (VPAY_OFFLINE=1)
+    from utils.offline_services import speech
+else:
+    from google.cloud import speech
 
 def transcribe_file(speech_file):
-    """Transcribe the given audio file."""
+    """
+    Transcribe the given audio file.
+
+    Returns:
+        {"success": True, "results": [{"transcript", "confidence"}, ...]} or
+        {"success": False, "error": ...} when nothing was recognized or the call failed
+    """
     client = speech.SpeechClient()
 
     with open(speech_file, "rb") as audio_file:
@@ -31,16 +50,26 @@ def transcribe_file(speech_file):
         response = client.recognize(config=config, audio=audio)
 
         if response.results:
-            for result in response.results:
-                print(f"Transcript: {result.alternatives[0].transcript}")
-                print(f"Confidence: {result.alternatives[0].confidence}")
-        else:
-            print("No speech detected in the audio file.")
+            return {
+                "success": True,
+                "results": [
+                    {"transcript": result.alternatives[0].transcript,
+                     "confidence": result.alternatives[0].confidence}
+                    for result in response.results
+                ]
+            }
+        return {"success": False, "error": "No speech detected in the audio file."}
             
     except Exception as e:
-        print(f"Error during transcription: {e}")
+        return {"success": False, "error": f"Error during transcription: {e}"}
 
 # If you want to test the function, use this instead:
 if __name__ == "__main__":
     # This only runs when you execute this file directly with: python voice_transcribe.py
-    transcribe_file("../prototype/Voice1.mp3")
\ No newline at end of file
+    result = transcribe_file("../prototype/Voice1.mp3")
+    if result["success"]:
+        for alternative in result["results"]:
+            print(f"Transcript: {alternative['transcript']}")
+            print(f"Confidence: {alternative['confidence']}")
+    else:
+        print(result["error"])
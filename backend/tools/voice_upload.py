@@ -1,4 +1,17 @@
-from google.cloud import storage
+import sys
+from pathlib import Path
+
+# Add backend directory to path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from utils.offline_services import OFFLINE_MODE
+
+if OFFLINE_MODE:
+    # Local-directory fake with injected latency/errors (VPAY_OFFLINE=1)
+    from utils.offline_services import storage
+else:
+    from google.cloud import storage
 
 def upload_to_bucket(source_file_path, destination_file_name=None):
     """Upload a file to the audio-voice-vpay bucket."""
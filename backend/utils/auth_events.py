@@ -0,0 +1,77 @@
+import sqlite3
+from typing import Dict, Any, Optional
+
+from utils.payment_idempotency import PAYMENTS_DB_PATH
+
+
+class AuthEventLog:
+    """
+    Append-only log of authentication attempts, for analytics export
+
+    Never stores the spoken PIN itself, only how many digits were recognized.
+    """
+
+    def __init__(self, db_path: str = PAYMENTS_DB_PATH):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS auth_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    session_id TEXT,
+                    user_id TEXT,               -- NULL when no user matched
+                    authenticated BOOLEAN NOT NULL,
+                    auth_method TEXT,
+                    pin_source TEXT,            -- local_dtw / gemini / stt
+                    digits_recognized INTEGER,
+                    similarity_score REAL,
+                    failure_reason TEXT,
+                    payment_status TEXT,
+                    latency_ms REAL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_auth_events_time ON auth_events(created_at)')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS auth_events_no_update BEFORE UPDATE ON auth_events
+                BEGIN SELECT RAISE(ABORT, 'auth_events is append-only'); END
+            ''')
+            conn.commit()
+
+    def record(self, event: Dict[str, Any]) -> int:
+        """
+        Append one authentication attempt
+
+        Args:
+            event: session_id, user_id, authenticated, auth_method, pin_source,
+                   digits_recognized, similarity_score, failure_reason,
+                   payment_status, latency_ms (missing keys are stored as NULL)
+
+        Returns:
+            Row id of the event
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                INSERT INTO auth_events
+                    (session_id, user_id, authenticated, auth_method, pin_source, digits_recognized,
+                     similarity_score, failure_reason, payment_status, latency_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (event.get("session_id"), event.get("user_id"), bool(event.get("authenticated")),
+                  event.get("auth_method"), event.get("pin_source"), event.get("digits_recognized"),
+                  event.get("similarity_score"), event.get("failure_reason"), event.get("payment_status"),
+                  event.get("latency_ms")))
+            conn.commit()
+            return cursor.lastrowid
+
+
+_auth_event_log: Optional[AuthEventLog] = None
+
+
+def get_auth_event_log() -> AuthEventLog:
+    global _auth_event_log
+    if _auth_event_log is None:
+        _auth_event_log = AuthEventLog()
+    return _auth_event_log
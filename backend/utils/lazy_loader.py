@@ -0,0 +1,143 @@
+import sys
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.structured_logging import get_logger
+
+# Registered lazy components by name, in registration order
+_components: Dict[str, "LazyComponent"] = {}
+# Timed startup phases that are not lazy components (e.g. importing main)
+_phases: List[Dict[str, Any]] = []
+_process_started = time.time()
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KB on Linux and bytes on macOS (peak, not current)
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        return 0.0
+
+
+class LazyComponent:
+    """
+    Singleton created on first use, with the cost of creating it recorded.
+
+    A failed load is remembered (get() returns None) so a missing dependency or
+    credential doesn't get retried on every request.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.loaded = False
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.rss_delta_mb: Optional[float] = None
+        self.loaded_by: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def get(self) -> Any:
+        """Return the component, creating it on first call (None if creation failed)"""
+        if self.loaded or self.error is not None:
+            return self.value
+
+        with self.lock:
+            if self.loaded or self.error is not None:
+                return self.value
+
+            rss_before = current_rss_mb()
+            started = time.perf_counter()
+            try:
+                self.value = self.factory()
+                self.loaded = True
+                get_logger(__name__).info("Loaded component", extra={"component": self.name,
+                                                                     "seconds": round(time.perf_counter() - started, 2)})
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                get_logger(__name__).error(f"Failed to load {self.name}: {self.error}", extra={"component": self.name})
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            self.rss_delta_mb = round(current_rss_mb() - rss_before, 1)
+            self.loaded_by = threading.current_thread().name
+            return self.value
+
+    def status(self) -> str:
+        if self.loaded:
+            return "loaded"
+        if self.error is not None:
+            return "failed"
+        return "not_loaded"
+
+    def reset(self):
+        """Forget a failed load so the next get() retries"""
+        with self.lock:
+            if not self.loaded:
+                self.error = None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "status": self.status(),
+            "load_seconds": self.load_seconds,
+            "rss_delta_mb": self.rss_delta_mb,
+            "loaded_by": self.loaded_by,
+            "error": self.error
+        }
+
+
+def lazy_component(name: str, factory: Callable[[], Any]) -> LazyComponent:
+    """Register (or return the already registered) lazy component called `name`"""
+    if name not in _components:
+        _components[name] = LazyComponent(name, factory)
+    return _components[name]
+
+
+def record_startup_phase(name: str, started: float, rss_before_mb: Optional[float] = None):
+    """
+    Record an eagerly executed startup phase timed with time.perf_counter()
+
+    Without rss_before_mb (e.g. when the phase began before this module could be
+    imported) the phase reports the process RSS at its end instead of a delta.
+    """
+    phase = {"phase": name, "seconds": round(time.perf_counter() - started, 3)}
+    if rss_before_mb is None:
+        phase["rss_mb_after"] = current_rss_mb()
+    else:
+        phase["rss_delta_mb"] = round(current_rss_mb() - rss_before_mb, 1)
+    _phases.append(phase)
+
+
+def warm_up_in_background(names: Optional[Iterable[str]] = None) -> threading.Thread:
+    """Create the given components (default: all registered) on a background thread"""
+    selected = list(names) if names is not None else list(_components)
+
+    def warm_up():
+        for name in selected:
+            component = _components.get(name)
+            if component is not None:
+                component.get()
+
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """Time and RSS breakdown of startup phases and lazily loaded components"""
+    return {
+        "uptime_seconds": round(time.time() - _process_started, 1),
+        "rss_mb": current_rss_mb(),
+        "phases": list(_phases),
+        "components": {name: component.report() for name, component in _components.items()}
+    }
@@ -0,0 +1,452 @@
+"""
+In-process stand-ins for Google Speech-to-Text, Vertex AI Gemini, Stripe and
+Cloud Storage, enabled with VPAY_OFFLINE=1
+
+Each fake sleeps for a latency drawn from a configurable distribution, fails at a
+configurable rate, and can cap its concurrency like a rate-limited backend, so the
+pipeline's throughput and queueing can be exercised without credentials.
+
+Per-service settings (SERVICE is SPEECH, GEMINI, STRIPE or GCS):
+    OFFLINE_<SERVICE>_LATENCY      "lognormal:<median ms>,<p95 ms>", "normal:<mean>,<std>",
+                                   "uniform:<lo>,<hi>", "exponential:<mean>", "fixed:<ms>" or "none"
+    OFFLINE_<SERVICE>_ERROR_RATE   probability a call raises the service's transient error
+    OFFLINE_<SERVICE>_CONCURRENCY  concurrent calls served (0 = unlimited); the rest queue
+
+Transcripts: recordings are recognized by the SHA-256 of their bytes, looked up in
+register_transcript() entries and the OFFLINE_TRANSCRIPTS_FILE JSON ({sha256: text});
+anything else is heard as OFFLINE_DEFAULT_TRANSCRIPT.
+"""
+import os
+import json
+import math
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Any, Optional, List
+from dotenv import load_dotenv
+
+from utils.parsing_helpers import words_to_digits, extract_pin_digits, parse_payment_transcript
+
+load_dotenv()
+
+OFFLINE_MODE = os.getenv("VPAY_OFFLINE", "0").lower() in ("1", "true", "yes")
+OFFLINE_SEED = os.getenv("OFFLINE_SEED")
+OFFLINE_DEFAULT_TRANSCRIPT = os.getenv("OFFLINE_DEFAULT_TRANSCRIPT", "Pay 20 dollars to Starbucks")
+OFFLINE_TRANSCRIPTS_FILE = os.getenv("OFFLINE_TRANSCRIPTS_FILE")
+OFFLINE_GCS_DIR = os.getenv("OFFLINE_GCS_DIR", ".offline_gcs")
+OFFLINE_STRIPE_DECLINE_RATE = float(os.getenv("OFFLINE_STRIPE_DECLINE_RATE", "0"))
+
+# Rough production latencies (median, p95 in ms) used when nothing is configured
+DEFAULT_LATENCIES = {
+    "speech": "lognormal:600,1500",
+    "gemini": "lognormal:1200,3000",
+    "stripe": "lognormal:350,900",
+    "gcs": "lognormal:80,250"
+}
+
+_rng = random.Random(int(OFFLINE_SEED) if OFFLINE_SEED else None)
+_rng_lock = threading.Lock()
+
+
+class OfflineServiceError(Exception):
+    """Transient failure injected by an offline fake (when google-api-core isn't installed)"""
+
+
+try:
+    from google.api_core.exceptions import ServiceUnavailable as GoogleTransientError
+except ImportError:
+    GoogleTransientError = OfflineServiceError
+
+
+class LatencyDistribution:
+    """Latency samples (seconds) from a spec like "lognormal:600,1500" (milliseconds)"""
+
+    def __init__(self, spec: str):
+        self.spec = spec.strip().lower()
+        kind, _, args = self.spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) / 1000.0 for value in args.split(",") if value.strip()]
+        if kind == "lognormal":
+            median, p95 = self.params
+            self.mu = math.log(median)
+            self.sigma = max(0.0, (math.log(p95) - self.mu) / 1.6449)
+        elif kind not in ("normal", "uniform", "exponential", "fixed", "none"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        with _rng_lock:
+            if self.kind == "lognormal":
+                return _rng.lognormvariate(self.mu, self.sigma)
+            if self.kind == "normal":
+                return max(0.0, _rng.gauss(self.params[0], self.params[1]))
+            if self.kind == "uniform":
+                return _rng.uniform(self.params[0], self.params[1])
+            if self.kind == "exponential":
+                return _rng.expovariate(1.0 / self.params[0])
+            if self.kind == "fixed":
+                return self.params[0]
+            return 0.0
+
+
+class FakeService:
+    """Latency, error injection, a concurrency cap and call statistics for one fake backend"""
+
+    def __init__(self, name: str):
+        prefix = f"OFFLINE_{name.upper()}_"
+        self.name = name
+        self.latency = LatencyDistribution(os.getenv(prefix + "LATENCY", DEFAULT_LATENCIES[name]))
+        self.error_rate = float(os.getenv(prefix + "ERROR_RATE", "0"))
+        self.concurrency = int(os.getenv(prefix + "CONCURRENCY", "0"))
+        self._slots = threading.BoundedSemaphore(self.concurrency) if self.concurrency > 0 else None
+        self._async_slots: Dict[Any, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0,
+                      "busy_seconds": 0.0, "queued_seconds": 0.0}
+
+    def _started(self, queued: float):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            self.stats["queued_seconds"] += queued
+
+    def _finished(self, busy: float, failed: bool):
+        with self._lock:
+            self.stats["in_flight"] -= 1
+            self.stats["busy_seconds"] += busy
+            self.stats["errors"] += int(failed)
+
+    def _should_fail(self) -> bool:
+        with _rng_lock:
+            return _rng.random() < self.error_rate
+
+    def call(self, error: Exception):
+        """Block like a remote call; raise `error` at the configured rate"""
+        queued_at = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            self._started(time.perf_counter() - queued_at)
+            delay = self.latency.sample()
+            time.sleep(delay)
+            failed = self._should_fail()
+            self._finished(delay, failed)
+            if failed:
+                raise error
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    async def call_async(self, error: Exception):
+        """call() for coroutines; the concurrency cap is per event loop"""
+        queued_at = time.perf_counter()
+        slots = None
+        if self.concurrency > 0:
+            loop = asyncio.get_running_loop()
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                slots = self._async_slots[loop] = asyncio.Semaphore(self.concurrency)
+            await slots.acquire()
+        try:
+            self._started(time.perf_counter() - queued_at)
+            delay = self.latency.sample()
+            await asyncio.sleep(delay)
+            failed = self._should_fail()
+            self._finished(delay, failed)
+            if failed:
+                raise error
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["busy_seconds"] = round(stats["busy_seconds"], 3)
+        stats["queued_seconds"] = round(stats["queued_seconds"], 3)
+        stats["latency"] = self.latency.spec
+        stats["error_rate"] = self.error_rate
+        stats["concurrency"] = self.concurrency
+        return stats
+
+
+_services: Dict[str, FakeService] = {}
+
+
+def fake_service(name: str) -> FakeService:
+    if name not in _services:
+        _services[name] = FakeService(name)
+    return _services[name]
+
+
+def get_offline_stats() -> Dict[str, Any]:
+    """Call statistics of every fake used so far"""
+    return {name: service.get_stats() for name, service in _services.items()}
+
+
+# Transcripts
+
+_transcripts: Dict[str, str] = {}
+_transcripts_loaded = False
+
+
+def audio_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def register_transcript(data: bytes, transcript: str):
+    """Make the fakes hear `transcript` in the recording `data`"""
+    _transcripts[audio_key(data)] = transcript
+
+
+def transcript_for(data: bytes) -> str:
+    global _transcripts_loaded
+    if not _transcripts_loaded:
+        _transcripts_loaded = True
+        if OFFLINE_TRANSCRIPTS_FILE and os.path.exists(OFFLINE_TRANSCRIPTS_FILE):
+            with open(OFFLINE_TRANSCRIPTS_FILE, 'r', encoding='utf-8') as f:
+                for key, transcript in json.load(f).items():
+                    _transcripts.setdefault(key, transcript)
+    return _transcripts.get(audio_key(data), OFFLINE_DEFAULT_TRANSCRIPT)
+
+
+def interpret_transcript(transcript: str) -> Dict[str, Any]:
+    """What a perfect model would extract: VOICE_COMMAND_SCHEMA fields"""
+    analysis = parse_payment_transcript(transcript)
+    details = analysis["payment_details"]
+    is_payment = analysis["has_payment_command"]
+    digits = words_to_digits(transcript) if not is_payment else []
+    return {
+        "transcript": transcript,
+        "intent": "payment" if is_payment else ("pin" if digits else "other"),
+        "digits": digits,
+        "amount": details["amount"] / 100 if details["amount"] is not None else None,
+        "currency": details["currency"] if details["amount"] is not None else None,
+        "recipient": details["recipient"] if is_payment else None
+    }
+
+
+# Speech-to-Text (google.cloud.speech subset)
+
+class _AudioEncoding:
+    ENCODING_UNSPECIFIED = 0
+    LINEAR16 = 1
+    FLAC = 2
+    MP3 = 8
+    WEBM_OPUS = 9
+
+
+class RecognitionConfig:
+    AudioEncoding = _AudioEncoding
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class RecognitionAudio:
+    def __init__(self, content: bytes = b"", uri: Optional[str] = None):
+        self.content = content
+        self.uri = uri
+
+
+class FakeSpeechClient:
+    def __init__(self, *args, **kwargs):
+        self.service = fake_service("speech")
+
+    def recognize(self, config=None, audio=None, **kwargs):
+        self.service.call(GoogleTransientError("Offline Speech-to-Text: injected failure"))
+        transcript = transcript_for(audio.content if audio is not None else b"")
+        alternative = SimpleNamespace(transcript=transcript, confidence=0.95)
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])] if transcript else [])
+
+
+speech = SimpleNamespace(
+    SpeechClient=FakeSpeechClient,
+    RecognitionAudio=RecognitionAudio,
+    RecognitionConfig=RecognitionConfig
+)
+
+
+# Vertex AI Gemini (vertexai.generative_models subset)
+
+class Part:
+    def __init__(self, data: bytes = b"", mime_type: str = ""):
+        self.data = data
+        self.mime_type = mime_type
+
+    @classmethod
+    def from_data(cls, data: bytes, mime_type: str):
+        return cls(data, mime_type)
+
+
+class GenerationConfig:
+    def __init__(self, **kwargs):
+        self.response_schema = kwargs.pop("response_schema", None)
+        self.__dict__.update(kwargs)
+
+
+class FakeGenerativeModel:
+    """Answers from the registered transcript of the audio part, shaped by the response schema"""
+
+    def __init__(self, model_name: str = "gemini-offline", *args, **kwargs):
+        self.model_name = model_name
+        self.service = fake_service("gemini")
+
+    def _respond(self, contents: List[Any], generation_config) -> SimpleNamespace:
+        audio = next((item.data for item in contents if isinstance(item, Part)), b"")
+        command = interpret_transcript(transcript_for(audio))
+        schema = getattr(generation_config, "response_schema", None) or {}
+        properties = schema.get("properties", {})
+        if "intent" in properties:
+            text = json.dumps(command)
+        elif "numbers" in properties:
+            text = json.dumps({"numbers": extract_pin_digits(command["transcript"])})
+        else:
+            text = command["transcript"]
+        return SimpleNamespace(text=text)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        self.service.call(GoogleTransientError("Offline Gemini: injected failure"))
+        return self._respond(contents, generation_config)
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        await self.service.call_async(GoogleTransientError("Offline Gemini: injected failure"))
+        return self._respond(contents, generation_config)
+
+
+# Stripe (StripeClient.v1.payment_intents subset)
+
+class FakePaymentIntents:
+    """Creates PaymentIntents in memory; repeated idempotency keys return the first intent"""
+
+    def __init__(self):
+        self.service = fake_service("stripe")
+        self._by_key: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _intent(self, params: Dict[str, Any], options: Optional[Dict[str, Any]]):
+        import stripe
+
+        key = (options or {}).get("idempotency_key")
+        with self._lock:
+            if key and key in self._by_key:
+                return self._by_key[key]
+
+        with _rng_lock:
+            declined = _rng.random() < OFFLINE_STRIPE_DECLINE_RATE
+        if declined:
+            raise stripe.CardError("Your card was declined.", None, "card_declined")
+
+        intent = SimpleNamespace(
+            id=f"pi_offline_{uuid.uuid4().hex[:20]}",
+            object="payment_intent",
+            status="succeeded" if params.get("confirm") else "requires_confirmation",
+            amount=params["amount"],
+            currency=params.get("currency", "usd"),
+            description=params.get("description"),
+            metadata=params.get("metadata") or {},
+            last_payment_error=None
+        )
+        if key:
+            with self._lock:
+                intent = self._by_key.setdefault(key, intent)
+        return intent
+
+    def _error(self):
+        import stripe
+        return stripe.APIConnectionError("Offline Stripe: injected network error")
+
+    def create(self, params: Optional[Dict[str, Any]] = None, options: Optional[Dict[str, Any]] = None):
+        self.service.call(self._error())
+        return self._intent(params or {}, options)
+
+    async def create_async(self, params: Optional[Dict[str, Any]] = None, options: Optional[Dict[str, Any]] = None):
+        await self.service.call_async(self._error())
+        return self._intent(params or {}, options)
+
+
+class FakeStripeClient:
+    def __init__(self, *args, **kwargs):
+        self.v1 = SimpleNamespace(payment_intents=_payment_intents())
+        self.payment_intents = self.v1.payment_intents
+
+
+_fake_payment_intents: Optional[FakePaymentIntents] = None
+
+
+def _payment_intents() -> FakePaymentIntents:
+    global _fake_payment_intents
+    if _fake_payment_intents is None:
+        _fake_payment_intents = FakePaymentIntents()
+    return _fake_payment_intents
+
+
+# Cloud Storage (google.cloud.storage subset), backed by a local directory
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.path / name
+
+    def _call(self):
+        self.bucket.service.call(GoogleTransientError(f"Offline GCS: injected failure for {self.name}"))
+
+    def upload_from_filename(self, filename: str, **kwargs):
+        self._call()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, **kwargs):
+        self._call()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def download_to_filename(self, filename: str, **kwargs):
+        self._call()
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        self._call()
+        return self.path.read_bytes()
+
+    def exists(self, **kwargs) -> bool:
+        return self.path.exists()
+
+    def delete(self, **kwargs):
+        self._call()
+        self.path.unlink()
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self.name = name
+        self.service = client.service
+        self.path = Path(client.root) / name
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix: str = ""):
+        if not self.path.exists():
+            return []
+        return [self.blob(str(path.relative_to(self.path))) for path in sorted(self.path.rglob("*"))
+                if path.is_file() and str(path.relative_to(self.path)).startswith(prefix)]
+
+
+class FakeStorageClient:
+    def __init__(self, *args, root: str = OFFLINE_GCS_DIR, **kwargs):
+        self.root = root
+        self.service = fake_service("gcs")
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+
+storage = SimpleNamespace(Client=FakeStorageClient)
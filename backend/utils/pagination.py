@@ -0,0 +1,39 @@
+import base64
+import json
+from typing import Any, Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Encode the (sort value, id) of the last row on a page as an opaque cursor"""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Returns:
+        (sort_value, row_id) or None for the first page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid pagination cursor: {cursor}")
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    """Keep page sizes within sane bounds"""
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
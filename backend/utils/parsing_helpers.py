@@ -0,0 +1,167 @@
+import re
+from typing import Dict, Any, List
+
+# Spoken forms of single digits, including the homophones STT returns for PINs
+DIGIT_WORDS = {
+    "zero": 0, "oh": 0, "o": 0,
+    "one": 1, "won": 1,
+    "two": 2, "to": 2, "too": 2,
+    "three": 3, "tree": 3,
+    "four": 4, "for": 4, "fore": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8, "ate": 8,
+    "nine": 9, "niner": 9
+}
+
+# Homophones that are also everyday words; trimmed from the ends of a digit run
+# that is too long ("12345 to" is still the PIN 12345)
+AMBIGUOUS_DIGIT_WORDS = {"o", "won", "to", "too", "tree", "for", "fore", "ate"}
+
+PIN_LENGTH = 5
+
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+")
+
+
+def words_to_digits(transcript: str) -> List[int]:
+    """
+    Spoken digits in a PIN transcript, in order
+
+    Digit runs ("12345", "1 2") become one digit per character, and number words
+    and their homophones ("oh", "for", "to") map to digits; other words are skipped.
+    """
+    digits = []
+    for token in TOKEN_PATTERN.findall(transcript.lower()):
+        if token.isdigit():
+            digits.extend(int(c) for c in token)
+        elif token in DIGIT_WORDS:
+            digits.append(DIGIT_WORDS[token])
+    return digits
+
+
+def extract_pin_digits(transcript: str, length: int = PIN_LENGTH) -> List[int]:
+    """
+    The spoken PIN in a transcript, or [] if there isn't exactly one clear candidate
+
+    Digits only form a PIN when they are spoken contiguously: any other word ends
+    the run, so in "I want to pay for 12345" the stray "to" and "for" are separate
+    runs and only 12345 has the PIN length. A run longer than the PIN loses
+    ambiguous homophones at its ends; one that is still too long is rejected rather
+    than truncated. With several runs of the right length the last one is used.
+    """
+    runs, run = [], []
+    for token in TOKEN_PATTERN.findall(transcript.lower()):
+        if token.isdigit():
+            run.extend((int(c), False) for c in token)
+        elif token in DIGIT_WORDS:
+            run.append((DIGIT_WORDS[token], token in AMBIGUOUS_DIGIT_WORDS))
+        elif run:
+            runs.append(run)
+            run = []
+    if run:
+        runs.append(run)
+
+    candidates = []
+    for run in runs:
+        while len(run) > length and run[0][1]:
+            run = run[1:]
+        while len(run) > length and run[-1][1]:
+            run = run[:-1]
+        if len(run) == length:
+            candidates.append([digit for digit, _ in run])
+    return candidates[-1] if candidates else []
+
+
+PAYMENT_KEYWORDS = ["pay", "send", "sent", "transfer", "give", "wire", "remit"]
+
+# Tried in order; the first pattern with any match supplies the amounts
+AMOUNT_PATTERNS = [
+    re.compile(r'(\d+(?:\.\d{2})?)\s*(?:dollars?|bucks?)', re.IGNORECASE),
+    re.compile(r'\$(\d+(?:\.\d{2})?)', re.IGNORECASE),
+    re.compile(r'(\d+(?:\.\d{2})?)\s*(?:euros?)', re.IGNORECASE),
+    re.compile(r'(\d+(?:\.\d{2})?)\s*(?:pounds?)', re.IGNORECASE)
+]
+
+RECIPIENT_PATTERNS = [
+    re.compile(r'(?:to|for)\s+([a-zA-Z][a-zA-Z\s]+?)(?:\s*[.,]|$)', re.IGNORECASE),
+    re.compile(r'(?:towards|at)\s+([a-zA-Z][a-zA-Z\s]+?)(?:\s*[.,]|$)', re.IGNORECASE)
+]
+
+
+def parse_payment_transcript(transcript: str) -> Dict[str, Any]:
+    """
+    Pattern-matching payment analysis of a transcript (the STT path's Step 2)
+
+    Args:
+        transcript: Cleaned transcript of the payment recording
+
+    Returns:
+        Payment analysis dictionary: has_payment_command, payment_details (action,
+        amount in cents, currency, recipient, confidence), extracted_entities
+    """
+    payment_analysis = {
+        "success": True,
+        "has_payment_command": False,
+        "payment_details": {
+            "action": None,
+            "amount": None,
+            "currency": "usd",
+            "recipient": None,
+            "user_id": "USER_001",
+            "raw_amount_text": None,
+            "confidence": 0.0
+        },
+        "extracted_entities": {
+            "amounts_found": [],
+            "recipients_found": [],
+            "actions_found": []
+        },
+        "reasoning": f"Manual analysis of transcript: '{transcript}'",
+        "transcript": transcript
+    }
+
+    # Payment action detection
+    transcript_lower = transcript.lower()
+    found_actions = [action for action in PAYMENT_KEYWORDS if action in transcript_lower]
+    if found_actions:
+        payment_analysis["has_payment_command"] = True
+        payment_analysis["payment_details"]["action"] = found_actions[0]
+        payment_analysis["extracted_entities"]["actions_found"] = found_actions
+
+    # Amount detection
+    amounts_found = []
+    raw_amount_text = None
+    for pattern in AMOUNT_PATTERNS:
+        matches = list(pattern.finditer(transcript))
+        if matches:
+            amounts_found = [match.group(1) for match in matches]
+            raw_amount_text = matches[0].group(0)
+            break
+
+    if amounts_found:
+        try:
+            payment_analysis["payment_details"]["amount"] = int(float(amounts_found[0]) * 100)
+            payment_analysis["payment_details"]["raw_amount_text"] = raw_amount_text
+            payment_analysis["extracted_entities"]["amounts_found"] = amounts_found
+        except ValueError:
+            pass
+
+    # Recipient detection
+    recipients_found = []
+    for pattern in RECIPIENT_PATTERNS:
+        for match in pattern.findall(transcript):
+            clean_recipient = match.strip().title()
+            if len(clean_recipient) > 1:
+                recipients_found.append(clean_recipient)
+
+    if recipients_found:
+        payment_analysis["payment_details"]["recipient"] = recipients_found[0]
+        payment_analysis["extracted_entities"]["recipients_found"] = recipients_found
+
+    # Confidence: action 0.4, amount 0.4, recipient 0.2
+    payment_analysis["payment_details"]["confidence"] = (
+        (0.4 if found_actions else 0.0) + (0.4 if amounts_found else 0.0) + (0.2 if recipients_found else 0.0)
+    )
+
+    return payment_analysis
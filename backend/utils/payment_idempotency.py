@@ -0,0 +1,154 @@
+import os
+import json
+import sqlite3
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+PAYMENTS_DB_PATH = os.getenv("VPAY_PAYMENTS_DB", "payments.db")
+
+# Results with these statuses came from Stripe and are final for the key; "error"
+# (network, rate limit, missing agent) may be retried with the same key
+REPLAYABLE_STATUSES = ("success", "pending", "requires_action", "declined")
+
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def payment_idempotency_key(session_id: str, payer: str, amount: int, currency: str, recipient: str) -> str:
+    """
+    Deterministic key for one payment attempt
+
+    The same confirmed payment (session, payer, amount, currency, recipient) always
+    maps to the same key, so retried auth requests can't charge twice.
+    """
+    material = "|".join([session_id or "", payer or "", str(amount), (currency or "").lower(), (recipient or "").strip().lower()])
+    return "vpay_" + hashlib.sha256(material.encode("utf-8")).hexdigest()[:40]
+
+
+class IdempotencyStore:
+    """SQLite table of payment attempts and their results, keyed by idempotency key"""
+
+    def __init__(self, db_path: str = PAYMENTS_DB_PATH):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS payment_idempotency (
+                    idempotency_key TEXT PRIMARY KEY,
+                    session_id TEXT,
+                    payer TEXT,
+                    amount INTEGER,
+                    currency TEXT,
+                    recipient TEXT,
+                    status TEXT NOT NULL,       -- in_flight until the charge returns
+                    result TEXT,                -- JSON payment result
+                    attempts INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                'SELECT status, result, attempts FROM payment_idempotency WHERE idempotency_key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, result, attempts = row
+        return {"status": status, "result": json.loads(result) if result else None, "attempts": attempts}
+
+    def begin(self, key: str, details: Dict[str, Any]):
+        """Record an attempt as in flight (insert, or bump the attempt count of an earlier failure)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT INTO payment_idempotency
+                    (idempotency_key, session_id, payer, amount, currency, recipient, status, attempts)
+                VALUES (?, ?, ?, ?, ?, ?, 'in_flight', 1)
+                ON CONFLICT(idempotency_key) DO UPDATE SET
+                    status = 'in_flight', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            ''', (key, details.get("session_id"), details.get("payer"), details.get("amount"),
+                  details.get("currency"), details.get("recipient")))
+            conn.commit()
+
+    def finish(self, key: str, result: Dict[str, Any]):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE payment_idempotency SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE idempotency_key = ?
+            ''', (result.get("status", "error"), json.dumps(result), key))
+            conn.commit()
+
+
+_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _store
+    if _store is None:
+        _store = IdempotencyStore()
+    return _store
+
+
+async def run_idempotent_payment(key: str, details: Dict[str, Any],
+                                 charge: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Run `charge` at most once per idempotency key
+
+    - A duplicate arriving while the first charge is in flight awaits that charge
+      instead of issuing its own (result marked "coalesced")
+    - A key that already has a final Stripe result returns it without calling
+      Stripe again (marked "replayed")
+    - Otherwise the charge runs; the same key is passed to Stripe, so even a retry
+      after a crash mid-request is deduplicated server-side
+
+    Args:
+        key: Idempotency key (see payment_idempotency_key)
+        details: session_id, payer, amount, currency, recipient for the table
+        charge: Coroutine factory performing the payment
+
+    Returns:
+        The payment result, with "idempotency_key" set
+    """
+    pending = _in_flight.get(key)
+    if pending is not None:
+        try:
+            result = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            return {"status": "error", "reason": "Original payment attempt was cancelled",
+                    "idempotency_key": key, "retryable": True}
+        return {**result, "coalesced": True}
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        store = get_idempotency_store()
+        previous = await asyncio.to_thread(store.get, key)
+        if previous and previous["result"] and previous["status"] in REPLAYABLE_STATUSES:
+            result = {**previous["result"], "replayed": True}
+        else:
+            await asyncio.to_thread(store.begin, key, details)
+            try:
+                result = await charge()
+            except Exception as e:
+                result = {"status": "error", "reason": str(e), "error_type": type(e).__name__, "retryable": True}
+            result = {**result, "idempotency_key": key}
+            await asyncio.to_thread(store.finish, key, result)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        if not future.done():
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Nobody may be waiting on it; don't warn about an unretrieved exception
+                future.exception()
+        raise
+    finally:
+        _in_flight.pop(key, None)
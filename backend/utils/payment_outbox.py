@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Set
+
+from utils.payment_idempotency import PAYMENTS_DB_PATH, run_idempotent_payment
+from utils.metrics import count_retry
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+OUTBOX_WORKERS = int(os.getenv("PAYMENT_OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("PAYMENT_OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("PAYMENT_OUTBOX_BACKOFF_SECONDS", "1"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("PAYMENT_OUTBOX_MAX_BACKOFF_SECONDS", "60"))
+OUTBOX_POLL_SECONDS = float(os.getenv("PAYMENT_OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_DRAIN_SECONDS = float(os.getenv("PAYMENT_OUTBOX_DRAIN_SECONDS", "20"))
+
+# queued -> processing -> done (Stripe answered) or failed (retries exhausted / not retryable);
+# a retryable error puts the payment back to queued with a later next_attempt_at
+TERMINAL_STATES = ("done", "failed")
+
+
+class OutboxStore:
+    """Durable payment queue in SQLite; one row per idempotency key"""
+
+    def __init__(self, db_path: str = PAYMENTS_DB_PATH):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS payment_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    session_id TEXT,
+                    payer TEXT NOT NULL,
+                    amount INTEGER NOT NULL,
+                    currency TEXT NOT NULL,
+                    recipient TEXT,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    result TEXT,                -- JSON payment result once done or failed
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_due ON payment_outbox(state, next_attempt_at)
+            ''')
+            conn.commit()
+
+    @staticmethod
+    def _row_to_payment(row: sqlite3.Row) -> Dict[str, Any]:
+        payment = dict(row)
+        payment["result"] = json.loads(payment["result"]) if payment["result"] else None
+        return payment
+
+    def enqueue(self, key: str, details: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a payment; an existing row for the key is returned unchanged"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO payment_outbox
+                    (idempotency_key, session_id, payer, amount, currency, recipient, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (key, details.get("session_id"), details["payer"], details["amount"],
+                  details.get("currency", "usd"), details.get("recipient"), time.time()))
+            conn.commit()
+        return self.get(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM payment_outbox WHERE idempotency_key = ?', (key,)).fetchone()
+        return self._row_to_payment(row) if row else None
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest due queued payment to processing"""
+        with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+            conn.row_factory = sqlite3.Row
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT id FROM payment_outbox
+                WHERE state = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT 1
+            ''', (time.time(),)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            claimed = conn.execute('''
+                UPDATE payment_outbox
+                SET state = 'processing', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? RETURNING *
+            ''', (row["id"],)).fetchone()
+            conn.execute('COMMIT')
+        return self._row_to_payment(claimed)
+
+    def complete(self, key: str, state: str, result: Dict[str, Any]):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE payment_outbox SET state = ?, result = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE idempotency_key = ?
+            ''', (state, json.dumps(result), result.get("reason") if state == "failed" else None, key))
+            conn.commit()
+
+    def retry_later(self, key: str, delay: float, error: str):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE payment_outbox
+                SET state = 'queued', next_attempt_at = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE idempotency_key = ?
+            ''', (time.time() + delay, error, key))
+            conn.commit()
+
+    def requeue(self, key: str) -> bool:
+        """Put a claimed payment back to the queue (its outcome couldn't be stored)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                UPDATE payment_outbox SET state = 'queued', next_attempt_at = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE idempotency_key = ? AND state = 'processing'
+            ''', (time.time(), key))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def requeue_interrupted(self) -> int:
+        """Payments left processing by a crash go back to the queue (safe: Stripe dedupes by key)"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                UPDATE payment_outbox SET state = 'queued', updated_at = CURRENT_TIMESTAMP
+                WHERE state = 'processing'
+            ''')
+            conn.commit()
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with sqlite3.connect(self.db_path) as conn:
+            return dict(conn.execute('SELECT state, COUNT(*) FROM payment_outbox GROUP BY state').fetchall())
+
+
+def payment_status(payment: Dict[str, Any]) -> Dict[str, Any]:
+    """Client-facing status of an outbox payment"""
+    result = payment.get("result") or {}
+    if payment["state"] == "done":
+        status = result.get("status", "error")
+    elif payment["state"] == "failed":
+        status = "failed"
+    else:
+        status = "pending"
+    return {
+        "payment_id": payment["idempotency_key"],
+        "status": status,
+        "state": payment["state"],
+        "attempts": payment["attempts"],
+        "amount": payment["amount"],
+        "currency": payment["currency"],
+        "recipient": payment["recipient"],
+        "payer": payment["payer"],
+        "payment_intent_id": result.get("payment_intent_id"),
+        "reason": result.get("reason") or payment.get("last_error"),
+        "updated_at": payment["updated_at"]
+    }
+
+
+class PaymentOutbox:
+    """
+    Background workers draining the payment outbox
+
+    Requests enqueue and return immediately; workers claim due payments, charge
+    them through run_idempotent_payment (same idempotency key on every attempt),
+    and retry retryable errors with exponential backoff and jitter. Status changes
+    are pushed to subscribers (SSE) as well as stored for polling.
+    """
+
+    def __init__(self, charge: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 db_path: str = PAYMENTS_DB_PATH, workers: int = OUTBOX_WORKERS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 on_complete: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[None]]] = None):
+        """
+        Args:
+            charge: Coroutine function performing one payment from an outbox row
+            on_complete: Optional coroutine function called with (row, result) once Stripe answered
+            db_path: SQLite file for the outbox table
+            workers: Concurrent payment workers
+            max_attempts: Attempts before a retryable error becomes "failed"
+        """
+        self.charge = charge
+        self.store = OutboxStore(db_path)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.on_complete = on_complete
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        requeued = await asyncio.to_thread(self.store.requeue_interrupted)
+        if requeued:
+            logger.info("Payment outbox re-queued interrupted payments", extra={"requeued": requeued})
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Payment outbox started", extra={"workers": self.workers})
+
+    async def stop(self, timeout: float = OUTBOX_DRAIN_SECONDS):
+        """Stop claiming new payments and let in-flight ones finish (up to `timeout`)"""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("Payment outbox payments still in flight at shutdown; they resume on next start",
+                           extra={"in_flight": len(pending), "timeout": timeout})
+        self._tasks = []
+
+    async def enqueue(self, key: str, details: Dict[str, Any]) -> Dict[str, Any]:
+        """Durably queue a payment and wake a worker; returns its current status"""
+        payment = await asyncio.to_thread(self.store.enqueue, key, details)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return payment_status(payment)
+
+    async def get_status(self, key: str) -> Optional[Dict[str, Any]]:
+        payment = await asyncio.to_thread(self.store.get, key)
+        return payment_status(payment) if payment else None
+
+    def subscribe(self, key: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(key, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, key: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(key)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[key]
+
+    async def _publish(self, key: str):
+        if key not in self._subscribers:
+            return
+        status = await self.get_status(key)
+        for queue in list(self._subscribers.get(key, ())):
+            queue.put_nowait(status)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self, index: int):
+        # Claimed payments whose outcome couldn't be written; requeued before claiming more
+        unsettled: List[str] = []
+        failures = 0
+        while not self._stopping:
+            payment = None
+            try:
+                while unsettled:
+                    await asyncio.to_thread(self.store.requeue, unsettled[0])
+                    unsettled.pop(0)
+                # Clear before claiming so an enqueue during the claim isn't missed
+                self._wakeup.clear()
+                payment = await asyncio.to_thread(self.store.claim_next)
+                if payment is None:
+                    failures = 0
+                    if self._stopping:
+                        break
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(payment)
+                failures = 0
+            except Exception as e:
+                # e.g. sqlite "database is locked": keep the worker alive and back off. A claimed
+                # payment goes back to the queue; its retry replays the stored Stripe result under
+                # the same idempotency key instead of charging again.
+                failures += 1
+                delay = self.backoff(failures)
+                key = payment["idempotency_key"] if payment else None
+                if key is not None and key not in unsettled:
+                    unsettled.append(key)
+                logger.exception(f"Payment outbox worker error: {e}", extra={"worker": index, "payment_id": key,
+                                                                            "delay": round(delay, 1)})
+                await asyncio.sleep(delay)
+        for key in unsettled:
+            try:
+                await asyncio.to_thread(self.store.requeue, key)
+            except Exception as e:
+                # requeue_interrupted picks it up on the next start
+                logger.error(f"Could not requeue payment at shutdown: {e}", extra={"payment_id": key})
+
+    async def _process(self, payment: Dict[str, Any]):
+        key = payment["idempotency_key"]
+        await self._publish(key)
+        details = {name: payment[name] for name in ("session_id", "payer", "amount", "currency", "recipient")}
+        try:
+            result = await run_idempotent_payment(key, details, lambda: self.charge(payment))
+        except Exception as e:
+            result = {"status": "error", "reason": str(e), "error_type": type(e).__name__, "retryable": True}
+
+        if result.get("status") != "error":
+            await asyncio.to_thread(self.store.complete, key, "done", result)
+            if self.on_complete is not None:
+                try:
+                    await self.on_complete(payment, result)
+                except Exception as e:
+                    logger.error(f"Payment completion hook failed: {e}", extra={"payment_id": key})
+        elif result.get("retryable") and payment["attempts"] < self.max_attempts:
+            delay = self.backoff(payment["attempts"])
+            logger.warning("Payment attempt failed, retrying", extra={"payment_id": key, "attempt": payment["attempts"],
+                                                                      "reason": result.get("reason"), "delay": round(delay, 1)})
+            count_retry("payment_outbox")
+            await asyncio.to_thread(self.store.retry_later, key, delay, result.get("reason", "error"))
+        else:
+            await asyncio.to_thread(self.store.complete, key, "failed", result)
+        await self._publish(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "states": self.store.counts(),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values())
+        }
@@ -0,0 +1,279 @@
+"""
+Opt-in profiling of live /process_voice requests
+
+Arm it with POST /admin/profile?requests=N (the next N requests are profiled) or,
+with VPAY_PROFILING_HEADER=1, send "X-Vpay-Profile: 1" on a request. A profiled
+request gets:
+
+- Sampled stacks: a background thread reads every busy thread's Python stack
+  every VPAY_PROFILE_INTERVAL_MS and counts them in the collapsed format
+  ("thread;module:function;... count"), ready for flamegraph.pl or speedscope.
+- Memory: tracemalloc runs while any profile is active; each stage_timer stage
+  reports its own peak allocation, and the request reports its top allocation sites.
+
+Samples cover the whole process, so requests profiled concurrently share them.
+While nothing is armed, the only cost is one None check per stage_timer and one
+integer check per request; the sampler thread and tracemalloc are stopped.
+"""
+import os
+import sys
+import time
+import uuid
+import threading
+import tracemalloc
+import contextvars
+from collections import deque, Counter as StackCounter
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from utils import metrics
+
+PROFILING_HEADER_ENABLED = os.getenv("VPAY_PROFILING_HEADER", "0").lower() in ("1", "true", "yes")
+PROFILE_HEADER = "x-vpay-profile"
+PROFILE_INTERVAL_SECONDS = float(os.getenv("VPAY_PROFILE_INTERVAL_MS", "5")) / 1000.0
+PROFILE_MEMORY = os.getenv("VPAY_PROFILE_MEMORY", "1").lower() in ("1", "true", "yes")
+PROFILE_KEEP = int(os.getenv("VPAY_PROFILE_KEEP", "20"))
+MAX_ARMED_REQUESTS = 100
+MAX_STACK_DEPTH = 128
+TOP_ALLOCATIONS = 10
+
+# Leaf frames of threads that are waiting rather than working (event loop select,
+# idle to_thread workers, the logging listener)
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+IDLE_FUNCTIONS = {("thread.py", "_worker")}
+
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "vpay_profile", default=None
+)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class RequestProfile:
+    """Samples, per-stage memory and timing collected for one request"""
+
+    def __init__(self, step: str, trigger: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.step = step
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self.stages: List[Dict[str, Any]] = []
+        self.memory: Dict[str, Any] = {}
+        # Highest traced memory seen at stage ends (stages reset tracemalloc's peak)
+        self.max_traced = 0
+        self.token = None
+        self._snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format: one "frame;frame;frame count" line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "step": self.step,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "stages": self.stages,
+            "peak_memory_kb": self.memory.get("peak_kb")
+        }
+
+    def to_dict(self, top_stacks: int = 50) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "interval_ms": round(PROFILE_INTERVAL_SECONDS * 1000, 2),
+            "memory": self.memory,
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(top_stacks)],
+            "collapsed_url": f"/admin/profile/{self.id}?format=collapsed"
+        }
+
+
+class Profiler:
+    """Arms profiling for upcoming requests and runs the shared sampler while any is active"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS, keep: int = PROFILE_KEEP,
+                 memory: bool = PROFILE_MEMORY):
+        self.interval = interval
+        self.memory = memory
+        self.armed = 0
+        self.completed: deque = deque(maxlen=keep)
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+        self._started_tracemalloc = False
+
+    def arm(self, requests: int) -> int:
+        """Profile the next `requests` requests (capped at MAX_ARMED_REQUESTS)"""
+        with self._lock:
+            self.armed = max(0, min(MAX_ARMED_REQUESTS, requests))
+            return self.armed
+
+    def start_request(self, step: str, header_value: Optional[str] = None) -> Optional[RequestProfile]:
+        """A profile for this request if one is armed or requested, else None"""
+        requested = PROFILING_HEADER_ENABLED and header_value not in (None, "", "0", "false")
+        if not self.armed and not requested:
+            return None
+
+        with self._lock:
+            if requested:
+                trigger = "header"
+            elif self.armed > 0:
+                self.armed -= 1
+                trigger = "armed"
+            else:
+                return None
+
+            if not self._active:
+                self._start_collectors()
+            profile = RequestProfile(step, trigger)
+            self._active.append(profile)
+        profile.token = _current_profile.set(profile)
+        return profile
+
+    def finish_request(self, profile: RequestProfile) -> Dict[str, Any]:
+        _current_profile.reset(profile.token)
+        profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+        if profile._snapshot is not None:
+            profile.memory = self._memory_report(profile)
+            profile._snapshot = None
+
+        with self._lock:
+            self._active.remove(profile)
+            if not self._active:
+                self._stop_collectors()
+            self.completed.append(profile)
+        return profile.summary()
+
+    def _memory_report(self, profile: RequestProfile) -> Dict[str, Any]:
+        _, peak = tracemalloc.get_traced_memory()
+        # Leave out the profiler's own sample storage and tracemalloc bookkeeping
+        exclude = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+        snapshot = tracemalloc.take_snapshot().filter_traces(exclude)
+        growth = snapshot.compare_to(profile._snapshot.filter_traces(exclude), "lineno")
+        return {
+            "peak_kb": round(max(peak, profile.max_traced) / 1024, 1),
+            "top_allocations": [
+                {
+                    "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count_diff": stat.count_diff
+                }
+                for stat in growth[:TOP_ALLOCATIONS]
+            ]
+        }
+
+    def _start_collectors(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        metrics.set_stage_hook(stage_hook)
+        # A fresh event per sampler, so a restart can't revive a sampler being stopped
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, args=(self._stop,), name="vpay-profiler",
+                                         daemon=True)
+        self._sampler.start()
+
+    def _stop_collectors(self):
+        metrics.set_stage_hook(None)
+        self._stop.set()
+        self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _sample_loop(self, stop: threading.Event):
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                leaf_file = os.path.basename(code.co_filename)
+                if leaf_file in IDLE_FILES or (leaf_file, code.co_name) in IDLE_FUNCTIONS:
+                    continue
+                labels = []
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    labels.append(frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(labels)))
+
+            with self._lock:
+                for profile in self._active:
+                    profile.samples += 1
+                    profile.stacks.update(stacks)
+
+    def get_profile(self, profile_id: str) -> Optional[RequestProfile]:
+        for profile in self.completed:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "armed": self.armed,
+            "active": len(self._active),
+            "header_enabled": PROFILING_HEADER_ENABLED,
+            "interval_ms": round(self.interval * 1000, 2),
+            "memory": self.memory,
+            "profiles": [profile.summary() for profile in reversed(self.completed)]
+        }
+
+
+class StageMemory:
+    """Per-stage state kept on the stage's Timer while a profile is active"""
+    __slots__ = ("profile", "traced_before")
+
+    def __init__(self, profile: RequestProfile, traced_before: int):
+        self.profile = profile
+        self.traced_before = traced_before
+
+
+def stage_hook(timer: "metrics.Timer", entering: bool):
+    """metrics.Timer callback: peak memory of each stage of a profiled request"""
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    tracing = tracemalloc.is_tracing()
+    if entering:
+        if tracing:
+            tracemalloc.reset_peak()
+        timer.profile_state = StageMemory(profile, tracemalloc.get_traced_memory()[0] if tracing else 0)
+        return
+
+    state = timer.profile_state
+    if state is None:
+        return
+    entry = {
+        "stage": f"{timer.labels.get('step')}/{timer.labels.get('stage', 'request')}",
+        "seconds": round(timer.elapsed, 4)
+    }
+    if tracing:
+        _, peak = tracemalloc.get_traced_memory()
+        # Peak above what was allocated when the stage started (concurrent stages
+        # of other requests can inflate it)
+        entry["peak_memory_kb"] = round(max(0, peak - state.traced_before) / 1024, 1)
+        state.profile.max_traced = max(state.profile.max_traced, peak)
+    state.profile.stages.append(entry)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
@@ -1,22 +1,227 @@
 #stripe_service.py
 
 import os
+import asyncio
+import functools
+import types
+import httpx
 import stripe
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
+from utils.offline_services import OFFLINE_MODE, FakeStripeClient
+from utils.structured_logging import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 stripe.api_key = os.getenv("STRIPE_SECRET_API_KEY")
 
-def create_payment_intent(amount: int, currency="usd"):
+# Shared connection pool for async Stripe calls
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", "20"))
+STRIPE_MAX_KEEPALIVE = int(os.getenv("STRIPE_MAX_KEEPALIVE", "10"))
+STRIPE_KEEPALIVE_SECONDS = float(os.getenv("STRIPE_KEEPALIVE_SECONDS", "60"))
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+STRIPE_TIMEOUT_SECONDS = float(os.getenv("STRIPE_TIMEOUT_SECONDS", "15"))
+# Network errors, 409 lock conflicts and 5xx that Stripe marks retryable are retried with
+# backoff; the SDK adds an idempotency key to POSTs so a retried charge isn't duplicated
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+
+# PaymentIntent status -> result status the payment pipeline acts on
+INTENT_STATUSES = {
+    "succeeded": "success",
+    "processing": "pending",
+    "requires_capture": "pending",
+    "requires_action": "requires_action",
+    "requires_payment_method": "declined",
+    "requires_confirmation": "error",
+    "canceled": "declined"
+}
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """stripe.HTTPXClient whose async httpx client keeps a bounded keep-alive pool"""
+
+    def __init__(self, **kwargs):
+        timeout = httpx.Timeout(STRIPE_TIMEOUT_SECONDS, connect=STRIPE_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=STRIPE_MAX_CONNECTIONS,
+            max_keepalive_connections=STRIPE_MAX_KEEPALIVE,
+            keepalive_expiry=STRIPE_KEEPALIVE_SECONDS
+        )
+        # The SDK builds its clients from the httpx module it is given, so hand it one whose
+        # AsyncClient carries the pool limits. The SDK still picks verify (CA bundle or
+        # verify_ssl_certs=False) and no extra client is created and left open.
+        pooled_httpx = types.SimpleNamespace(
+            AsyncClient=functools.partial(httpx.AsyncClient, limits=limits),
+            Client=functools.partial(httpx.Client, limits=limits)
+        )
+        super().__init__(timeout=timeout, _lib=pooled_httpx, **kwargs)
+
+
+_stripe_client: Optional[stripe.StripeClient] = None
+_http_client: Optional[PooledHTTPXClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_stripe_client() -> stripe.StripeClient:
+    """
+    Shared async Stripe client for the running event loop
+
+    Connections stay open between charges, so only the first payment pays for the
+    TLS handshake. A new client is made if the loop changes (httpx pools are bound
+    to the loop that opened them).
+    """
+    global _stripe_client, _http_client, _client_loop
+    if OFFLINE_MODE:
+        # In-process fake with injected latency/errors (VPAY_OFFLINE=1)
+        return FakeStripeClient()
+    loop = asyncio.get_running_loop()
+    if _stripe_client is None or _client_loop is not loop:
+        if _http_client is not None:
+            _close_stale_pool(_http_client, _client_loop)
+        _http_client = PooledHTTPXClient()
+        _stripe_client = stripe.StripeClient(
+            stripe.api_key,
+            http_client=_http_client,
+            max_network_retries=STRIPE_MAX_RETRIES
+        )
+        _client_loop = loop
+    return _stripe_client
+
+
+def _close_stale_pool(http_client: PooledHTTPXClient, loop: Optional[asyncio.AbstractEventLoop]):
+    """Close a pool left behind by a previous event loop instead of leaking its sockets"""
+    try:
+        if loop is not None and loop.is_running():
+            # Still serving in another thread: close it on the loop that owns it
+            asyncio.run_coroutine_threadsafe(http_client.close_async(), loop)
+        else:
+            task = asyncio.get_running_loop().create_task(http_client.close_async())
+            task.add_done_callback(_log_close_error)
+    except Exception as e:
+        logger.warning(f"Could not close previous Stripe connection pool: {e}")
+
+
+def _log_close_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not close previous Stripe connection pool: {task.exception()}")
+
+
+async def close_stripe_client():
+    """Close the shared connection pool (call on shutdown)"""
+    global _stripe_client, _http_client, _client_loop
+    if _http_client is not None:
+        await _http_client.close_async()
+    _stripe_client = _http_client = _client_loop = None
+
+
+def payment_intent_params(amount: int, currency: str, description: Optional[str] = None,
+                          metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    params = {
+        "amount": amount,
+        "currency": currency,
+        "payment_method": "pm_card_visa",  # Stripe test payment method
+        "confirm": True,  # Automatically confirm
+        "automatic_payment_methods": {"enabled": True, "allow_redirects": "never"},  # prevents redirect errors
+    }
+    if description:
+        params["description"] = description
+    if metadata:
+        params["metadata"] = metadata
+    return params
+
+
+def intent_result(intent) -> Dict[str, Any]:
+    """Structured result for a PaymentIntent"""
+    status = INTENT_STATUSES.get(intent.status, "error")
+    result = {
+        "status": status,
+        "payment_intent_id": intent.id,
+        "stripe_status": intent.status,
+        "amount": intent.amount,
+        "currency": intent.currency
+    }
+    if status != "success":
+        error = getattr(intent, "last_payment_error", None)
+        result["reason"] = getattr(error, "message", None) or f"PaymentIntent is {intent.status}"
+    return result
+
+
+def error_result(error: Exception) -> Dict[str, Any]:
+    """Structured result for a failed Stripe call"""
+    if isinstance(error, stripe.CardError):
+        status, retryable = "declined", False
+    elif isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+        status, retryable = "error", True
+    else:
+        status, retryable = "error", False
+
+    result = {
+        "status": status,
+        "reason": getattr(error, "user_message", None) or str(error) or type(error).__name__,
+        "error_type": type(error).__name__,
+        "retryable": retryable
+    }
+    code = getattr(error, "code", None)
+    if code:
+        result["error_code"] = code
+    request_id = getattr(error, "request_id", None)
+    if request_id:
+        result["stripe_request_id"] = request_id
+    return result
+
+
+async def create_payment_intent_async(amount: int, currency: str = "usd", description: Optional[str] = None,
+                                      metadata: Optional[Dict[str, str]] = None,
+                                      idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create and confirm a PaymentIntent without blocking the event loop
+
+    Args:
+        amount: Amount in the currency's smallest unit (cents)
+        currency: ISO currency code
+        description: Optional description shown in the Stripe dashboard
+        metadata: Optional string key/value pairs stored on the intent
+        idempotency_key: Stripe Idempotency-Key; repeats with the same key return the
+                         original intent instead of charging again
+
+    Returns:
+        {"status": "success", "payment_intent_id", "stripe_status", "amount", "currency"} on success;
+        otherwise status is "pending", "requires_action", "declined" or "error" with a "reason"
+    """
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency=currency,
-            payment_method="pm_card_visa",  # Stripe test payment method
-            confirm=True,  # Automatically confirm
-            automatic_payment_methods={"enabled": True, "allow_redirects": "never"},  # prevents redirect errors
+        client = get_stripe_client()
+        intent = await client.v1.payment_intents.create_async(
+            params=payment_intent_params(amount, currency, description, metadata),
+            options={"idempotency_key": idempotency_key} if idempotency_key else None
         )
-        return {"status": intent.status, "id": intent.id}
+        return intent_result(intent)
+    except stripe.StripeError as e:
+        return error_result(e)
+    except Exception as e:
+        logger.exception(f"PaymentIntent creation failed: {e}")
+        return {"status": "error", "reason": str(e), "error_type": type(e).__name__, "retryable": False}
+
+
+def create_payment_intent(amount: int, currency="usd", description: Optional[str] = None,
+                          metadata: Optional[Dict[str, str]] = None,
+                          idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    """Blocking variant of create_payment_intent_async for scripts; same result format"""
+    try:
+        if OFFLINE_MODE:
+            intent = FakeStripeClient().v1.payment_intents.create(
+                params=payment_intent_params(amount, currency, description, metadata),
+                options={"idempotency_key": idempotency_key} if idempotency_key else None
+            )
+        else:
+            intent = stripe.PaymentIntent.create(
+                max_network_retries=STRIPE_MAX_RETRIES,
+                idempotency_key=idempotency_key,
+                **payment_intent_params(amount, currency, description, metadata)
+            )
+        return intent_result(intent)
+    except stripe.StripeError as e:
+        return error_result(e)
     except Exception as e:
-        return f"PaymentIntent creation failed: {e}"
+        return {"status": "error", "reason": str(e), "error_type": type(e).__name__, "retryable": False}
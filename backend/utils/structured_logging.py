@@ -0,0 +1,218 @@
+"""
+Structured, non-blocking logging for the request path
+
+Callers only build a LogRecord and put it on a bounded in-memory queue; a
+background listener thread formats it (JSON lines by default), redacts secrets
+and writes it to stdout. A full queue drops the record and counts it instead of
+blocking the request. Disabled levels cost a single cached level check, so debug
+calls on the hot path are nearly free unless VPAY_LOG_LEVEL=DEBUG.
+
+    logger = get_logger(__name__)
+    logger.info("Payment queued", extra={"payment_id": key, "amount": amount})
+    logger.debug("Checking user", extra={"user_id": user_id, "sample": "pin_check"})
+
+Records with a "sample" key are kept one in VPAY_LOG_DEBUG_SAMPLE per key, for
+per-row messages. Fields named like secrets (REDACTED_FIELDS) and PIN-like digit
+sequences or API keys in messages are replaced with "[REDACTED]".
+
+Env: VPAY_LOG_LEVEL (INFO), VPAY_LOG_FORMAT (json|text), VPAY_LOG_QUEUE_SIZE (10000),
+VPAY_LOG_DEBUG_SAMPLE (100)
+"""
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+LOG_LEVEL = os.getenv("VPAY_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("VPAY_LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("VPAY_LOG_QUEUE_SIZE", "10000"))
+DEBUG_SAMPLE_EVERY = max(1, int(os.getenv("VPAY_LOG_DEBUG_SAMPLE", "100")))
+
+ROOT_LOGGER = "vpay"
+REDACTED = "[REDACTED]"
+REDACTED_FIELDS = {
+    "pin", "secret_numbers", "stored_numbers", "extracted_numbers", "numbers", "digits",
+    "api_key", "secret_key", "authorization", "password", "token", "card_number"
+}
+
+# Spoken PINs as the pipeline prints them ("[1, 2, 3, 4, 5]" or a bare 5-digit run,
+# but not parts of dates, times or decimals), and Stripe/Google API keys
+SECRET_PATTERNS = [
+    re.compile(r"\[\s*\d\s*(?:,\s*\d\s*){3,}\]"),
+    re.compile(r"(?<![\w.:\-])\d{5}(?![\w.:\-])"),
+    re.compile(r"\b(?:sk|rk|pk)_(?:live|test)_[A-Za-z0-9]+"),
+    re.compile(r"\bAIza[0-9A-Za-z_\-]{20,}")
+]
+
+# LogRecord attributes that are not user fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_configure_lock = threading.Lock()
+_traceback_formatter = logging.Formatter()
+
+
+def redact_text(text: str) -> str:
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(REDACTED, text)
+    return text
+
+
+def redact_value(key: str, value: Any) -> Any:
+    if key.lower() in REDACTED_FIELDS:
+        return REDACTED
+    if isinstance(value, str):
+        return redact_text(value)
+    if isinstance(value, dict):
+        return {k: redact_value(str(k), v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # A PIN is a list of digits, which would slip past the string patterns
+        if value and all(isinstance(item, int) and 0 <= item <= 9 for item in value) \
+                and redact_text(str(list(value))) != str(list(value)):
+            return REDACTED
+        return [redact_value(key, item) for item in value]
+    return value
+
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """The `extra` fields of a record, redacted"""
+    return {
+        key: redact_value(key, value)
+        for key, value in record.__dict__.items()
+        if key not in _RECORD_ATTRIBUTES and not key.startswith("_")
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact_text(record.getMessage())
+        }
+        entry.update(record_fields(record))
+        if record.exc_text:
+            entry["exception"] = redact_text(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable line with key=value fields, for local development"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{record.levelname:<7} {record.name}: {redact_text(record.getMessage())}"
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + redact_text(record.exc_text)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in `every` records per "sample" key; records without one always pass"""
+
+    def __init__(self, every: int = DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self.counts: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        # Unlocked increment: a lost update under contention only shifts the sample
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % self.every == 0:
+            record.sampled_one_in = self.every
+            return True
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback here (both may change after the call
+        # returns) but leave formatting and redaction to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None) -> logging.Logger:
+    """Install the queue handler on the "vpay" logger (idempotent)"""
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER)
+    with _configure_lock:
+        if _listener is not None:
+            return root
+
+        formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(SamplingFilter())
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+        root.handlers[:] = [_queue_handler]
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.propagate = False
+    return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            logging.getLogger(ROOT_LOGGER).handlers[:] = []
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under "vpay" (e.g. get_logger(__name__) -> vpay.main), configuring on first use"""
+    if _listener is None:
+        configure_logging()
+    if name == ROOT_LOGGER or name.startswith(ROOT_LOGGER + "."):
+        return logging.getLogger(name)
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER).level),
+        "format": LOG_FORMAT,
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0
+    }
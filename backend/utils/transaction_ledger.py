@@ -0,0 +1,165 @@
+import sqlite3
+import heapq
+from typing import Dict, Any, Optional, List
+
+from utils.payment_idempotency import PAYMENTS_DB_PATH
+from utils.pagination import encode_cursor, decode_cursor, clamp_page_size, DEFAULT_PAGE_SIZE
+
+LEDGER_COLUMNS = "id, created_at, payer, recipient, amount, currency, status, payment_intent_id, idempotency_key, session_id"
+
+
+class TransactionLedger:
+    """
+    Append-only record of payment outcomes
+
+    One row per idempotency key (recording a replayed result is a no-op); triggers
+    reject updates and deletes. created_at has millisecond resolution, and every
+    history query is an index range scan on (payer|recipient, created_at, id) with
+    keyset pagination, so its cost depends on the page size, not the table size.
+    """
+
+    def __init__(self, db_path: str = PAYMENTS_DB_PATH):
+        self.db_path = db_path
+        self.init_database()
+
+    def init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS transaction_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    payer TEXT NOT NULL,
+                    recipient TEXT COLLATE NOCASE,
+                    amount INTEGER NOT NULL,    -- smallest currency unit (cents)
+                    currency TEXT NOT NULL,
+                    status TEXT NOT NULL,       -- success / pending / requires_action / declined
+                    payment_intent_id TEXT,
+                    idempotency_key TEXT UNIQUE,
+                    session_id TEXT
+                )
+            ''')
+            # The rowid is implicitly the last column of each index, so these also
+            # serve the (created_at, id) keyset order
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_payer_time ON transaction_ledger(payer, created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_recipient_time ON transaction_ledger(recipient, created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_time ON transaction_ledger(created_at)')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON transaction_ledger
+                BEGIN SELECT RAISE(ABORT, 'transaction_ledger is append-only'); END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON transaction_ledger
+                BEGIN SELECT RAISE(ABORT, 'transaction_ledger is append-only'); END
+            ''')
+            conn.commit()
+
+    def record(self, idempotency_key: Optional[str], details: Dict[str, Any], result: Dict[str, Any]) -> bool:
+        """
+        Append a payment outcome
+
+        Args:
+            idempotency_key: Key of the charge; a second record for the same key is ignored
+            details: payer, recipient, amount, currency, session_id
+            result: Payment result (status, payment_intent_id)
+
+        Returns:
+            True if a row was appended
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO transaction_ledger
+                    (payer, recipient, amount, currency, status, payment_intent_id, idempotency_key, session_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (details["payer"], details.get("recipient"), details["amount"], details.get("currency", "usd"),
+                  result.get("status", "success"), result.get("payment_intent_id"), idempotency_key,
+                  details.get("session_id")))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def _page_query(self, conn: sqlite3.Connection, filters: Dict[str, str], after, limit: int) -> List[tuple]:
+        conditions, params = [], []
+        for column, value in filters.items():
+            conditions.append(f"{column} = ?")
+            params.append(value)
+        if after is not None:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return conn.execute(f'''
+            SELECT {LEDGER_COLUMNS} FROM transaction_ledger
+            {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (*params, limit)).fetchall()
+
+    def list_page(self, payer: Optional[str] = None, recipient: Optional[str] = None, user: Optional[str] = None,
+                  limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of transactions, newest first, using keyset pagination on (created_at, id)
+
+        Args:
+            payer: Only transactions paid by this user
+            recipient: Only transactions to this recipient (case-insensitive)
+            user: Transactions where this name is the payer or the recipient
+            limit: Maximum number of transactions on the page
+            cursor: next_cursor from the previous page, or None for the first page
+
+        Returns:
+            Dictionary with the transactions on the page and next_cursor (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = clamp_page_size(limit)
+        after = decode_cursor(cursor)
+
+        with sqlite3.connect(self.db_path) as conn:
+            if user is not None:
+                # Two index range scans merged by (created_at, id); a row where the user
+                # paid themselves appears in both
+                paid = self._page_query(conn, {"payer": user}, after, limit + 1)
+                received = self._page_query(conn, {"recipient": user}, after, limit + 1)
+                merged = heapq.merge(paid, received, key=lambda row: (row[1], row[0]), reverse=True)
+                rows, seen = [], set()
+                for row in merged:
+                    if row[0] not in seen:
+                        seen.add(row[0])
+                        rows.append(row)
+                    if len(rows) > limit:
+                        break
+            else:
+                filters = {column: value for column, value in (("payer", payer), ("recipient", recipient))
+                           if value is not None}
+                rows = self._page_query(conn, filters, after, limit + 1)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None
+
+        return {
+            "transactions": [
+                {
+                    "id": row[0],
+                    "created_at": row[1],
+                    "payer": row[2],
+                    "recipient": row[3],
+                    "amount": row[4],
+                    "currency": row[5],
+                    "status": row[6],
+                    "payment_intent_id": row[7]
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor
+        }
+
+
+_ledger: Optional[TransactionLedger] = None
+
+
+def get_transaction_ledger() -> TransactionLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = TransactionLedger()
+    return _ledger
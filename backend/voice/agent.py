@@ -1,7 +1,7 @@
 import sys
 import os
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable
 import sqlite3
 import json
 import numpy as np
@@ -11,8 +11,19 @@ backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
 from google.adk.agents import Agent
-from tools.voice_to_embedded import get_audio_hash, generate_100d_voice_embedding
+from tools.voice_to_embedded import get_audio_hash, generate_voice_embedding, ProbeEmbeddings, embedding_length_valid
 from tools.voice_to_number import AudioProcessor
+from tools.embedding_snapshot import EmbeddingSnapshot
+from tools.enrollment_archive import archive_enrollment_audio
+from utils.lazy_loader import lazy_component
+from tools.voice_auth_database import list_users_page, iter_users
+from utils.pagination import DEFAULT_PAGE_SIZE
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Minimum cosine similarity to accept a voice; pick it with tools/verification_eval.py
+SIMILARITY_THRESHOLD = float(os.getenv("VOICE_SIMILARITY_THRESHOLD", "0.85"))
 
 # Embedded database class
 
@@ -40,13 +51,14 @@ class VoiceAuthDatabase:
                 )
             ''')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON voice_auth(user_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_id ON voice_auth(created_at, id)')
             conn.commit()
     
     def store_voice_data(self, user_id: str, voice_embedding: List[float], 
                         secret_numbers: List[int], embedding_method: str = "audio_features",
                         file_hash: str = None) -> bool:
         try:
-            if len(voice_embedding) != 100 or len(secret_numbers) != 5:
+            if not embedding_length_valid(voice_embedding, embedding_method) or len(secret_numbers) != 5:
                 return False
             
             embedding_json = json.dumps(voice_embedding)
@@ -62,33 +74,44 @@ class VoiceAuthDatabase:
                 conn.commit()
                 return True
         except Exception as e:
-            print(f"Database error: {e}")
+            logger.error(f"Database error: {e}")
             return False
     
     def authenticate_user(self, voice_embedding: List[float], secret_numbers: List[int], 
-                         similarity_threshold: float = 0.85) -> Tuple[Optional[str], float]:
+                         similarity_threshold: float = 0.85,
+                         probe_for_method: Optional[Callable[[str], Optional[List[float]]]] = None
+                         ) -> Tuple[Optional[str], float]:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT user_id, voice_embedding, secret_numbers 
+                    SELECT user_id, voice_embedding, secret_numbers, embedding_method 
                     FROM voice_auth WHERE is_active = 1
                 ''')
                 
                 rows = cursor.fetchall()
                 best_match = None
                 best_similarity = 0.0
-                input_embedding = np.array(voice_embedding)
                 
                 for row in rows:
-                    user_id, stored_embedding_json, stored_numbers_json = row
-                    stored_embedding = np.array(json.loads(stored_embedding_json))
+                    user_id, stored_embedding_json, stored_numbers_json, embedding_method = row
                     stored_numbers = json.loads(stored_numbers_json)
                     
                     # Check if secret numbers match exactly
                     if stored_numbers != secret_numbers:
                         continue
                     
+                    stored_embedding = np.array(json.loads(stored_embedding_json))
+                    
+                    # Compare against a probe in the row's embedding method when available
+                    probe = probe_for_method(embedding_method) if probe_for_method else None
+                    if probe_for_method and probe is None:
+                        # No extractor for the row's method: the probe isn't comparable, fail closed
+                        logger.warning("No probe for stored embedding method", extra={"user_id": user_id,
+                                                                                   "embedding_method": embedding_method})
+                        continue
+                    input_embedding = np.array(probe if probe is not None else voice_embedding)
+                    
                     # Calculate cosine similarity
                     similarity = self.cosine_similarity(input_embedding, stored_embedding)
                     
@@ -99,7 +122,7 @@ class VoiceAuthDatabase:
                 return best_match, best_similarity
                 
         except Exception as e:
-            print(f"Authentication error: {e}")
+            logger.error(f"Authentication error: {e}")
             return None, 0.0
     
     def cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
@@ -132,9 +155,26 @@ class VoiceAuthDatabase:
                     for row in rows
                 ]
         except Exception as e:
-            print(f"List users error: {e}")
+            logger.error(f"List users error: {e}")
             return []
     
+    def list_users_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                        include_secret_numbers: bool = False) -> Dict:
+        """Get one page of users, newest first, keyset-paginated on (created_at, id)"""
+        return list_users_page(self.db_path, limit, cursor, include_secret_numbers)
+    
+    def iter_users(self, batch_size: int = 500, include_secret_numbers: bool = False):
+        """Yield every user page by page, holding at most one page in memory"""
+        return iter_users(self.db_path, batch_size, include_secret_numbers)
+    
+    def count_users(self) -> Dict[str, int]:
+        """Count total and active users without loading any rows"""
+        with sqlite3.connect(self.db_path) as conn:
+            total, active = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(is_active = 1), 0) FROM voice_auth'
+            ).fetchone()
+        return {'total': total, 'active': active}
+    
     def deactivate_user(self, user_id: str) -> bool:
         """Deactivate a user (soft delete)"""
         try:
@@ -148,14 +188,14 @@ class VoiceAuthDatabase:
                 
                 if cursor.rowcount > 0:
                     conn.commit()
-                    print(f"User {user_id} deactivated")
+                    logger.info(f"User {user_id} deactivated")
                     return True
                 else:
-                    print(f"User {user_id} not found or already inactive")
+                    logger.info(f"User {user_id} not found or already inactive")
                     return False
                     
         except Exception as e:
-            print(f"Deactivate user error: {e}")
+            logger.error(f"Deactivate user error: {e}")
             return False
     
     def permanently_delete_user(self, user_id: str) -> bool:
@@ -167,14 +207,14 @@ class VoiceAuthDatabase:
                 
                 if cursor.rowcount > 0:
                     conn.commit()
-                    print(f"User {user_id} permanently deleted")
+                    logger.info(f"User {user_id} permanently deleted")
                     return True
                 else:
-                    print(f"User {user_id} not found")
+                    logger.info(f"User {user_id} not found")
                     return False
                     
         except Exception as e:
-            print(f"Delete user error: {e}")
+            logger.error(f"Delete user error: {e}")
             return False
     
     def reactivate_user(self, user_id: str) -> bool:
@@ -190,14 +230,14 @@ class VoiceAuthDatabase:
                 
                 if cursor.rowcount > 0:
                     conn.commit()
-                    print(f"User {user_id} reactivated")
+                    logger.info(f"User {user_id} reactivated")
                     return True
                 else:
-                    print(f"User {user_id} not found or already active")
+                    logger.info(f"User {user_id} not found or already active")
                     return False
                     
         except Exception as e:
-            print(f"Reactivate user error: {e}")
+            logger.error(f"Reactivate user error: {e}")
             return False
     
     def get_user_details(self, user_id: str) -> Optional[Dict]:
@@ -224,12 +264,22 @@ class VoiceAuthDatabase:
                     return None
                     
         except Exception as e:
-            print(f"Get user details error: {e}")
+            logger.error(f"Get user details error: {e}")
             return None
 
 # Global database instance
 db = VoiceAuthDatabase()
-audio_processor = AudioProcessor()
+embedding_snapshot = EmbeddingSnapshot(db.db_path)
+
+# Vertex AI client is created on first use, so importing this module needs no credentials
+audio_processor_component = lazy_component("audio_processor", AudioProcessor)
+
+def get_audio_processor() -> AudioProcessor:
+    """Return the shared AudioProcessor, creating it on first use"""
+    processor = audio_processor_component.get()
+    if processor is None:
+        raise RuntimeError(f"Audio processor unavailable: {audio_processor_component.error}")
+    return processor
 
 def process_voice_authentication(audio_file_path: str) -> Dict[str, Any]:
     """Authenticate a user by voice"""
@@ -247,7 +297,7 @@ def process_voice_authentication(audio_file_path: str) -> Dict[str, Any]:
                 }
         
         # Generate voice embedding
-        embedding_result = generate_100d_voice_embedding(audio_file_path)
+        embedding_result = generate_voice_embedding(audio_file_path)
         if not embedding_result.get("voice_embedding"):
             return {
                 "success": False,
@@ -256,7 +306,7 @@ def process_voice_authentication(audio_file_path: str) -> Dict[str, Any]:
             }
         
         # Extract secret numbers
-        numbers_result = audio_processor.process_json_output(audio_file_path)
+        numbers_result = get_audio_processor().process_json_output(audio_file_path)
         if not numbers_result.get("numbers") or len(numbers_result["numbers"]) != 5:
             return {
                 "success": False,
@@ -264,12 +314,25 @@ def process_voice_authentication(audio_file_path: str) -> Dict[str, Any]:
                 "error": f"Failed to extract 5 secret numbers. Got: {numbers_result.get('numbers', [])}"
             }
         
-        # Authenticate against database
-        authenticated_user_id, similarity_score = db.authenticate_user(
-            voice_embedding=embedding_result["voice_embedding"],
-            secret_numbers=numbers_result["numbers"],
-            similarity_threshold=0.85
-        )
+        # Rows not yet re-embedded after a method upgrade are scored with a probe in their method
+        probes = ProbeEmbeddings(audio_file_path, embedding_result)
+        
+        # Authenticate against the shared memory-mapped snapshot, falling back to the database
+        try:
+            authenticated_user_id, similarity_score = embedding_snapshot.authenticate_user(
+                voice_embedding=embedding_result["voice_embedding"],
+                secret_numbers=numbers_result["numbers"],
+                similarity_threshold=SIMILARITY_THRESHOLD,
+                probe_for_method=probes.for_method
+            )
+        except Exception as snapshot_error:
+            logger.warning(f"Snapshot lookup failed, using database: {snapshot_error}")
+            authenticated_user_id, similarity_score = db.authenticate_user(
+                voice_embedding=embedding_result["voice_embedding"],
+                secret_numbers=numbers_result["numbers"],
+                similarity_threshold=SIMILARITY_THRESHOLD,
+                probe_for_method=probes.for_method
+            )
         
         if authenticated_user_id:
             return {
@@ -313,7 +376,7 @@ def register_new_user(user_card_id: str, audio_file_path: str) -> Dict[str, Any]
             }
         
         # Generate voice embedding
-        embedding_result = generate_100d_voice_embedding(audio_file_path)
+        embedding_result = generate_voice_embedding(audio_file_path)
         if not embedding_result.get("voice_embedding"):
             return {
                 "success": False,
@@ -322,7 +385,7 @@ def register_new_user(user_card_id: str, audio_file_path: str) -> Dict[str, Any]
             }
         
         # Extract secret numbers
-        numbers_result = audio_processor.process_json_output(audio_file_path)
+        numbers_result = get_audio_processor().process_json_output(audio_file_path)
         if not numbers_result.get("numbers") or len(numbers_result["numbers"]) != 5:
             return {
                 "success": False,
@@ -333,6 +396,9 @@ def register_new_user(user_card_id: str, audio_file_path: str) -> Dict[str, Any]
         # Get file hash
         file_hash = get_audio_hash(audio_file_path)
         
+        # Keep the recording so the embedding can be re-derived after method upgrades
+        archive_enrollment_audio(audio_file_path, file_hash)
+        
         # Store in database
         success = db.store_voice_data(
             user_id=user_card_id,
@@ -343,6 +409,7 @@ def register_new_user(user_card_id: str, audio_file_path: str) -> Dict[str, Any]
         )
         
         if success:
+            embedding_snapshot.refresher.request_export()
             return {
                 "success": True,
                 "message": f"User {user_card_id} registered successfully",
@@ -364,15 +431,35 @@ def register_new_user(user_card_id: str, audio_file_path: str) -> Dict[str, Any]
             "user_id": user_card_id
         }
 
-def get_all_registered_users() -> Dict[str, Any]:
-    """Get list of all registered users"""
+def get_all_registered_users(cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+    """
+    Get one page of registered users
+    
+    Args:
+        cursor: next_cursor from the previous call, or None for the first page
+        limit: Maximum number of users to return
+        
+    Returns:
+        Users on the page, next_cursor (None on the last page) and, on the first
+        page, total_count
+    """
     try:
-        users = db.list_all_users()
-        return {
+        page = db.list_users_page(limit=limit, cursor=cursor)
+        if page.get("error"):
+            return {
+                "success": False,
+                "error": f"Error listing users: {page['error']}",
+                "users": []
+            }
+        result = {
             "success": True,
-            "users": users,
-            "total_count": len(users)
+            "users": page["users"],
+            "next_cursor": page["next_cursor"]
         }
+        if cursor is None:
+            # Counted once per listing, not on every page
+            result["total_count"] = db.count_users()["total"]
+        return result
     except Exception as e:
         return {
             "success": False,
@@ -383,18 +470,18 @@ def get_all_registered_users() -> Dict[str, Any]:
 def get_system_statistics() -> Dict[str, Any]:
     """Get system statistics"""
     try:
-        users = db.list_all_users()
-        active_users = len([u for u in users if u['is_active']])
+        counts = db.count_users()
         db_size = os.path.getsize(db.db_path) if os.path.exists(db.db_path) else 0
         
         return {
             "success": True,
-            "total_users": len(users),
-            "active_users": active_users,
-            "inactive_users": len(users) - active_users,
+            "total_users": counts["total"],
+            "active_users": counts["active"],
+            "inactive_users": counts["total"] - counts["active"],
             "database_size_mb": round(db_size / (1024 * 1024), 2),
             "database_path": os.path.abspath(db.db_path),
-            "similarity_threshold": 0.85
+            "similarity_threshold": SIMILARITY_THRESHOLD,
+            "embedding_snapshot": embedding_snapshot.get_stats()
         }
     except Exception as e:
         return {
@@ -427,6 +514,7 @@ def remove_user(user_id: str, permanent: bool = False) -> Dict[str, Any]:
             # Permanent deletion
             success = db.permanently_delete_user(user_id)
             if success:
+                embedding_snapshot.refresher.request_export()
                 return {
                     "success": True,
                     "message": f"User {user_id} permanently deleted from database",
@@ -452,6 +540,7 @@ def remove_user(user_id: str, permanent: bool = False) -> Dict[str, Any]:
             
             success = db.deactivate_user(user_id)
             if success:
+                embedding_snapshot.refresher.request_export()
                 return {
                     "success": True,
                     "message": f"User {user_id} deactivated (can be reactivated later)",
@@ -503,6 +592,7 @@ def reactivate_user(user_id: str) -> Dict[str, Any]:
         
         success = db.reactivate_user(user_id)
         if success:
+            embedding_snapshot.refresher.request_export()
             return {
                 "success": True,
                 "message": f"User {user_id} reactivated successfully",
@@ -584,7 +674,8 @@ root_agent = Agent(
     
     5. **get_user_details(user_id)** - Get detailed info about a specific user
     
-    6. **get_all_registered_users()** - List all users (active and inactive)
+    6. **get_all_registered_users(cursor=None, limit=100)** - List users (active and inactive) one page at a time
+       - Pass the returned next_cursor to get the following page
     
     7. **get_system_statistics()** - Show database stats
 
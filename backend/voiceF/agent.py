@@ -15,28 +15,23 @@ from tools.text_to_file import save_text_to_file
 def transcribe_and_return(file_path: str) -> dict:
     """Modified transcription function that returns structured data."""
     try:
-        import io
-        from contextlib import redirect_stdout, redirect_stderr
+        result = transcribe_file(file_path)
         
-        stdout_capture = io.StringIO()
-        stderr_capture = io.StringIO()
-        
-        with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-            transcribe_file(file_path)
-        
-        stdout_result = stdout_capture.getvalue()
-        stderr_result = stderr_capture.getvalue()
-        
-        if stdout_result.strip():
+        if result["success"]:
+            # Same "Transcript:/Confidence:" lines the callers parse
+            lines = []
+            for alternative in result["results"]:
+                lines.append(f"Transcript: {alternative['transcript']}")
+                lines.append(f"Confidence: {alternative['confidence']}")
             return {
                 "success": True,
-                "transcript": stdout_result.strip(),
+                "transcript": "\n".join(lines),
                 "file": file_path
             }
         else:
             return {
                 "success": False,
-                "error": stderr_result or "No speech detected",
+                "error": result.get("error") or "No speech detected",
                 "file": file_path
             }
             